@@ -0,0 +1,68 @@
+# Benchmark the cost of serialising Socontra messages with each installed JSON codec (socontra/codec.py).
+# Encodes send payloads (submit_proposal messages) and decodes message stream events (proposal messages received by a
+# consumer) with proposals of increasing numbers of products, as sent by online store suppliers.
+# Also reports the cost of the previous path: requests encoding json= with the standard library, and json.loads.
+
+# To run:
+#   python -m benchmarks.codec_benchmark --products 1 10 100 --iterations 2000
+
+import argparse
+import json
+import time
+
+import requests
+
+from socontra import codec
+from benchmarks.sse_standin_server import SSEStandin
+
+
+def create_proposal_message(number_products):
+    # A proposal message with number_products products, each with three variants.
+    standin = SSEStandin(number_events=0)
+    envelope = standin.create_message(0)
+    envelope['message']['proposal'] = {'proposal_list': [[{
+        'product_title': f'Product {product} with a reasonably long title',
+        'product_description': 'Soft cotton hoodie with a kangaroo pocket and drawstring hood. ' * 3,
+        'product_url': f'https://benchmark.myshopify.com/products/product-{product}',
+        'variants': [{'product_variant_id': f'gid://shopify/ProductVariant/{product}{variant}', 'variant_title': f'Size {variant}',
+                      'product_variant_total_price': 19.99 + variant, 'product_variant_unit_price': 19.99 + variant,
+                      'currency_code': 'USD', 'quantity_available': 100, 'image_url': f'https://cdn.shopify.com/{product}/{variant}.jpg'}
+                     for variant in range(3)]} for product in range(number_products)]]}
+    return envelope
+
+
+def time_per_call(function, iterations):
+    time_start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - time_start) / iterations
+
+
+def requests_json_encode(message):
+    # How requests encoded json= bodies before the codec was added.
+    return requests.models.complexjson.dumps(message, allow_nan=False).encode('utf-8')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the JSON codecs for Socontra messages.')
+    parser.add_argument('--products', type=int, nargs='+', default=[1, 10, 100], help='Numbers of products in the proposal.')
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    codecs = {name: codec_class() for name, codec_class in codec.available_codecs().items()}
+    print(f"Installed codecs: {', '.join(codecs)}")
+
+    for number_products in args.products:
+        envelope = create_proposal_message(number_products)
+        data = json.dumps(envelope).encode()
+        iterations = max(10, args.iterations // max(1, number_products // 10))
+        print(f'\nProposal with {number_products} products ({len(data) / 1024:.1f} KB)')
+
+        encode_time = time_per_call(lambda: requests_json_encode(envelope['message']), iterations)
+        decode_time = time_per_call(lambda: json.loads(data), iterations)
+        print(f"  {'previous path':14s} encode {encode_time * 1e6:9.1f}us   decode {decode_time * 1e6:9.1f}us   ({len(data) / decode_time / 1e6:7.1f} MB/s decode)")
+
+        for name, json_codec in codecs.items():
+            encode_time = time_per_call(lambda: json_codec.encode(envelope['message']), iterations)
+            decode_time = time_per_call(lambda: json_codec.decode_envelope(data), iterations)
+            print(f'  {name:14s} encode {encode_time * 1e6:9.1f}us   decode {decode_time * 1e6:9.1f}us   ({len(data) / decode_time / 1e6:7.1f} MB/s decode)')
@@ -0,0 +1,381 @@
+# Local stand-in for the Shopify Storefront and Admin GraphQL APIs.
+# Allows the Shopify Web Agent template (protocol_templates/online_stores/socontra_transact_shopify_protocol_supplier.py)
+# to be run, load tested and benchmarked offline, without a real Shopify shop.
+
+# Supports the operations used by the template:
+#   Storefront API (/api/<version>/graphql.json): products search, cartCreate, cartLinesRemove (including aliased, batched
+#                                                  mutations) and cart checkoutUrl.
+#   Admin API (/admin/api/<version>/graphql.json): orders query (by customer email, or by order name).
+# Opening the checkout url (GET /checkouts/<token>) simulates the human user's manual purchase, creating a paid order.
+# Orders are fulfilled after fulfillment_delay seconds.
+
+# The catalog is synthetic and seeded, so the same seed always returns the same products. The server can simulate API
+# latency (latency_ms +/- jitter_ms) and Shopify throttling (token bucket per API, HTTP 429 with a THROTTLED error when
+# the bucket is empty).
+
+# To run the server:
+#   python -m benchmarks.shopify_standin_server --port 8787 --seed 1 --products 500 --latency-ms 50 --jitter-ms 20
+# and set shop_url = 'http://127.0.0.1:8787' in config_shopify.py.
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+product_adjectives = ['Classic', 'Organic', 'Deluxe', 'Spicy', 'Vegan', 'Smoked', 'Artisan', 'Fresh', 'Family', 'Mini', 'Grilled', 'Rustic']
+product_nouns = ['Pizza', 'Meat Pie', 'Lamington', 'Pasta', 'Arrosticini', 'Pavlova', 'Burger', 'Salad', 'Focaccia', 'Sausage Roll',
+                 'Tiramisu', 'Coffee', 'Gnocchi', 'Damper', 'Risotto', 'Cannoli']
+product_types = ['Food', 'Dessert', 'Drink', 'Bakery']
+vendors = ['Socontra Kitchen', 'Outback Eats', 'Abruzzo Deli', 'Harbour Foods']
+variant_options = ['Small', 'Medium', 'Large', 'Family', 'Party']
+currency_codes = ['USD']
+
+
+class ShopifyStandin:
+    # The synthetic shop: catalog, carts and orders. Thread safe, as the server handles requests in threads.
+
+    def __init__(self, seed: int = 1, number_products: int = 500, latency_ms: float = 0, jitter_ms: float = 0,
+                 throttle_rate: float = None, throttle_burst: int = 100, fulfillment_delay: float = 5, base_url: str = 'http://127.0.0.1:8787'):
+        self.random = random.Random(seed)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fulfillment_delay = fulfillment_delay
+        self.base_url = base_url
+        self.lock = threading.Lock()
+
+        self.products = [self._create_product(index) for index in range(number_products)]
+        self.variants = {variant['id']: (product, variant) for product in self.products for variant in product['variants']}
+        self.carts = {}
+        self.checkouts = {}
+        self.orders = []
+
+        # Token buckets for throttling. throttle_rate = None means no throttling.
+        self.throttle_rate = throttle_rate
+        self.throttle_burst = throttle_burst
+        self.buckets = {'storefront': [throttle_burst, time.time()], 'admin': [throttle_burst, time.time()]}
+
+        self.stats = {'requests': 0, 'throttled': 0, 'products': 0, 'cartCreate': 0, 'cartLinesRemove': 0, 'checkoutUrl': 0, 'orders': 0}
+
+    def _create_product(self, index):
+        title = f'{self.random.choice(product_adjectives)} {self.random.choice(product_nouns)}'
+        base_price = self.random.uniform(3, 60)
+        variants = []
+        for variant_index in range(self.random.randint(1, 5)):
+            variants.append({
+                'id': f'gid://shopify/ProductVariant/{index * 10 + variant_index + 1}',
+                'title': variant_options[variant_index],
+                'quantityAvailable': self.random.randint(0, 50),
+                'availableForSale': self.random.random() > 0.1,
+                'price': {'amount': f'{base_price * (1 + 0.35 * variant_index):.2f}', 'currencyCode': self.random.choice(currency_codes)},
+                'selectedOptions': [{'name': 'Size', 'value': variant_options[variant_index]}],
+            })
+        prices = [float(variant['price']['amount']) for variant in variants]
+        return {
+            'id': f'gid://shopify/Product/{index + 1}',
+            'title': title,
+            'handle': title.lower().replace(' ', '-') + f'-{index + 1}',
+            'description': f'{title} from the stand-in shop. ' * self.random.randint(1, 6),
+            'productType': self.random.choice(product_types),
+            'vendor': self.random.choice(vendors),
+            'totalInventory': sum(variant['quantityAvailable'] for variant in variants),
+            'priceRange': {'maxVariantPrice': {'amount': f'{max(prices):.2f}', 'currencyCode': variants[0]['price']['currencyCode']},
+                           'minVariantPrice': {'amount': f'{min(prices):.2f}', 'currencyCode': variants[0]['price']['currencyCode']}},
+            'variants': variants,
+        }
+
+    # Latency and throttling.
+
+    def simulate_latency(self):
+        if self.latency_ms or self.jitter_ms:
+            delay_ms = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms))
+            time.sleep(delay_ms / 1000)
+
+    def is_throttled(self, api):
+        # Token bucket per API. Returns True if the request should be throttled.
+        if self.throttle_rate is None:
+            return False
+        with self.lock:
+            tokens, last_time = self.buckets[api]
+            now = time.time()
+            tokens = min(self.throttle_burst, tokens + (now - last_time) * self.throttle_rate)
+            if tokens < 1:
+                self.buckets[api] = [tokens, now]
+                self.stats['throttled'] += 1
+                return True
+            self.buckets[api] = [tokens - 1, now]
+            return False
+
+    # GraphQL operations. The queries are matched with regular expressions, which is sufficient for the queries the
+    # Shopify template sends.
+
+    def storefront_query(self, query):
+        if 'cartCreate(' in query:
+            return self.cart_create(query)
+        elif 'cartLinesRemove(' in query:
+            return self.cart_lines_remove(query)
+        elif 'checkoutUrl' in query:
+            return self.checkout_url(query)
+        elif 'products(' in query:
+            return self.products_search(query)
+        return {'errors': [{'message': 'Operation not supported by the Shopify stand-in server.'}]}
+
+    def admin_query(self, query):
+        if 'orders(' in query:
+            return self.orders_query(query)
+        return {'errors': [{'message': 'Operation not supported by the Shopify stand-in server.'}]}
+
+    def products_search(self, query):
+        self.stats['products'] += 1
+        first = int(re.search(r'products\(first:\s*(\d+)', query).group(1))
+        search_term = re.search(r'title:(.*?) OR', query).group(1).strip().lower()
+        search_words = [word for word in search_term.split() if word]
+
+        matches = [product for product in self.products if any(word in product['title'].lower() for word in search_words)]
+
+        edges = []
+        for product in matches[:first]:
+            node = {k: v for k, v in product.items() if k != 'variants'}
+            node['variants'] = {'edges': [{'node': variant} for variant in product['variants'][:5]]}
+            edges.append({'node': node})
+        return {'data': {'products': {'edges': edges}}}
+
+    def cart_create(self, query):
+        self.stats['cartCreate'] += 1
+        lines = re.findall(r'merchandiseId:\s*"(.*?)",\s*quantity:\s*(\d+)', query)
+        email_match = re.search(r'email:\s*"(.*?)"', query)
+        email = email_match.group(1) if email_match else None
+
+        cart_id = f'gid://shopify/Cart/{uuid.uuid4().hex}'
+        cart_lines = []
+        total = 0.0
+        currency_code = currency_codes[0]
+        for variant_id, quantity in lines:
+            if variant_id not in self.variants:
+                return {'data': {'cartCreate': {'cart': None, 'userErrors': [{'field': ['lines'], 'message': f'Variant {variant_id} not found'}]}}}
+            product, variant = self.variants[variant_id]
+            total += float(variant['price']['amount']) * int(quantity)
+            currency_code = variant['price']['currencyCode']
+            cart_lines.append({'id': f'gid://shopify/CartLine/{uuid.uuid4().hex}', 'merchandise': {'id': variant_id}, 'quantity': int(quantity)})
+
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        cart = {
+            'id': cart_id,
+            'createdAt': now,
+            'updatedAt': now,
+            'lines': cart_lines,
+            'email': email,
+            'total': total,
+            'currencyCode': currency_code,
+            'checkout_token': uuid.uuid4().hex,
+        }
+        with self.lock:
+            self.carts[cart_id] = cart
+            self.checkouts[cart['checkout_token']] = cart_id
+
+        return {'data': {'cartCreate': {'cart': self._cart_response(cart), 'userErrors': []}}}
+
+    def _cart_response(self, cart):
+        amount = {'amount': f"{cart['total']:.2f}", 'currencyCode': cart['currencyCode']}
+        return {
+            'id': cart['id'],
+            'createdAt': cart['createdAt'],
+            'updatedAt': cart['updatedAt'],
+            'lines': {'edges': [{'node': {'id': line['id'], 'merchandise': line['merchandise']}} for line in cart['lines']]},
+            'buyerIdentity': {'email': cart['email'], 'phone': None, 'deliveryAddressPreferences': [], 'preferences': None},
+            'attributes': [],
+            'cost': {'totalAmount': amount, 'subtotalAmount': amount, 'totalTaxAmount': None, 'totalDutyAmount': None},
+        }
+
+    def cart_lines_remove(self, query):
+        # Handles both a single cartLinesRemove mutation, and many aliased mutations in one request (batched cart cleanup).
+        data = {}
+        for alias, cart_id, line_ids in re.findall(r'(?:(\w+)\s*:\s*)?cartLinesRemove\(\s*cartId:\s*"(.*?)",\s*lineIds:\s*\[(.*?)\]', query, re.DOTALL):
+            self.stats['cartLinesRemove'] += 1
+            line_ids = re.findall(r'"(.*?)"', line_ids)
+            with self.lock:
+                cart = self.carts.get(cart_id)
+                if cart is None:
+                    data[alias or 'cartLinesRemove'] = {'cart': None, 'userErrors': [{'field': ['cartId'], 'message': 'The specified cart does not exist.'}]}
+                    continue
+                cart['lines'] = [line for line in cart['lines'] if line['id'] not in line_ids]
+                cart['total'] = sum(float(self.variants[line['merchandise']['id']][1]['price']['amount']) * line['quantity'] for line in cart['lines'])
+            data[alias or 'cartLinesRemove'] = {'cart': self._cart_response(cart), 'userErrors': []}
+        return {'data': data}
+
+    def checkout_url(self, query):
+        self.stats['checkoutUrl'] += 1
+        cart_id = re.search(r'cart\(id:\s*"(.*?)"\)', query).group(1)
+        cart = self.carts.get(cart_id)
+        if cart is None:
+            return {'data': {'cart': None}}
+        return {'data': {'cart': {'checkoutUrl': f"{self.base_url}/checkouts/{cart['checkout_token']}"}}}
+
+    def complete_checkout(self, checkout_token):
+        # Simulates the human user manually purchasing the items in the cart. Creates a paid order.
+        with self.lock:
+            cart_id = self.checkouts.pop(checkout_token, None)
+            if cart_id is None or cart_id not in self.carts:
+                return None
+            cart = self.carts.pop(cart_id)
+            order = {
+                'id': f'gid://shopify/Order/{len(self.orders) + 1}',
+                'name': f'#{1001 + len(self.orders)}',
+                'email': cart['email'],
+                'confirmationNumber': uuid.uuid4().hex[:9].upper(),
+                'confirmed': True,
+                'createdAt': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'created_time': time.time(),
+                'fullyPaid': True,
+                'currencyCode': cart['currencyCode'],
+                'total': cart['total'],
+                'lines': cart['lines'],
+                'cancelledAt': None,
+            }
+            self.orders.append(order)
+        return order
+
+    def orders_query(self, query):
+        self.stats['orders'] += 1
+        first = int(re.search(r'orders\(first:\s*(\d+)', query).group(1))
+        email_match = re.search(r'email:(\S+?) AND', query)
+        name_match = re.search(r"name:'(.*?)'", query)
+
+        with self.lock:
+            if name_match:
+                orders = [order for order in self.orders if order['name'] == name_match.group(1)]
+            elif email_match:
+                orders = [order for order in reversed(self.orders) if order['email'] == email_match.group(1)]
+            else:
+                orders = list(reversed(self.orders))
+
+        return {'data': {'orders': {'edges': [{'node': self._order_response(order)} for order in orders[:first]]}}}
+
+    def _order_response(self, order):
+        fulfilled = time.time() - order['created_time'] >= self.fulfillment_delay
+        money = {'amount': f"{order['total']:.2f}", 'currencyCode': order['currencyCode']}
+        return {
+            'id': order['id'],
+            'name': order['name'],
+            'email': order['email'],
+            'confirmationNumber': order['confirmationNumber'],
+            'confirmed': order['confirmed'],
+            'createdAt': order['createdAt'],
+            'processedAt': order['createdAt'],
+            'fullyPaid': order['fullyPaid'],
+            'currencyCode': order['currencyCode'],
+            'statusPageUrl': f"{self.base_url}/orders/{order['confirmationNumber']}",
+            'cancelledAt': order['cancelledAt'],
+            'displayFulfillmentStatus': 'FULFILLED' if fulfilled else 'UNFULFILLED',
+            'lineItems': {'edges': [{'node': {'id': line['id'], 'name': self.variants[line['merchandise']['id']][0]['title'],
+                                              'quantity': line['quantity'], 'title': self.variants[line['merchandise']['id']][0]['title'],
+                                              'variant': {'id': line['merchandise']['id']}, 'vendor': self.variants[line['merchandise']['id']][0]['vendor']}}
+                                    for line in order['lines']]},
+            'currentTotalPriceSet': {'presentmentMoney': money, 'shopMoney': money},
+            'currentTotalTaxSet': {'presentmentMoney': money, 'shopMoney': money},
+        }
+
+
+def create_request_handler(shop: ShopifyStandin):
+    # Create the HTTP request handler class for the stand-in shop.
+
+    class ShopifyStandinRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            shop.stats['requests'] += 1
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            if re.match(r'^/admin/api/[^/]+/graphql\.json$', self.path):
+                api = 'admin'
+            elif re.match(r'^/api/[^/]+/graphql\.json$', self.path):
+                api = 'storefront'
+            else:
+                return self.send_json(404, {'errors': 'Not Found'})
+
+            shop.simulate_latency()
+
+            if shop.is_throttled(api):
+                return self.send_json(429, {'errors': [{'message': 'Throttled', 'extensions': {'code': 'THROTTLED'}}]}, {'Retry-After': '1'})
+
+            try:
+                query = json.loads(body)['query']
+            except (ValueError, KeyError):
+                return self.send_json(400, {'errors': [{'message': 'Invalid request body. Expected {"query": ...}'}]})
+
+            result = shop.admin_query(query) if api == 'admin' else shop.storefront_query(query)
+            self.send_json(200, result)
+
+        def do_GET(self):
+            # Opening the checkout url simulates the manual purchase of the cart.
+            checkout_match = re.match(r'^/checkouts/(\w+)$', self.path)
+            if not checkout_match:
+                return self.send_json(404, {'errors': 'Not Found'})
+            order = shop.complete_checkout(checkout_match.group(1))
+            if order is None:
+                return self.send_json(404, {'errors': 'Checkout not found'})
+            self.send_json(200, {'order': order['name']})
+
+        def send_json(self, status_code, content, extra_headers=None):
+            body = json.dumps(content).encode()
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for k, v in (extra_headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Don't print each request - too noisy when load testing.
+            pass
+
+    return ShopifyStandinRequestHandler
+
+
+class StandinHTTPServer(ThreadingHTTPServer):
+    # Larger listen backlog than the default (5), so bursts of concurrent consumers are not delayed by connection retries.
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def start_standin_server(host: str = '127.0.0.1', port: int = 8787, **shop_options):
+    # Start the stand-in server in a background thread. Returns (server, shop). Use port 0 to pick a free port.
+    # Call server.shutdown() to stop it.
+    shop = ShopifyStandin(**shop_options)
+    server = StandinHTTPServer((host, port), create_request_handler(shop))
+    shop.base_url = f'http://{host}:{server.server_address[1]}'
+
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    return server, shop
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the Shopify Storefront and Admin GraphQL APIs.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the synthetic catalog.')
+    parser.add_argument('--products', type=int, default=500, help='Number of products in the catalog.')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Simulated API latency in milliseconds.')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Random +/- variation on the simulated latency.')
+    parser.add_argument('--throttle-rate', type=float, default=None, help='Requests per second per API before throttling. Default no throttling.')
+    parser.add_argument('--throttle-burst', type=int, default=100, help='Burst size (bucket capacity) for throttling.')
+    parser.add_argument('--fulfillment-delay', type=float, default=5, help='Seconds after purchase before an order is fulfilled.')
+    args = parser.parse_args()
+
+    server, shop = start_standin_server(args.host, args.port, seed=args.seed, number_products=args.products, latency_ms=args.latency_ms,
+                                        jitter_ms=args.jitter_ms, throttle_rate=args.throttle_rate, throttle_burst=args.throttle_burst,
+                                        fulfillment_delay=args.fulfillment_delay)
+    print(f'Shopify stand-in server running at {shop.base_url} with {len(shop.products)} products. Press Ctrl+C to stop.')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,191 @@
+# Benchmark how many concurrent consumers one Shopify Web Agent process can serve, offline.
+# Runs the Shopify calls made by the Web Agent template (protocol_templates/online_stores/socontra_transact_shopify_protocol_supplier.py)
+# against the local Shopify stand-in server (benchmarks/shopify_standin_server.py), at increasing numbers of concurrent consumers.
+# Each simulated consumer transaction is: product search -> add to cart (cartCreate) -> checkout url -> either a purchase
+# (and order verification) or removal of the items from the cart. Removals are handed to the Web Agent's cart cleanup worker
+# (protocol_templates/online_stores/shopify_cart_cleanup.py) as the endpoints do, and each concurrency level waits for the
+# worker to finish its removals.
+
+# To run (starts a stand-in server in the same process):
+#   python -m benchmarks.shopify_supplier_benchmark --concurrency 1 8 32 64 --transactions 200 --latency-ms 50
+# Or against an already running stand-in server:
+#   python -m benchmarks.shopify_supplier_benchmark --url http://127.0.0.1:8787
+
+import argparse
+import contextlib
+import io
+import random
+import statistics
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import config, config_shopify
+
+# The Web Agent template imports the Socontra client, which requires a fernet key. The benchmark does not register agents
+# or store passwords, so use a temporary key if none is set in config.py.
+if not config.fernet_key:
+    from cryptography.fernet import Fernet
+    config.fernet_key = Fernet.generate_key()
+
+from socontra.comms import Message
+from protocol_templates.online_stores import socontra_transact_shopify_protocol_supplier as shopify_supplier
+from protocol_templates.online_stores import shopify_shops
+from benchmarks.shopify_standin_server import start_standin_server, product_nouns
+
+
+consumer_details = {
+    'first_name': 'John',
+    'last_name': 'Doe',
+    'address_line_one': '1 Consumer Street',
+    'address_line_two': '',
+    'city': 'San Francisco',
+    'state_province': 'California',
+    'zip_postal_code': '95016',
+    'country': 'US',
+    'email': 'benchmark@example.com',
+    'mobile_number': '+16135551111',
+}
+
+
+def run_transaction(transaction_index, purchase_ratio, random_generator):
+    # One consumer transaction against the Web Agent's Shopify functions. Returns the time in seconds for each stage.
+    timings = {}
+    shop = shopify_shops.get_shop('benchmark:shopify')
+    consumer = dict(consumer_details, email=f'consumer{transaction_index}@example.com')
+
+    task = {'task': [{'product_search_query': random_generator.choice(product_nouns), 'quantity': 1, 'number_proposals': 3}]}
+
+    time_start = time.perf_counter()
+    proposal = shopify_supplier.service_or_product_search(shop, task)
+    timings['search'] = time.perf_counter() - time_start
+
+    # Select the first product and variant, like a consumer would after evaluating the proposal.
+    products = proposal['proposal_list'][0]
+    if not products:
+        return timings
+
+    invite_offer_message = Message(sender_name='benchmark:consumer', receiver_name='benchmark:shopify', distribution_list=None,
+                                   message={'proposal_options_selected': [{'product_index': 0, 'variant_index': 0,
+                                                                           'variant_id': products[0]['variants'][0]['product_variant_id'],
+                                                                           'quantity': 1}],
+                                            'consumer_details': consumer,
+                                            'delivery_method': 'SHIPPING'},
+                                   message_type='invite_offer', recipient_type='supplier', protocol='transact',
+                                   dialogue_id=f'benchmark-{transaction_index}', message_id=f'benchmark-{transaction_index}',
+                                   task=task, proposal=proposal)
+
+    time_start = time.perf_counter()
+    offer = shopify_supplier.add_items_to_cart(shop, invite_offer_message, 20)
+    timings['add_to_cart'] = time.perf_counter() - time_start
+
+    time_start = time.perf_counter()
+    checkout_url = shopify_supplier.get_shopify_checkout_url(shop, offer)
+    timings['checkout_url'] = time.perf_counter() - time_start
+
+    if random_generator.random() < purchase_ratio:
+        # Simulate the human user's manual purchase, then verify the order as the Web Agent does.
+        time_start_manual_purchase = datetime.now(timezone.utc).replace(microsecond=0)
+        shop.session.get(checkout_url)
+        accept_offer_message = Message(sender_name='benchmark:consumer', receiver_name='benchmark:shopify', distribution_list=None,
+                                       message=None, message_type='accept_offer', recipient_type='supplier', protocol='transact',
+                                       dialogue_id=f'benchmark-{transaction_index}', task=task, offer=offer)
+        time_start = time.perf_counter()
+        shopify_supplier.verify_order_created('benchmark:shopify', accept_offer_message, time_start_manual_purchase.replace(second=0))
+        timings['verify_order'] = time.perf_counter() - time_start
+    else:
+        time_start = time.perf_counter()
+        shopify_supplier.cart_cleanup.remove_offer_lines(offer, shop)
+        timings['remove_from_cart'] = time.perf_counter() - time_start
+
+    return timings
+
+
+def run_level(concurrency, number_transactions, purchase_ratio, seed):
+    # Run number_transactions consumer transactions with concurrency consumers at once.
+    random_generators = [random.Random(seed + index) for index in range(number_transactions)]
+    errors = 0
+    all_timings = []
+
+    time_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_transaction, index, purchase_ratio, random_generators[index]) for index in range(number_transactions)]
+        for future in futures:
+            try:
+                all_timings.append(future.result())
+            except Exception:
+                errors += 1
+    wait_for_cart_cleanup()
+    elapsed = time.perf_counter() - time_start
+
+    return all_timings, errors, elapsed
+
+
+def wait_for_cart_cleanup(timeout: float = 60):
+    # Wait until the cart cleanup worker has sent every removal queued (including retries), or timeout seconds.
+    cart_cleanup = shopify_supplier.cart_cleanup
+    time_end = time.perf_counter() + timeout
+    while time.perf_counter() < time_end:
+        stats = cart_cleanup.stats
+        if stats['removals_completed'] + stats['removals_dead_lettered'] >= stats['removals_queued'] and not cart_cleanup.retry_list:
+            return
+        time.sleep(0.05)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+def print_results(concurrency, all_timings, errors, elapsed, shop):
+    print(f'\nConcurrent consumers: {concurrency}')
+    print(f'  transactions: {len(all_timings)}  errors: {errors}  elapsed: {elapsed:.2f}s  throughput: {len(all_timings) / elapsed:.1f} transactions/s')
+    if shop is not None:
+        print(f"  stand-in requests: {shop.stats['requests']}  throttled: {shop.stats['throttled']}")
+    cleanup_stats = shopify_supplier.cart_cleanup.stats
+    print(f"  cart cleanup: {cleanup_stats['removals_completed']} removals completed in {cleanup_stats['batches_sent']} batches, "
+          f"{cleanup_stats['removals_dead_lettered']} dead-lettered")
+    for stage in ['search', 'add_to_cart', 'checkout_url', 'verify_order', 'remove_from_cart']:
+        stage_times = [timings[stage] * 1000 for timings in all_timings if stage in timings]
+        if stage_times:
+            print(f'  {stage:18s} p50 {statistics.median(stage_times):8.1f}ms   p95 {percentile(stage_times, 95):8.1f}ms   max {max(stage_times):8.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Shopify Web Agent against the local Shopify stand-in server.')
+    parser.add_argument('--url', default=None, help='Url of a running stand-in server. Default starts one in this process.')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64], help='Numbers of concurrent consumers to benchmark.')
+    parser.add_argument('--transactions', type=int, default=200, help='Consumer transactions per concurrency level.')
+    parser.add_argument('--purchase-ratio', type=float, default=0.5, help='Fraction of transactions that purchase rather than remove from cart.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--throttle-rate', type=float, default=None)
+    parser.add_argument('--throttle-burst', type=int, default=100)
+    parser.add_argument('--shop-requests-per-second', type=float, default=config_shopify.shop_requests_per_second,
+                        help='Rate limit budget of the Web Agent for calls to the shop (see config_shopify.py).')
+    parser.add_argument('--shop-request-burst', type=int, default=config_shopify.shop_request_burst)
+    args = parser.parse_args()
+
+    config_shopify.shop_requests_per_second = args.shop_requests_per_second
+    config_shopify.shop_request_burst = args.shop_request_burst
+
+    shop = None
+    if args.url:
+        config_shopify.shop_url = args.url
+    else:
+        server, shop = start_standin_server(port=0, seed=args.seed, number_products=args.products, latency_ms=args.latency_ms,
+                                            jitter_ms=args.jitter_ms, throttle_rate=args.throttle_rate, throttle_burst=args.throttle_burst)
+        config_shopify.shop_url = shop.base_url
+
+    print(f'Benchmarking Shopify Web Agent against {config_shopify.shop_url}')
+
+    for concurrency in args.concurrency:
+        # The template prints each Shopify response. Hide this output during the benchmark.
+        with contextlib.redirect_stdout(io.StringIO()):
+            all_timings, errors, elapsed = run_level(concurrency, args.transactions, args.purchase_ratio, args.seed)
+        print_results(concurrency, all_timings, errors, elapsed, shop)
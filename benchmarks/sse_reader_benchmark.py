@@ -0,0 +1,88 @@
+# Benchmark how many messages per second an agent can receive from its message stream (Server-Sent Events), offline.
+# Compares the readers used by agent_receive_messages() in socontra/comms.py:
+#   sseclient - sseclient.SSEClient around the streaming response, then json.loads(event.data).
+#   builtin   - socontra/sse.py SSEReader, decoding each event from raw bytes.
+# Events are read and decoded only (not routed to endpoints), against the local stand-in (benchmarks/sse_standin_server.py).
+# The stream can be gzip compressed (--stream-compression) and/or sent without chunked transfer encoding (--close-delimited).
+# Each reader must receive every event sent, otherwise the benchmark fails.
+
+# To run (starts a stand-in server in the same process):
+#   python -m benchmarks.sse_reader_benchmark --events 100000 --repeat 3
+# Or against an already running stand-in server:
+#   python -m benchmarks.sse_reader_benchmark --url http://127.0.0.1:8788
+
+import argparse
+import json
+import statistics
+import time
+
+import requests
+
+from sseclient import SSEClient
+
+from socontra.sse import SSEReader
+from socontra.compression import stream_accept_encoding
+from benchmarks.sse_standin_server import start_standin_server, sse_path
+
+
+def read_sseclient(response):
+    number_events = 0
+    for event in SSEClient(response).events():
+        message = json.loads(event.data)
+        number_events += message['message'] is not None
+    return number_events
+
+
+def read_builtin(response):
+    number_events = 0
+    for event in SSEReader(response).events():
+        message = event.json()
+        number_events += message['message'] is not None
+    return number_events
+
+
+readers = {'sseclient': read_sseclient, 'builtin': read_builtin}
+
+
+def run_reader(url, reader_name):
+    # Read one whole stream. Returns (number of events, elapsed seconds).
+    time_start = time.perf_counter()
+    response = requests.get(url + sse_path, json={'agent_name': 'benchmark:consumer', 'clear_backlog': False}, stream=True,
+                            headers={'Accept-Encoding': stream_accept_encoding()})
+    number_events = readers[reader_name](response)
+    return number_events, time.perf_counter() - time_start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the agent message stream readers against the local SSE stand-in server.')
+    parser.add_argument('--url', default=None, help='Url of a running stand-in server. Default starts one in this process.')
+    parser.add_argument('--events', type=int, default=100000, help='Events per stream (stand-in started by the benchmark only).')
+    parser.add_argument('--events-per-write', type=int, default=50)
+    parser.add_argument('--crlf', action='store_true', help='Stand-in uses \\r\\n line endings.')
+    parser.add_argument('--repeat', type=int, default=3, help='Streams read by each reader.')
+    parser.add_argument('--readers', nargs='+', default=list(readers), choices=list(readers))
+    parser.add_argument('--stream-compression', action='store_true', help='Stand-in sends a gzip compressed stream.')
+    parser.add_argument('--close-delimited', action='store_true', help='Stand-in sends the stream without chunked transfer encoding.')
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        server, standin = start_standin_server(port=0, number_events=args.events, events_per_write=args.events_per_write,
+                                               line_ending='\r\n' if args.crlf else '\n', stream_compression=args.stream_compression,
+                                               chunked=not args.close_delimited)
+        url = standin.base_url
+
+    print(f'Benchmarking message stream readers against {url}{sse_path}')
+    results = {}
+    for reader_name in args.readers:
+        rates = []
+        for _ in range(args.repeat):
+            number_events, elapsed = run_reader(url, reader_name)
+            if args.url is None and number_events != args.events:
+                raise SystemExit(f'{reader_name} received {number_events} of {args.events} events.')
+            rates.append(number_events / elapsed)
+        results[reader_name] = statistics.median(rates)
+        print(f'  {reader_name:10s} {number_events} events   median {results[reader_name]:10.0f} events/s   best {max(rates):10.0f} events/s')
+
+    if 'sseclient' in results and 'builtin' in results:
+        print(f"  builtin is {results['builtin'] / results['sseclient']:.1f}x sseclient")
@@ -0,0 +1,235 @@
+# Local stand-in for the Socontra Network's message stream (Server-Sent Events) to an agent.
+# Allows the agent's message reader (socontra/comms.py agent_receive_messages, socontra/sse.py) to be benchmarked offline.
+# GET /agent_message/receive_message streams number_events synthetic protocol messages (new_task_request and proposal
+# messages in the format sent by the Socontra Network) as fast as possible, using chunked transfer encoding, then ends
+# the stream. Several events are written per HTTP chunk (events_per_write), as a busy Socontra Network would.
+# If stream_compression is True and the request's Accept-Encoding header includes gzip, the stream is gzip compressed and
+# flushed after each write (so events are not held back by the compressor).
+# If chunked is False, the stream is sent without chunked transfer encoding, and ended by closing the connection.
+# POST and PUT to /agent_message/ paths accept protocol messages from the agent, so that request compression
+# (socontra/compression.py) can be tested offline. Compressed bodies (Content-Encoding header) are accepted if the encoding
+# is in accepted_encodings, otherwise the stand-in responds 415. Responses have an Accept-Encoding header listing the
+# encodings it accepts (if advertise_encodings is True, or for a 415).
+# GET /agent_message/backlog/ returns the same number_events messages as the stream, in pages of the requested page_size
+# ({'after': cursor, 'page_size': n} in the request body), for backlog catch-up (socontra/backlog.py).
+
+# To run the server:
+#   python -m benchmarks.sse_standin_server --port 8788 --events 100000
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from socontra.compression import decompress
+
+
+sse_path = '/agent_message/receive_message'
+backlog_path = '/agent_message/backlog/'
+
+
+class SSEStandin:
+    def __init__(self, number_events: int = 100000, events_per_write: int = 50, line_ending: str = '\n', seed: int = 1,
+                 agent_name: str = 'benchmark:consumer', stream_compression: bool = False, accepted_encodings: list = None,
+                 chunked: bool = True, advertise_encodings: bool = True):
+        self.number_events = number_events
+        self.events_per_write = events_per_write
+        self.line_ending = line_ending
+        self.agent_name = agent_name
+        self.stream_compression = stream_compression
+        self.chunked = chunked
+        self.advertise_encodings = advertise_encodings
+        self.accepted_encodings = accepted_encodings if accepted_encodings is not None else ['gzip', 'zstd']
+        self.random_generator = random.Random(seed)
+        self.base_url = None
+        self.stats = {'streams': 0, 'events_sent': 0, 'stream_bytes_sent': 0, 'messages_received': 0, 'message_bytes_received': 0,
+                      'compressed_messages_received': 0, 'unsupported_encoding': 0}
+        self.stats_lock = threading.Lock()
+
+        # A fixed set of encoded events, sent in turn, so the server is not the bottleneck.
+        self.encoded_events = [self.encode_event(self.create_message(index)) for index in range(100)]
+
+    def create_message(self, index):
+        # A protocol message as sent to the agent by the Socontra Network.
+        supplier_name = f'benchmark:supplier_{index}'
+        protocol_message = {
+            'sender_name': supplier_name,
+            'receiver_name': self.agent_name,
+            'distribution_list': {'direct': [self.agent_name]},
+            'recipient_type': 'consumer',
+            'message': None,
+            'message_type': 'proposal',
+            'protocol': 'transact',
+            'dialogue_id': f'dialogue-{index}',
+            'message_id': f'message-{index}',
+            'task': {'task': [{'product_search_query': 'hoodie', 'quantity': 1, 'number_proposals': 3}]},
+            'proposal_timeout': time.time() + 30,
+            'proposal': {'proposal_list': [[{'product_title': f'Product {index}-{variant}',
+                                             'variants': [{'product_variant_id': f'gid://shopify/ProductVariant/{index}{variant}',
+                                                           'product_variant_total_price': round(self.random_generator.uniform(5, 100), 2),
+                                                           'currency_code': 'USD'}]} for variant in range(3)]]},
+            'invite_offer_timeout': None,
+            'offer': None,
+            'offer_timeout': None,
+            'payment_required': False,
+            'human_authorization_required': False,
+            'order': None,
+            'message_responding_to': {'sender_name': self.agent_name, 'receiver_name': supplier_name, 'distribution_list': {'direct': [supplier_name]},
+                                      'recipient_type': 'supplier', 'message': None, 'message_type': 'new_task_request', 'protocol': 'transact',
+                                      'dialogue_id': f'dialogue-{index}', 'message_id': f'request-{index}'},
+        }
+        return {'message': protocol_message, 'message_type_override': None, 'message_category': 'service'}
+
+    def encode_event(self, message):
+        return f'data: {json.dumps(message)}{self.line_ending}{self.line_ending}'.encode()
+
+
+def create_request_handler(standin: SSEStandin):
+    class SSEStandinRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] == backlog_path:
+                self.send_backlog_page()
+                return
+            if self.path.split('?')[0] != sse_path:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            if self.headers.get('Content-Length'):
+                self.rfile.read(int(self.headers['Content-Length']))
+
+            accept_encoding = self.headers.get('Accept-Encoding', '')
+            compressor = zlib.compressobj(wbits=31) if standin.stream_compression and 'gzip' in accept_encoding else None
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            if standin.chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            else:
+                self.send_header('Connection', 'close')
+                self.close_connection = True
+            if compressor is not None:
+                self.send_header('Content-Encoding', 'gzip')
+            self.end_headers()
+
+            encoded_events = standin.encoded_events
+            sent = 0
+            bytes_sent = 0
+            try:
+                while sent < standin.number_events:
+                    number = min(standin.events_per_write, standin.number_events - sent)
+                    data = b''.join(encoded_events[(sent + index) % len(encoded_events)] for index in range(number))
+                    if compressor is not None:
+                        data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                    self.write_chunk(data)
+                    sent += number
+                    bytes_sent += len(data)
+                if compressor is not None:
+                    self.write_chunk(compressor.flush())
+                if standin.chunked:
+                    self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            with standin.stats_lock:
+                standin.stats['streams'] += 1
+                standin.stats['events_sent'] += sent
+                standin.stats['stream_bytes_sent'] += bytes_sent
+
+        def send_backlog_page(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            request = json.loads(body) if body else {}
+            start = int(request.get('after') or 0)
+            end = min(start + int(request.get('page_size') or 500), standin.number_events)
+            messages = [standin.create_message(index) for index in range(start, end)]
+            self.send_json(200, {'http_response': {'messages': messages, 'next': end if end < standin.number_events else None}})
+
+        def write_chunk(self, data):
+            if data and standin.chunked:
+                self.wfile.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+            elif data:
+                self.wfile.write(data)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if not self.path.startswith('/agent_message/'):
+                self.send_json(404, {'detail': 'Not Found'})
+                return
+
+            content_encoding = self.headers.get('Content-Encoding')
+            if content_encoding is not None and content_encoding not in standin.accepted_encodings:
+                with standin.stats_lock:
+                    standin.stats['unsupported_encoding'] += 1
+                self.send_json(415, {'detail': 'Unsupported Media Type'}, {'Accept-Encoding': self.accept_encoding()})
+                return
+
+            message = json.loads(decompress(body, content_encoding))
+            with standin.stats_lock:
+                standin.stats['messages_received'] += 1
+                standin.stats['message_bytes_received'] += len(body)
+                standin.stats['compressed_messages_received'] += content_encoding is not None
+            self.send_json(200, {'http_response': {'received_bytes': len(body), 'content_encoding': content_encoding,
+                                                   'message_type': message.get('message_type') if type(message) == dict else None}})
+
+        do_PUT = do_POST
+
+        def accept_encoding(self):
+            return ', '.join(standin.accepted_encodings) if standin.accepted_encodings else 'identity'
+
+        def send_json(self, status_code, response, headers=None):
+            data = json.dumps(response).encode()
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            if standin.advertise_encodings and not headers:
+                headers = {'Accept-Encoding': self.accept_encoding()}
+            for header, value in (headers or {}).items():
+                self.send_header(header, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return SSEStandinRequestHandler
+
+
+def start_standin_server(host: str = '127.0.0.1', port: int = 8788, **standin_options):
+    # Start the stand-in server in a background thread. Returns (server, standin). Use port 0 to pick a free port.
+    # Call server.shutdown() to stop it.
+    standin = SSEStandin(**standin_options)
+    server = ThreadingHTTPServer((host, port), create_request_handler(standin))
+    standin.base_url = f'http://{host}:{server.server_address[1]}'
+
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    return server, standin
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the Socontra Network message stream (Server-Sent Events).')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8788)
+    parser.add_argument('--events', type=int, default=100000, help='Number of events sent on each stream.')
+    parser.add_argument('--events-per-write', type=int, default=50, help='Number of events written in each HTTP chunk.')
+    parser.add_argument('--crlf', action='store_true', help='Use \\r\\n line endings.')
+    parser.add_argument('--stream-compression', action='store_true', help='Send a gzip compressed stream if the agent accepts it.')
+    parser.add_argument('--accepted-encodings', nargs='*', default=['gzip', 'zstd'], help='Content encodings accepted for message bodies.')
+    parser.add_argument('--close-delimited', action='store_true', help='Send the stream without chunked transfer encoding.')
+    args = parser.parse_args()
+
+    server, standin = start_standin_server(args.host, args.port, number_events=args.events, events_per_write=args.events_per_write,
+                                           line_ending='\r\n' if args.crlf else '\n', stream_compression=args.stream_compression,
+                                           accepted_encodings=args.accepted_encodings, chunked=not args.close_delimited)
+    print(f'SSE stand-in server running at {standin.base_url}{sse_path}. Press Ctrl+C to stop.')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
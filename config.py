@@ -7,3 +7,124 @@ client_security_token = ''      # Place your security token here.
 socontra_network_url_sse = "https://socontranetwork.com/agent_message/receive_message"
 socontra_network_url = 'https://socontranetwork.com'
 socontra_network_port = 443
+
+# Adaptive protocol timeouts, from the response times of supplier agents (socontra/latency_stats.py).
+latency_stats_max_samples = 200         # Number of most recent response times kept for each supplier and protocol stage.
+adaptive_timeout_percentile = 95        # Timeouts are suggested from this percentile of response times...
+adaptive_timeout_margin = 1.0           # ...plus this margin in seconds.
+adaptive_timeout_minimum = 2.0          # Suggested timeouts are never shorter than this (seconds).
+adaptive_timeout_min_samples = 5        # Number of response times needed for a supplier before its timeout can be suggested.
+
+# Supplier performance scorecard (socontra/supplier_scorecard.py).
+supplier_scorecard_latency_weight = 0.2     # Weight of the latest response time in the moving average response time of a supplier.
+supplier_scorecard_min_samples = 5          # Number of invite offers (or response times) for a supplier before it can be skipped as slow.
+supplier_skip_no_response_rate = 0.5        # Skip suppliers that do not respond to at least this fraction of invite offers.
+supplier_skip_latency = None                # Skip suppliers with a moving average response time above this (seconds). None to disable.
+supplier_scorecard_half_life = 86400        # Event counts halve every half life (seconds), so old events count less. None for no decay.
+supplier_probation_interval = 600           # A skipped supplier's proposals are not skipped once every interval (seconds), so it can recover.
+skip_slow_suppliers = False                 # Consumer orchestrators do not select proposals from chronically slow suppliers.
+
+# Batching of protocol control messages - close_message, close_dialogue, close_agent, reject_offer (socontra/control_coalescer.py).
+control_message_coalescing = True       # Send control messages sent at about the same time by an agent as one request.
+control_message_flush_delay = 0.005     # Time (seconds) to wait for other control messages before sending.
+control_message_max_batch = 50          # Maximum number of control messages in one request.
+
+# Pooled HTTP connections to the Socontra Network, shared by all agents in this process (socontra/comms.py).
+http_pool_connections = 10      # Number of connection pools (one per host) to cache.
+http_pool_maxsize = 50          # Maximum number of connections kept open to each host.
+
+# Bulk sending of protocol messages to many agents - send_many and send_batch (socontra/bulk_send.py).
+bulk_send_max_concurrency = 20  # Maximum number of messages sent to the Socontra Network at the same time.
+bulk_send_max_batch = 100       # Maximum number of messages in one request to the batch endpoint.
+
+# Asynchronous outbound send queue - socontra.send_async() (socontra/outbound_queue.py).
+outbound_queue_shards = 4       # Number of background workers sending each agent's queued messages.
+
+# Durable outbox for protocol messages, replayed if the agent stops before they are sent (socontra/outbox.py).
+durable_outbox = False                  # Record protocol messages to durable_outbox_paths on disk before sending them.
+durable_outbox_paths = ['/agent_message/submit_offer/', '/agent_message/accept_offer/', '/agent_message/payment_confirmed/',
+                        '/agent_message/order_complete_or_cancel_status/']
+durable_outbox_max_age = 3600           # Unsent messages older than this (seconds) are dropped rather than replayed.
+durable_outbox_max_group_commit = 500   # Maximum number of outbox writes committed to disk in one transaction.
+
+# Retries of messages to the Socontra Network after transient failures (socontra/comms.py).
+idempotency_keys = True             # Send each POST, PUT and DELETE message with a new idempotency key.
+idempotency_keys_honoured = False   # Set to True only if the Socontra Network processes each idempotency key once. Then messages with
+                                    # a key are also retried after read timeouts and 5xx responses (which may come after the message
+                                    # was processed). Otherwise they are only retried if they were not processed (see retry_allowed()).
+http_request_timeout = (10, 60)     # Connect and read timeouts (seconds) for requests to the Socontra Network.
+retry_status_codes = [429, 500, 502, 503, 504]
+retry_budget_default = 2            # Maximum number of retries for a message.
+retry_budgets = {                   # Maximum number of retries for messages to specific paths.
+    '/agent_auth/agent_token': 3,
+    '/agent_message/submit_offer/': 3,
+    '/agent_message/accept_offer/': 4,
+    '/agent_message/payment_confirmed/': 4,
+    '/agent_message/order_complete_or_cancel_status/': 4,
+}
+retry_backoff_base = 0.2            # Backoff before the first retry is up to this (seconds), doubling for each retry...
+retry_backoff_max = 5.0             # ...up to this maximum.
+
+# Circuit breakers for each group of Socontra Network API paths - auth, connections, groups, message (socontra/circuit_breaker.py).
+circuit_breakers = True                 # Fail fast, without sending, while the Socontra Network is failing.
+circuit_breaker_failure_threshold = 5   # Failures in a row (5xx, timeouts, connection errors) that open a breaker.
+circuit_breaker_recovery_time = 10.0    # Time (seconds) a breaker stays open before probing the Socontra Network again.
+circuit_breaker_half_open_probes = 1    # Number of requests sent at the same time to probe the Socontra Network.
+outbox_when_circuit_open = True         # Record messages to durable_outbox_paths in the durable outbox (if enabled) while the message breaker is open.
+
+# Rate limiting of each agent's requests to the Socontra Network, with token buckets (socontra/rate_limiter.py).
+rate_limiting = True
+rate_limit_agent = (50, 100)            # (requests per second, burst) for all of an agent's requests.
+rate_limit_paths = {                    # (requests per second, burst) for an agent's requests to specific paths.
+    '/agent_message/broadcast/': (5, 20),
+    '/agent_message/message/': (20, 50),
+    '/agent_message/new_request/': (10, 20),
+}
+rate_limit_priority_paths = {           # Priority class of requests to specific paths. Others are 'protocol'.
+    '/agent_auth/agent_token': 'control',
+    '/agent_message/close_protocol_control/': 'control',
+    '/agent_message/batch_protocol_control/': 'control',
+    '/agent_message/accept_offer/': 'control',
+    '/agent_message/payment_confirmed/': 'control',
+    '/agent_message/reject_offer/': 'control',
+    '/agent_message/broadcast/': 'bulk',
+    '/agent_message/message/': 'bulk',
+    '/agent_message/batch_message/': 'bulk',
+}
+
+# Reader for the stream of messages (Server-Sent Events) from the Socontra Network (socontra/sse.py).
+sse_reader = 'builtin'          # 'builtin' (socontra/sse.py) or 'sseclient' (sseclient-py package).
+sse_chunk_size = 65536          # Maximum number of bytes read from the stream at a time by the built-in reader.
+sse_read_timeout = None         # Reconnect if nothing is received on the stream for this many seconds. None to wait forever.
+                                # Only set this if the Socontra Network sends keepalives more often, or idle agents will reconnect.
+
+# JSON codec for messages sent to and received from the Socontra Network (socontra/codec.py).
+json_codec = 'auto'             # 'auto' (fastest installed), 'orjson', 'msgspec' or 'json' (standard library).
+
+# Compression of messages sent to and received from the Socontra Network (socontra/compression.py).
+request_compression = True              # Compress request bodies with zstd (if installed) or gzip, once the Socontra Network says it accepts them.
+request_compression_min_size = 4096     # Only compress request bodies of at least this many bytes.
+request_compression_level_gzip = 5
+request_compression_level_zstd = 3
+stream_compression = True               # Accept a compressed message stream (SSE) from the Socontra Network.
+
+# Compact replies (socontra/message_cache.py). Replies send a reference (message_id, dialogue_id and message_type) to the
+# message being responded to, rather than the whole message. Requires a Socontra Network that supports compact replies.
+compact_replies = False
+message_cache_size = 10000              # Number of recent messages kept per agent to rebuild message_responding_to.
+
+# Deduplication of messages received from the Socontra Network (socontra/message_dedupe.py).
+message_dedupe = True
+message_dedupe_window = 3600                    # Seconds a message is remembered, to drop copies received later.
+message_dedupe_max_entries = 50000              # Messages remembered in the LRU for each agent.
+message_dedupe_bloom_bits = 0                   # Bits in the Bloom filter for messages evicted from the LRU. 0 to disable.
+message_dedupe_bloom_false_positive_rate = 1e-6 # Sets the number of hashes. Needs about 29 bits per message remembered.
+
+# Messages received after their deadline (proposal_timeout, invite_offer_timeout, offer_timeout) - see socontra/deadline.py.
+drop_expired_messages = True    # Don't route expired messages to their protocol endpoint (only to an expired_message endpoint).
+expired_message_margin = 0.0    # Also treat messages as expired if their deadline is less than this many seconds away.
+
+# Backlog catch-up for agents that connect with clear_backlog=False (socontra/backlog.py).
+backlog_catch_up = True         # Fetch the backlog in pages before connecting to the message stream, if the Socontra Network supports it.
+backlog_page_size = 500         # Messages fetched in each page.
+backlog_dispatch_workers = 16   # Threads routing backlog messages to their endpoints (one dialogue at a time each).
@@ -53,9 +53,48 @@ business_categories_and_regions = [
 
 # Create variables used by the Shopify agent.
 shop_url = f'https://{myshop_name}.myshopify.com'
+# To run the Shopify Web Agent offline against the local Shopify stand-in server (benchmarks/shopify_standin_server.py),
+# point the shop url at the stand-in server instead, e.g.:
+# shop_url = 'http://127.0.0.1:8787'
 
 header_values = {"X-Shopify-Storefront-Access-Token": API_ACCESS_TOKEN_STOREFRONT,
                   "Content-Type": "application/json"}
 
 header_values_ADMIN = {"X-Shopify-Access-Token": API_TOKEN_ADMIN,
                   "Content-Type": "application/json"}
+
+# Deferred cart cleanup. Items are removed from Shopify carts (rejected, canceled or expired offers) by a background 
+# worker in batches, so that protocol endpoints do not wait on the Storefront API.
+# See file protocol_templates/online_stores/shopify_cart_cleanup.py.
+cart_cleanup_batch_size = 20            # Maximum number of carts cleaned in a single Storefront API request.
+cart_cleanup_flush_interval = 0.5       # Seconds to wait for more removals before sending a batch.
+cart_cleanup_max_retries = 5            # Retries before a removal is dead-lettered (kept for inspection).
+cart_cleanup_retry_backoff = 2          # Seconds before the first retry. Doubles with each retry.
+cart_cleanup_expiry_grace = 30          # Seconds after an offer times out (not purchased) before its cart lines are removed.
+
+# Connection pool and rate limit budget for calls to each shop's Shopify APIs.
+# See file protocol_templates/online_stores/shopify_shops.py.
+shop_requests_per_second = 10           # Shopify API calls per second per shop.
+shop_request_burst = 20                 # Maximum Shopify API calls per shop that can be sent at once.
+shop_connection_pool_size = 10          # Maximum number of pooled connections to each shop.
+shop_request_timeout = 30               # Maximum time (seconds) to wait for a Shopify API call, if the protocol deadline is later.
+
+# Multi-store Web Agent host (socontra_shopify_multi_store_host.py). One process and one Socontra client serves many
+# Shopify shops, with one agent per shop. Each entry in the table is a shop. Optional fields default to the values above.
+# The table can also be loaded from a json file with the same format. Example:
+shopify_stores = [
+    # {
+    #     'myshop_name': '<myshop_name>',
+    #     'API_ACCESS_TOKEN_STOREFRONT': '<Storefront API access token here>',
+    #     'API_TOKEN_ADMIN': '<Admin API access token here>',
+    #     'api_version': '2025-04',                 # Optional
+    #     'api_version_admin': '2025-01',           # Optional
+    #     'requests_per_second': 10,                # Optional
+    #     'request_burst': 20,                      # Optional
+    #     'connection_pool_size': 10,               # Optional
+    #     'business_categories_and_regions': [
+    #         {'group': ['socontra', 'Restaurants', 'Australian'],
+    #          'regions': [{'country': 'US', 'state': 'CA', 'city': 'Los Angeles'}]},
+    #     ],
+    # },
+]
@@ -0,0 +1,171 @@
+# Vectorised proposal scoring for consumer agents that transact with Web Agent online stores
+# (protocol_templates/online_stores/socontra_transact_store_protocol_consumer.py).
+# Proposals from online stores contain a list of products for each task item, and each product has a list of variants
+# (sizes, colours, etc) with different prices. Rather than evaluating each proposal, product and variant one at a time,
+# the scoring engine flattens all the received proposals into NumPy arrays (one row per variant) and selects the best
+# variant for each task item of each proposal, and the cost of each proposal, with batched array operations.
+
+# Columns available to scoring functions (one value per variant row):
+#   'unit_price'   - variant price for 1 item.
+#   'quantity'     - quantity of items required for the task item.
+#   'total_price'  - unit_price * quantity, converted with the currency rates (if provided).
+#   'currency'     - index of the variant's currency in engine.currencies.
+#   'available'    - True if the variant can be selected (available for sale, and currency rate known).
+#   plus a column for each custom feature extractor, and for each proposal feature extractor (e.g. the supplier scorecard
+#   features from socontra/supplier_scorecard.py, which are the same for all variants in a proposal).
+# A scoring function takes the dict of columns and returns an array of scores (lower is better). The score of a variant
+# is the weighted sum of the scoring functions, and the cost of a proposal is the sum of the scores of the best variant
+# for each task item.
+
+import numpy as np
+
+
+def total_price_score(columns):
+    # Score variants by the total price for the quantity required. The default scoring function.
+    return columns['total_price']
+
+
+def unit_price_score(columns):
+    # Score variants by price per item.
+    return columns['unit_price']
+
+
+def feature_score(feature_name):
+    # Return a scoring function that scores variants by a custom feature column.
+    def score(columns):
+        return columns[feature_name]
+    return score
+
+
+class ProposalScoringEngine:
+    def __init__(self, scoring_functions: list = None, feature_extractors: dict = None, currency_rates: dict = None,
+                 proposal_feature_extractors: dict = None):
+        # scoring_functions: list of (weight, scoring function). Default is [(1.0, total_price_score)], i.e. cheapest variant.
+        # feature_extractors: dict of feature name -> function(proposal_message, product, variant) returning a number, used
+        #                     to add custom feature columns for scoring functions.
+        # currency_rates: dict of currency code -> rate to convert prices to a common currency. If None, currencies are
+        #                 ignored (as in the template demo). If provided, variants with currencies not in the dict are not selected.
+        # proposal_feature_extractors: dict of feature name -> function(proposal_message) returning a number. Evaluated once
+        #                              for each proposal, and used for all the proposal's variants.
+        self.scoring_functions = scoring_functions if scoring_functions else [(1.0, total_price_score)]
+        self.feature_extractors = feature_extractors if feature_extractors else {}
+        self.currency_rates = currency_rates
+        self.proposal_feature_extractors = proposal_feature_extractors if proposal_feature_extractors else {}
+        self.currencies = []
+
+    def flatten(self, proposals: list):
+        # Flatten the proposals (list of proposal Messages) into arrays with one row per variant.
+        # A 'group' is a task item of a proposal. The best variant is selected from each group.
+        unit_prices, quantities, currency_codes, available, groups = [], [], [], [], []
+        product_indexes, variant_indexes, variant_ids, proposal_indexes = [], [], [], []
+        features = {feature_name: [] for feature_name in self.feature_extractors}
+        proposal_features = {feature_name: [] for feature_name in self.proposal_feature_extractors}
+        group_proposal, group_quantity = [], []
+
+        for proposal_index, proposal in enumerate(proposals):
+            for feature_name, proposal_feature_extractor in self.proposal_feature_extractors.items():
+                proposal_features[feature_name].append(proposal_feature_extractor(proposal))
+
+            for task_index, a_task in enumerate(proposal.task['task']):
+                group = len(group_proposal)
+                group_proposal.append(proposal_index)
+                group_quantity.append(a_task['quantity'])
+
+                for product_index, a_product_option in enumerate(proposal.proposal['proposal_list'][task_index]):
+                    for variant_index, a_variant in enumerate(a_product_option['variants']):
+                        unit_prices.append(a_variant['product_variant_price_amount'])
+                        currency_codes.append(a_variant.get('product_variant_price_currency'))
+                        available.append(a_variant.get('available_for_sale', True))
+                        quantities.append(a_task['quantity'])
+                        groups.append(group)
+                        proposal_indexes.append(proposal_index)
+                        product_indexes.append(product_index)
+                        variant_indexes.append(variant_index)
+                        variant_ids.append(a_variant['product_variant_id'])
+                        for feature_name, feature_extractor in self.feature_extractors.items():
+                            features[feature_name].append(feature_extractor(proposal, a_product_option, a_variant))
+
+        # Prices are strings in the proposals. Convert them all at once.
+        columns = {
+            'unit_price': np.asarray(unit_prices, dtype=np.float64),
+            'quantity': np.asarray(quantities, dtype=np.float64),
+            'available': np.asarray(available, dtype=bool),
+            'group': np.asarray(groups, dtype=np.int64),
+            'product_index': np.asarray(product_indexes, dtype=np.int64),
+            'variant_index': np.asarray(variant_indexes, dtype=np.int64),
+        }
+        for feature_name, feature_values in features.items():
+            columns[feature_name] = np.asarray(feature_values, dtype=np.float64)
+        row_proposal_index = np.asarray(proposal_indexes, dtype=np.int64)
+        for feature_name, feature_values in proposal_features.items():
+            columns[feature_name] = np.asarray(feature_values, dtype=np.float64)[row_proposal_index]
+
+        # Currencies as integer codes, and total price in the common currency.
+        self.currencies, currency_index = np.unique(np.asarray(currency_codes, dtype=str), return_inverse=True) if currency_codes else ([], np.zeros(0, dtype=np.int64))
+        columns['currency'] = currency_index
+        if self.currency_rates is None:
+            rates = np.ones(len(self.currencies))
+        else:
+            rates = np.asarray([self.currency_rates.get(currency, np.nan) for currency in self.currencies], dtype=np.float64)
+        row_rates = rates[currency_index] if len(currency_index) else np.zeros(0)
+        columns['available'] &= ~np.isnan(row_rates)
+        columns['total_price'] = columns['unit_price'] * columns['quantity'] * np.nan_to_num(row_rates)
+
+        return columns, variant_ids, np.asarray(group_proposal, dtype=np.int64), group_quantity
+
+    def evaluate(self, proposals: list):
+        # Evaluate all proposals at once. Returns a list with a (proposal_options_selected, proposal_cost) tuple for each
+        # proposal, in the same order as proposals. proposal_options_selected is None (and cost infinite) if the proposal
+        # does not have an available variant for every task item.
+        # proposal_options_selected is a list (one per task item) of:
+        #   {'product_index', 'variant_index', 'variant_id', 'product_variant_total_price', 'quantity'}
+        if not proposals:
+            return []
+
+        columns, variant_ids, group_proposal, group_quantity = self.flatten(proposals)
+        number_groups = len(group_proposal)
+
+        # Score each variant row. Rows that can't be selected get an infinite score.
+        scores = np.zeros(len(columns['group']), dtype=np.float64)
+        for weight, scoring_function in self.scoring_functions:
+            scores += weight * scoring_function(columns)
+        scores = np.where(columns['available'], scores, np.inf)
+
+        # Best (lowest score) row in each group: sort by group then score, and take the first row of each group.
+        best_row = np.full(number_groups, -1, dtype=np.int64)
+        best_score = np.full(number_groups, np.inf)
+        if len(scores):
+            order = np.lexsort((scores, columns['group']))
+            groups_present, first_index = np.unique(columns['group'][order], return_index=True)
+            best_row[groups_present] = order[first_index]
+            best_score[groups_present] = scores[order[first_index]]
+
+        # Cost of each proposal is the sum of the best scores for each of its task items.
+        proposal_costs = np.bincount(group_proposal, weights=best_score, minlength=len(proposals))
+
+        results = []
+        group = 0
+        for proposal_index in range(len(proposals)):
+            proposal_options_selected = []
+            while group < number_groups and group_proposal[group] == proposal_index:
+                row = best_row[group]
+                if row >= 0 and np.isfinite(best_score[group]):
+                    proposal_options_selected.append({'product_index': int(columns['product_index'][row]),
+                                                      'variant_index': int(columns['variant_index'][row]),
+                                                      'variant_id': variant_ids[row],
+                                                      'product_variant_total_price': float(columns['total_price'][row]),
+                                                      'quantity': group_quantity[group]})
+                else:
+                    proposal_options_selected = None
+                group += 1
+                if proposal_options_selected is None:
+                    # Skip the remaining task items of this proposal.
+                    while group < number_groups and group_proposal[group] == proposal_index:
+                        group += 1
+
+            if proposal_options_selected is None:
+                results.append((None, float('inf')))
+            else:
+                results.append((proposal_options_selected, float(proposal_costs[proposal_index])))
+
+        return results
@@ -0,0 +1,212 @@
+# Deferred, batched cart cleanup for the Shopify Web Agent template
+# (protocol_templates/online_stores/socontra_transact_shopify_protocol_supplier.py).
+# Removing items from a Shopify cart (cartLinesRemove) is a Storefront API call that does not need to hold up the protocol
+# endpoint. Endpoints hand the offer to the cleanup worker and return immediately. The worker collects the removals and sends
+# them to Shopify in batches (one GraphQL request with many aliased cartLinesRemove mutations), retries failures, and
+# 'dead-letters' removals that still fail after the retry limit so they can be inspected later.
+# The worker also tracks offers that were submitted to consumers, and sweeps (removes from cart) any offer that was not
+# purchased before its offer timeout expired.
+# One worker serves all shops hosted by the process. Removals are sent to the shop (shopify_shops.ShopifyShop) that
+# created the cart.
+
+import threading
+import queue
+import time
+import json
+
+from protocol_templates.online_stores import shopify_shops
+
+
+class CartCleanupWorker:
+    def __init__(self, batch_size: int = 20, flush_interval: float = 0.5, max_retries: int = 5,
+                 retry_backoff: float = 2.0, expiry_grace: float = 30.0):
+        # batch_size: maximum number of carts to clean in one Storefront API request.
+        # flush_interval: seconds to wait for more removals before sending a (part filled) batch.
+        # max_retries: number of times to retry a removal before it is dead-lettered.
+        # retry_backoff: base seconds to wait before retrying a failed removal (doubles with each attempt).
+        # expiry_grace: seconds after an offer's timeout before the offer's cart lines are swept.
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.expiry_grace = expiry_grace
+
+        self.removal_queue = queue.Queue()
+        self.retry_list = []            # Removals waiting for their retry time.
+        self.offers_tracked = {}        # cart_id -> {'expiry': epoch time, 'offer': offer} for offers awaiting purchase.
+        self.dead_letters = []          # Removals that could not be completed after max_retries.
+        self.lock = threading.Lock()
+        self.worker_thread = None
+
+        self.stats = {
+            'removals_queued': 0,
+            'removals_completed': 0,
+            'removals_retried': 0,
+            'removals_dead_lettered': 0,
+            'offers_swept': 0,
+            'batches_sent': 0,
+        }
+
+    def start(self):
+        # Start the background worker thread, if not already running.
+        with self.lock:
+            if self.worker_thread is None or not self.worker_thread.is_alive():
+                self.worker_thread = threading.Thread(target=self._run, daemon=True)
+                self.worker_thread.start()
+
+    def remove_offer_lines(self, offer, shop=None):
+        # Queue the removal of all line items in the offer from the offer's cart. Returns immediately.
+        # shop is the shop context of the cart. None uses the shop in config_shopify.py.
+        if not offer or 'cart_id' not in offer:
+            return False
+
+        line_ids = [line_item['variants']['line_item'] for line_item in offer['offer_list'] if 'line_item' in line_item['variants']]
+
+        # The offer is being cleaned up, so no need to sweep it later.
+        self.untrack_offer(offer)
+
+        if not line_ids:
+            return False
+
+        self.removal_queue.put({'cart_id': offer['cart_id'], 'line_ids': line_ids, 'shop': shop if shop else shopify_shops.get_default_shop(), 'attempts': 0, 'retry_at': 0})
+        with self.lock:
+            self.stats['removals_queued'] += 1
+        self.start()
+        return True
+
+    def track_offer(self, offer, offer_timeout: float, shop=None):
+        # Track an offer submitted to a consumer. If the offer is not purchased (see untrack_offer()) within offer_timeout
+        # seconds (plus expiry_grace), then its cart lines are removed automatically.
+        if not offer or 'cart_id' not in offer:
+            return
+        with self.lock:
+            self.offers_tracked[offer['cart_id']] = {'expiry': time.time() + offer_timeout + self.expiry_grace, 'offer': offer, 'shop': shop}
+        self.start()
+
+    def untrack_offer(self, offer):
+        # Stop tracking an offer, e.g. because the consumer accepted it and is making the purchase.
+        if not offer or 'cart_id' not in offer:
+            return
+        with self.lock:
+            self.offers_tracked.pop(offer['cart_id'], None)
+
+    def _run(self):
+        # Worker loop. Collect a batch of removals, send it, and sweep expired offers.
+        while True:
+            batch = self._collect_batch()
+            if batch:
+                self._send_batch(batch)
+            self._sweep_expired_offers()
+
+    def _collect_batch(self):
+        # Wait up to flush_interval for removals, returning at most batch_size removals (merged by cart).
+        batch = {}
+        time_end = time.time() + self.flush_interval
+
+        # Removals due for a retry go first.
+        now = time.time()
+        with self.lock:
+            retries_due = [removal for removal in self.retry_list if removal['retry_at'] <= now]
+            self.retry_list = [removal for removal in self.retry_list if removal['retry_at'] > now]
+        for removal in retries_due:
+            self._add_to_batch(batch, removal)
+
+        while len(batch) < self.batch_size:
+            time_to_wait = time_end - time.time()
+            if time_to_wait <= 0:
+                break
+            try:
+                removal = self.removal_queue.get(timeout=time_to_wait)
+            except queue.Empty:
+                break
+            self._add_to_batch(batch, removal)
+
+        return list(batch.values())
+
+    def _add_to_batch(self, batch, removal):
+        # Removals for the same cart are merged into a single cartLinesRemove mutation.
+        key = (id(removal['shop']), removal['cart_id'])
+        if key in batch:
+            for line_id in removal['line_ids']:
+                if line_id not in batch[key]['line_ids']:
+                    batch[key]['line_ids'].append(line_id)
+            batch[key]['attempts'] = max(batch[key]['attempts'], removal['attempts'])
+        else:
+            batch[key] = {'cart_id': removal['cart_id'], 'line_ids': list(removal['line_ids']), 'shop': removal['shop'],
+                          'attempts': removal['attempts'], 'retry_at': 0}
+
+    def _sweep_expired_offers(self):
+        # Queue the removal of cart lines for offers whose timeout (plus grace) has expired without a purchase.
+        now = time.time()
+        with self.lock:
+            expired = [tracked for tracked in self.offers_tracked.values() if tracked['expiry'] <= now]
+        for tracked in expired:
+            if self.remove_offer_lines(tracked['offer'], tracked['shop']):
+                with self.lock:
+                    self.stats['offers_swept'] += 1
+
+    def _send_batch(self, batch):
+        # Removals for different shops are sent in separate requests.
+        batches_by_shop = {}
+        for removal in batch:
+            batches_by_shop.setdefault(id(removal['shop']), []).append(removal)
+
+        for shop_batch in batches_by_shop.values():
+            self._send_shop_batch(shop_batch[0]['shop'], shop_batch)
+
+    def _send_shop_batch(self, shop, batch):
+        # Send one Storefront API request with an aliased cartLinesRemove mutation for each cart in the batch.
+        mutations = ''
+        for index, removal in enumerate(batch):
+            line_ids = ', '.join(f'"{line_id}"' for line_id in removal['line_ids'])
+            mutations = mutations + f"""
+                remove{index}: cartLinesRemove(cartId: "{removal['cart_id']}", lineIds: [{line_ids}]) {{
+                    cart {{
+                        id
+                    }}
+                    userErrors {{
+                        field
+                        message
+                    }}
+                }}
+            """
+
+        payload = {'query': f'mutation {{ {mutations} }}'}
+
+        with self.lock:
+            self.stats['batches_sent'] += 1
+        try:
+            response = shop.post_storefront(payload, timeout=30)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise ValueError(f'Shopify returned status code {response.status_code}')
+            result = json.loads(response.content)
+        except Exception as error:
+            # Request failed as a whole (connection issue, throttled, Shopify error). Retry all removals in the batch.
+            for removal in batch:
+                self._retry_or_dead_letter(removal, str(error))
+            return
+
+        data = result.get('data') or {}
+        for index, removal in enumerate(batch):
+            mutation_result = data.get(f'remove{index}')
+            if mutation_result and mutation_result['cart'] is not None and not mutation_result['userErrors']:
+                with self.lock:
+                    self.stats['removals_completed'] += 1
+            else:
+                error = mutation_result['userErrors'] if mutation_result else result.get('errors')
+                self._retry_or_dead_letter(removal, error)
+
+    def _retry_or_dead_letter(self, removal, error):
+        removal['attempts'] += 1
+        if removal['attempts'] > self.max_retries:
+            print(f"Could not remove lines {removal['line_ids']} from cart {removal['cart_id']}. Error: {error}")
+            removal['error'] = error
+            removal['dead_lettered_at'] = time.time()
+            with self.lock:
+                self.dead_letters.append(removal)
+                self.stats['removals_dead_lettered'] += 1
+        else:
+            removal['retry_at'] = time.time() + self.retry_backoff * (2 ** (removal['attempts'] - 1))
+            with self.lock:
+                self.retry_list.append(removal)
+                self.stats['removals_retried'] += 1
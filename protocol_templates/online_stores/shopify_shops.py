@@ -0,0 +1,105 @@
+# Shop contexts for the Shopify Web Agent template (protocol_templates/online_stores/socontra_transact_shopify_protocol_supplier.py).
+# Each Shopify shop served by a Web Agent has its own shop context: store url, API credentials, business categories and
+# regions, a pooled HTTP session (connection pool) and a rate limit budget for calls to the Shopify APIs.
+# Shops are registered against the Socontra agent that represents them, so that one process (and one Socontra client)
+# can host many shops. Endpoints get the shop context for the agent that received the message with get_shop(agent_name).
+# If no shop is registered for the agent, the single shop configured in config_shopify.py is used.
+
+import threading
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from socontra.deadline import request_timeout
+from socontra.rate_limiter import TokenBucket
+import config_shopify
+
+
+class ShopifyShop:
+    def __init__(self, myshop_name: str, api_access_token_storefront: str, api_token_admin: str, api_version: str = '2025-04',
+                 api_version_admin: str = '2025-01', business_categories_and_regions: list = None, shop_url: str = None,
+                 requests_per_second: float = 10, request_burst: int = 20, connection_pool_size: int = 10):
+        self.myshop_name = myshop_name
+        self.shop_url = shop_url if shop_url else f'https://{myshop_name}.myshopify.com'
+        self.api_version = api_version
+        self.api_version_admin = api_version_admin
+        self.business_categories_and_regions = business_categories_and_regions if business_categories_and_regions else []
+
+        self.header_values = {"X-Shopify-Storefront-Access-Token": api_access_token_storefront,
+                              "Content-Type": "application/json"}
+        self.header_values_ADMIN = {"X-Shopify-Access-Token": api_token_admin,
+                                    "Content-Type": "application/json"}
+
+        # Connection pool for this shop, so connections to Shopify are reused between requests.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connection_pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Rate limit budget for this shop's Shopify API calls.
+        self.rate_limit = TokenBucket(requests_per_second, request_burst)
+
+    def storefront_url(self):
+        return f'{self.shop_url}/api/{self.api_version}/graphql.json'
+
+    def admin_url(self):
+        return f'{self.shop_url}/admin/api/{self.api_version_admin}/graphql.json'
+
+    def post_storefront(self, payload: dict, timeout: float = None):
+        # Send a query to the shop's Storefront GraphQL API.
+        # The timeout is the time remaining until the deadline of the protocol message being processed (see socontra/deadline.py), 
+        # up to timeout (default config_shopify.shop_request_timeout). Raises DeadlineExpired if the deadline has passed.
+        self.rate_limit.acquire()
+        return self.session.post(self.storefront_url(), headers=self.header_values, json=payload, timeout=self.request_timeout(timeout))
+
+    def post_admin(self, payload: dict, timeout: float = None):
+        # Send a query to the shop's Admin GraphQL API. Timeout as for post_storefront().
+        self.rate_limit.acquire()
+        return self.session.post(self.admin_url(), headers=self.header_values_ADMIN, json=payload, timeout=self.request_timeout(timeout))
+
+    def request_timeout(self, timeout):
+        return request_timeout(timeout if timeout is not None else config_shopify.shop_request_timeout)
+
+
+# Shop contexts for each agent, and the default shop from config_shopify.py.
+global shops_by_agent_name, default_shop
+shops_by_agent_name = {}
+default_shop = None
+shops_lock = threading.Lock()
+
+
+def register_shop(agent_name: str, shop: ShopifyShop):
+    # Register the shop that agent agent_name represents.
+    global shops_by_agent_name
+    shops_by_agent_name[agent_name] = shop
+
+
+def get_shop(agent_name: str = None):
+    # Will return the shop context for the agent. If the agent does not have a registered shop, return the shop
+    # configured in config_shopify.py (single shop Web Agent).
+    global shops_by_agent_name
+    if agent_name in shops_by_agent_name:
+        return shops_by_agent_name[agent_name]
+    return get_default_shop()
+
+
+def get_default_shop():
+    # Create the shop context from config_shopify.py the first time it is needed.
+    global default_shop
+    with shops_lock:
+        if default_shop is None:
+            default_shop = ShopifyShop(config_shopify.myshop_name, config_shopify.API_ACCESS_TOKEN_STOREFRONT, config_shopify.API_TOKEN_ADMIN,
+                                       config_shopify.api_version, config_shopify.api_version_admin, config_shopify.business_categories_and_regions,
+                                       shop_url=config_shopify.shop_url, requests_per_second=config_shopify.shop_requests_per_second,
+                                       request_burst=config_shopify.shop_request_burst, connection_pool_size=config_shopify.shop_connection_pool_size)
+    return default_shop
+
+
+def create_shop(shop_config: dict):
+    # Create a shop context from an entry in the shop table (see shopify_stores in config_shopify.py).
+    return ShopifyShop(shop_config['myshop_name'], shop_config['API_ACCESS_TOKEN_STOREFRONT'], shop_config['API_TOKEN_ADMIN'],
+                       shop_config.get('api_version', config_shopify.api_version), shop_config.get('api_version_admin', config_shopify.api_version_admin),
+                       shop_config.get('business_categories_and_regions'), shop_url=shop_config.get('shop_url'),
+                       requests_per_second=shop_config.get('requests_per_second', config_shopify.shop_requests_per_second),
+                       request_burst=shop_config.get('request_burst', config_shopify.shop_request_burst),
+                       connection_pool_size=shop_config.get('connection_pool_size', config_shopify.shop_connection_pool_size))
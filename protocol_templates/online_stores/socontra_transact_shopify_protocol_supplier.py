@@ -6,13 +6,15 @@
 #          purchase of items in the cart must be completed manually by the agent's human user.
 
 import time
-import requests, json
+import json
 from pprint import pprint
 from datetime import datetime, timedelta, timezone
 
 import config_shopify
 
 from socontra.socontra import Socontra, Message, Protocol
+from protocol_templates.online_stores.shopify_cart_cleanup import CartCleanupWorker
+from protocol_templates.online_stores import shopify_shops
 
 # Create a Socontra Client for the agent.
 protocol = Protocol()
@@ -23,6 +25,12 @@ def route(*args):
         return f
     return inner_decorator
 
+# Background worker that removes items from carts in batches (rejected, canceled and expired offers), so that endpoints
+# do not have to wait on the Shopify Storefront API.
+cart_cleanup = CartCleanupWorker(batch_size=config_shopify.cart_cleanup_batch_size, flush_interval=config_shopify.cart_cleanup_flush_interval,
+                                 max_retries=config_shopify.cart_cleanup_max_retries, retry_backoff=config_shopify.cart_cleanup_retry_backoff,
+                                 expiry_grace=config_shopify.cart_cleanup_expiry_grace)
+
 
 # ----- SOCONTRA SHOPIFY PROTOCOL TEMPLATE  -------------------------------------
 
@@ -36,8 +44,11 @@ def new_task_request(agent_name: str, received_message: Message):
     
     print(f'\nNew request to fulfill task from {received_message.sender_name}. The task is {received_message.task} requires a response by {socontra.get_deadline(received_message.proposal_timeout)}\n')
   
+    # Get the Shopify shop that this agent represents.
+    shop = shopify_shops.get_shop(agent_name)
+
     # Conduct a search, if the supplier agent is able to fulfill the task. Get the top search result(s).
-    proposal_list = service_or_product_search(received_message.task)
+    proposal_list = service_or_product_search(shop, received_message.task)
     
     if proposal_list is not None:
         # Search results found one or more suitable services or products that can fulfill the task.
@@ -85,8 +96,10 @@ def receive_invite_offer(agent_name: str, received_message: Message, message_res
     print('\nInvite to offer for proposal ', received_message.proposal, ' was received by  ', agent_name, ' from ', received_message.sender_name, ' requires a response by ',
           socontra.get_deadline(received_message.invite_offer_timeout), '\n')
     
+    shop = shopify_shops.get_shop(agent_name)
+
     # Add the item/product(s) to the cart, and submit the binding/committed offer to the consumer.
-    offer = add_items_to_cart(received_message, received_message.invite_offer_timeout)
+    offer = add_items_to_cart(shop, received_message, received_message.invite_offer_timeout)
 
     # Timeout for the cosumer to accept the offer and make the purchase.
     timeout = 20
@@ -94,6 +107,9 @@ def receive_invite_offer(agent_name: str, received_message: Message, message_res
     socontra.submit_offer(agent_name, offer=offer, message_responding_to=received_message, 
                               offer_timeout=timeout, payment_required = True, human_authorization_required = True)
 
+    # If the consumer does not purchase the offer before it times out, the items will be removed from the cart automatically.
+    cart_cleanup.track_offer(offer, timeout, shop)
+
 
 @route('accept_offer', 'service', 'transact', 'supplier')  
 # -> response:  If payment for services required: socontra.payment_confirmed() or socontra.payment_denied()
@@ -118,8 +134,13 @@ def accept_offer_supplier(agent_name: str, received_message: Message, message_re
     # In case of payment errors, set a timeout for the consumer agent to respond with another accept_offer to resolve the issue.
     timeout = 60
 
+    # The consumer is purchasing the offer, so don't remove the items from the cart when the offer times out.
+    cart_cleanup.untrack_offer(received_message.offer)
+
+    shop = shopify_shops.get_shop(agent_name)
+
     # Get the checkout URL.
-    shopify_checkout_url = get_shopify_checkout_url(received_message.offer)
+    shopify_checkout_url = get_shopify_checkout_url(shop, received_message.offer)
 
     # Store the current time, used to verify the purchase order.
     time_start_manual_purchase = datetime.now(timezone.utc)
@@ -141,13 +162,16 @@ def accept_offer_supplier(agent_name: str, received_message: Message, message_re
             # Order was not verified (could not be found). Send a payment error and see if the consumer agent can retry
             # and send a follow up 'accept offer'.
             socontra.payment_error(agent_name, message = message, offer_timeout=timeout, message_responding_to=received_message)
+
+            # Remove the items from the cart if the consumer does not resolve the payment error in time.
+            cart_cleanup.track_offer(received_message.offer, timeout, shop)
             return
         elif order_verification:
             # Order confirmed and paid. Send the consumer agent a message saying that payment confirmed.
             socontra.payment_confirmed(agent_name, order=order_details, message = message, message_responding_to=received_message)
     else:
-        # Order was not confirmed, so remove the item from cart and return.
-        remove_item_from_cart(consumer_response_message['received_message'].offer)
+        # Order was not confirmed, so remove the item from cart (in the background) and return.
+        cart_cleanup.remove_offer_lines(consumer_response_message['received_message'].offer, shop)
 
         # End the dialogue/transaction.
         socontra.close_dialogue(agent_name, received_message)
@@ -175,8 +199,8 @@ def reject_offer_supplier(agent_name: str, received_message: Message, message_re
     # Agent response
     print('\nOffer rejected to fulfill task ', received_message.task, ' by ', received_message.sender_name, '. The reason/message is ', received_message.message, '\n')
 
-    # Remove item from cart.
-    remove_item_from_cart(received_message.offer)
+    # Remove item from cart. This is done in the background so the endpoint can return immediately.
+    cart_cleanup.remove_offer_lines(received_message.offer, shopify_shops.get_shop(agent_name))
 
     # End the dialogue/transaction.
     socontra.close_dialogue(agent_name, received_message)
@@ -291,14 +315,15 @@ def task_withdrawn_supplier(agent_name: str, received_message: Message, message_
 # Shopify functions to support the (transact) protocol
 
 
-def service_or_product_search(task):
+def service_or_product_search(shop, task):
     # Run a search on the database for services, products or resources that can to fulfill the task.
+    # shop is the shop context (shopify_shops.ShopifyShop) for the Shopify shop to search.
 
     # Go through each of the task items in task and run a search and return the results.
     products_to_return = {'proposal_list' : []}
     
     for a_task in task['task']:
-        products_to_return['proposal_list'].append(__single_service_or_product_search(a_task))
+        products_to_return['proposal_list'].append(__single_service_or_product_search(shop, a_task))
 
     print('----------------------------------------------')
     print('Product search\n')
@@ -307,7 +332,7 @@ def service_or_product_search(task):
     return products_to_return
 
 
-def __single_service_or_product_search(a_task):
+def __single_service_or_product_search(shop, a_task):
     # Run a product search query for a single task a_task.
 
     # Refer https://shopify.dev/docs/api/storefront/latest/queries/products for api fields.
@@ -367,7 +392,7 @@ def __single_service_or_product_search(a_task):
         """
 
     payload = {'query': query}
-    get_products = requests.post(f"https://{config_shopify.myshop_name}.myshopify.com/api/{config_shopify.api_version}/graphql.json", headers=config_shopify.header_values, json=payload)
+    get_products = shop.post_storefront(payload)
     result=json.loads(get_products.content)
     products = result['data']['products']['edges']
 
@@ -431,7 +456,7 @@ def create_offer_dict(single_proposal, product_to_add_to_cart_id, product_quanti
             continue
 
 
-def add_items_to_cart(received_message : Message, timeout: int):
+def add_items_to_cart(shop, received_message : Message, timeout: int):
     # Go through each of the items in received_message.message and add the product-variant to the Shopify cart.
     # https://shopify.dev/docs/api/storefront/latest/mutations/cartcreate
     # The product ID to add to cart is in the variant and part of the message received from the consumer.
@@ -569,7 +594,7 @@ def add_items_to_cart(received_message : Message, timeout: int):
     """
 
     payload = {'query': query_add_to_cart}
-    result = requests.post(f"https://{config_shopify.myshop_name}.myshopify.com/api/{config_shopify.api_version}/graphql.json", headers=config_shopify.header_values, json=payload)
+    result = shop.post_storefront(payload)
     result=json.loads(result.content)
 
     # Now add the cart ID and line item id to the offer to return to the consumer. 
@@ -604,96 +629,7 @@ def get_country_code(country):
     # Future versions will verify and return valid country codes based on country variable.
     return country
 
-def remove_item_from_cart(offer):
-    # Offer was rejected by the consumer or revoked by the supplier. Remove the item from cart.
-    # Remove the line item from the cart.
-
-    cart_id = offer['cart_id']
-    line_item_to_delete = "["
-
-    # Add all line items to a list for deletion.
-    for line_item in offer['offer_list']:
-        lineitem_id = line_item['variants']['line_item']
-        line_item_to_delete = line_item_to_delete + f""" "{lineitem_id}", """
-
-    line_item_to_delete = line_item_to_delete + "]"
-
-    query_delete_item = f"""
-        mutation {{
-            cartLinesRemove(
-                cartId: "{cart_id}",
-                lineIds: {line_item_to_delete}
-                ) {{
-                    cart {{
-                        id
-                        createdAt
-                        updatedAt
-                        lines(first: 10) {{
-                        edges {{
-                            node {{
-                            id
-                            merchandise {{
-                                ... on ProductVariant {{
-                                id
-                                }}
-                            }}
-                            }}
-                        }}
-                        }}
-                        buyerIdentity {{
-                        email,
-                        phone,
-                        deliveryAddressPreferences {{
-                            __typename
-                        }}
-                        preferences {{
-                            delivery {{
-                            deliveryMethod
-                            }}
-                        }}
-                        }}
-                        attributes {{
-                        key
-                        value
-                        }}
-                        # The estimated total cost of all merchandise that the customer will pay at checkout.
-                        cost {{
-                        totalAmount {{
-                            amount
-                            currencyCode
-                        }}
-                        # The estimated amount, before taxes and discounts, for the customer to pay at checkout.
-                        subtotalAmount {{
-                            amount
-                            currencyCode
-                        }}
-                        # The estimated tax amount for the customer to pay at checkout.
-                        totalTaxAmount {{
-                            amount
-                            currencyCode
-                        }}
-                        # The estimated duty amount for the customer to pay at checkout.
-                        totalDutyAmount {{
-                            amount
-                            currencyCode
-                        }}
-                        }}
-                    }}
-                    }}
-                }}
-        """
-
-    payload = {'query': query_delete_item}
-    result = requests.post(f"https://{config_shopify.myshop_name}.myshopify.com/api/{config_shopify.api_version}/graphql.json", headers=config_shopify.header_values, json=payload)
-    result=json.loads(result.content)
-
-    print('-----------------------------------------------\n\n')
-    print('Delete item from cart\n')
-    pprint(result)
-
-    return True
-
-def get_shopify_checkout_url(offer):
+def get_shopify_checkout_url(shop, offer):
     # Will return the shopify URL to the checkout, so that the consumer agent's human owner can manually make the purchase.
     cart_id = offer['cart_id']
     query_checkout_url = f"""
@@ -705,7 +641,7 @@ def get_shopify_checkout_url(offer):
     """
 
     payload = {'query': query_checkout_url}
-    result = requests.post(f"https://{config_shopify.myshop_name}.myshopify.com/api/{config_shopify.api_version}/graphql.json", headers=config_shopify.header_values, json=payload)
+    result = shop.post_storefront(payload)
     result=json.loads(result.content)
 
     print('-----------------------------------------------\n\n')
@@ -721,6 +657,7 @@ def verify_order_created(agent_name, received_message, time_start_manual_purchas
 
     # https://shopify.dev/docs/api/admin-graphql/latest/queries/orders
 
+    shop = shopify_shops.get_shop(agent_name)
     agent_owner_email = received_message.offer['consumer_details']['email']
     now = datetime.now()
     one_day = timedelta(days=1)
@@ -790,7 +727,7 @@ def verify_order_created(agent_name, received_message, time_start_manual_purchas
     """
 
     payload = {'query': order_query}
-    get_orders = requests.post(f"https://{config_shopify.myshop_name}.myshopify.com/admin/api/{config_shopify.api_version_admin}/graphql.json", headers=config_shopify.header_values_ADMIN, json=payload)
+    get_orders = shop.post_admin(payload)
     result=json.loads(get_orders.content)
 
     print('-----------------------------------------------\n\n')
@@ -836,9 +773,11 @@ def complete_and_deliver_order(agent_name, order_message, order_name):
     # Check for fulfillment status each 3 hours until fulfilled.
     wait_for_next_check = 60*60*3
 
+    shop = shopify_shops.get_shop(agent_name)
+
     while True:
 
-        filfillment_status, canceled_at = get_order_filfillment_status(order_name)
+        filfillment_status, canceled_at = get_order_filfillment_status(shop, order_name)
 
         if filfillment_status == 'fulfilled':
             # Order is fulfilled. So let the consumer agent know.
@@ -872,7 +811,7 @@ def complete_and_deliver_order(agent_name, order_message, order_name):
     socontra.close_dialogue(agent_name, order_message)
 
 
-def get_order_filfillment_status(order_name):
+def get_order_filfillment_status(shop, order_name):
     # Will return the filfillment status of the order.
 
     order_query=f"""
@@ -890,7 +829,7 @@ def get_order_filfillment_status(order_name):
     """
 
     payload = {'query': order_query}
-    get_orders = requests.post(f"https://{config_shopify.myshop_name}.myshopify.com/admin/api/{config_shopify.api_version_admin}/graphql.json", headers=config_shopify.header_values_ADMIN, json=payload)
+    get_orders = shop.post_admin(payload)
     result=json.loads(get_orders.content)
 
     print('-----------------------------------------------\n\n')
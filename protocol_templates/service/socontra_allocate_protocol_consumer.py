@@ -1,9 +1,11 @@
 # Socontra template for the 'allocate' protcol, suitable for automated agent-to-agent non-commercial transactions: task allocation.
 # Protocol for the consumer of services.
 
+import threading
 import time
 
 from socontra.socontra import Socontra, Message, Protocol
+from socontra import response_tracker, latency_stats, supplier_scorecard
 
 # Create a Socontra Client for the agent.
 protocol = Protocol()
@@ -33,6 +35,10 @@ def receive_offer(agent_name: str, received_message: Message, message_responding
     # Protocol validation. Messages are only valid if the previous message in the dialogue (message_responding_to) was 'new_task_request'.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['new_task_request']):
         return
+
+    # Record the supplier's response time (for adaptive protocol timeouts) and performance (supplier scorecard).
+    response_time = latency_stats.get_latency_stats(agent_name).observe(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message, response_time)
         
     # Agent response
     print(f'\nOffer to fulfill the task was submitted by  {received_message.sender_name}. The offer is {received_message.offer}\n')
@@ -52,11 +58,17 @@ def reject_task_consumer(agent_name: str, received_message: Message, message_res
     # Protocol validation. Messages are only valid if the previous message in the dialogue (message_responding_to) was 'new_task_request'.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['new_task_request']):
         return
+
+    # Record the supplier's response time (for adaptive protocol timeouts) and performance (supplier scorecard).
+    response_time = latency_stats.get_latency_stats(agent_name).observe(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message, response_time)
     
     # Agent response
     print('\nSupplier rejected to submit an offer to fulfill task ', received_message.task, '. The supplier is ', received_message.sender_name, '. The reason/message is ', received_message.message, '\n')
 
-    # In our example, we just ignore reject_task messages. We do not return this message to the orchestrator (unnecessary).
+    # Return the message to the consumer orchestrator, so that it can count the responses and stop waiting for offers
+    # once every supplier has responded.
+    socontra.agent_return(agent_name, reject_task_consumer, received_message=received_message)
 
 
 @route('request_message', 'service', 'allocate', 'consumer')  
@@ -88,6 +100,10 @@ def cancel_order_consumer(agent_name: str, received_message: Message, message_re
     # Protocol validation
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['accept_offer', 'request_message']):
         return
+
+    # Record the supplier's performance (supplier scorecard).
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).save()
     
     # Agent response
     print('\nOrder was canceled by the supplier ', received_message.sender_name, ' which was ', received_message.order, '. The reason/message is ', received_message.message, '\n')
@@ -105,6 +121,10 @@ def order_complete_consumer(agent_name: str, received_message: Message, message_
     # Protocol validation.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['accept_offer', 'request_message']):
         return
+
+    # Record the supplier's performance (supplier scorecard).
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).save()
     
     # To support protocol control/logic, we can 'close messages' which are no longer valid as we progress through the protocol.
     # We can also socontra.close_agents() if we want to stop a dialogue with a specific agent.
@@ -128,6 +148,10 @@ def order_failed_consumer(agent_name: str, received_message: Message, message_re
     # Protocol validation.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['accept_offer', 'request_message']):
         return
+
+    # Record the supplier's performance (supplier scorecard).
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).save()
     
     # Agent response
     print('\nOrder could not be fulfilled by the supplier ', received_message.sender_name, ' which was ', received_message.order, '. The reason/message is ', received_message.message, '\n')
@@ -144,26 +168,43 @@ def allocate_orchestrator_consumer(agent_name, task, distribution_list, timeout)
     # Consumer endpoints contain socontra.agent_return() to return messages back to this orchestrator to manage.
 
     # Send the task announcement using the 'allocate' protocol.
-    socontra.new_request(agent_name, distribution_list=distribution_list, task=task, proposal=task, invite_offer_timeout=timeout, protocol='allocate')
+    request_send_time = time.time()
+    network_response = socontra.new_request(agent_name, distribution_list=distribution_list, task=task, proposal=task, invite_offer_timeout=timeout, protocol='allocate')
+
+    # Count the responses (offers and reject task messages), to stop waiting once every agent that received the request has responded.
+    responses = response_tracker.create_response_tracker(network_response, distribution_list)
+
+    # Mark the time the request was sent, to record the response times of suppliers (for adaptive protocol timeouts).
+    agent_latency_stats = latency_stats.get_latency_stats(agent_name)
+    agent_latency_stats.mark_sent(responses.dialogue_id, 'new_request', distribution_list=distribution_list, send_time=request_send_time)
 
     # Wait for offers, and evaluate each one. Keep the best offer and reject the worst offers iteratively as they are received.
     start_time = time.time()
     best_offer = None
     best_offer_cost = None
 
-    while True:
+    # Offers are rejected in the background, so that offers received at about the same time are rejected with one batched
+    # request to the Socontra Network (see socontra/control_coalescer.py), and do not hold up receiving other offers.
+    reject_threads = []
+
+    while not responses.all_responded():
         current_time = time.time()
         time_to_wait_for_offers = max(timeout - (current_time - start_time), 0.0)
 
-        # Wait for offers to be received.
-        offer_returned = socontra.expect(agent_name, receive_offer, timeout=time_to_wait_for_offers)
+        # Wait for offers (or reject task messages) to be received.
+        message_type, response_returned = socontra.expect_multiple(agent_name, [receive_offer, reject_task_consumer], timeout=time_to_wait_for_offers)
 
-        if offer_returned == None:
-            # No more offers, and timeout expired.
+        if message_type == None:
+            # No more offers, and timeout expired. Record the suppliers that did not respond (for adaptive protocol timeouts).
+            agent_latency_stats.record_no_response(responses.dialogue_id, 'new_request', *responses.non_responders())
             break
-        else:
-            # Get the offer (message) component of the agent_return dict.
-            offer = offer_returned['received_message']
+
+        # Count the response. Ignore responses to a previous request (a different dialogue), and reject task messages.
+        if not responses.record(response_returned['received_message']) or message_type == 'reject_task_consumer':
+            continue
+
+        # Get the offer (message) component of the agent_return dict.
+        offer = response_returned['received_message']
 
         offer_cost = evaluate_offer_cost(offer)
 
@@ -175,13 +216,22 @@ def allocate_orchestrator_consumer(agent_name, task, distribution_list, timeout)
         # Else, if new received offer is better (lower cost) that the current best offer, reject the current 'best offer' and the
         # new received offer becomes the best offer.
         elif offer_cost < best_offer_cost:
-            socontra.reject_offer(agent_name=agent_name, message_responding_to=best_offer, message='I have cheaper options, thanks anyway')
+            reject_threads.append(reject_offer_in_background(agent_name, best_offer))
             best_offer = offer
             best_offer_cost = offer_cost
 
         # Otherwise, reject the new received offer as it is no better than the current best offer.
         else:
-            socontra.reject_offer(agent_name=agent_name, message_responding_to=offer, message='I have cheaper options, thanks anyway')
+            reject_threads.append(reject_offer_in_background(agent_name, offer))
+
+    # Wait for the offers to be rejected.
+    for reject_thread in reject_threads:
+        reject_thread.join()
+
+    # Store the supplier response times and scorecards.
+    agent_latency_stats.forget_dialogue(responses.dialogue_id)
+    agent_latency_stats.save()
+    supplier_scorecard.get_supplier_scorecard(agent_name).save()
 
     # We now have the best offer from a supplier agent, which can be accepted.
     socontra.accept_offer(agent_name, best_offer)
@@ -209,6 +259,8 @@ def allocate_orchestrator_consumer(agent_name, task, distribution_list, timeout)
             if order_delivered_successfully(order_message):
                 # Sign-off on the order completion.
                 socontra.order_confirm_success(agent_name, message='Thank you, much appreciated.', message_responding_to=order_message)
+                supplier_scorecard.get_supplier_scorecard(agent_name).record_event(order_message.sender_name, 'confirm_success')
+                supplier_scorecard.get_supplier_scorecard(agent_name).save()
 
                 # Can now check if the task was successfully achieved by the completed order.
                 # I.e. did the order actually achieve the task that it was intended to fulfill.
@@ -218,6 +270,8 @@ def allocate_orchestrator_consumer(agent_name, task, distribution_list, timeout)
             else:
                 # Let the supplier agent know that the order not completed/delivered successfully as promised.
                 socontra.order_confirm_fail(agent_name, message='Thank you, much appreciated.', message_responding_to=order_message)
+                supplier_scorecard.get_supplier_scorecard(agent_name).record_event(order_message.sender_name, 'confirm_fail')
+                supplier_scorecard.get_supplier_scorecard(agent_name).save()
 
                 # Perform any recovery tasks for unsuccessful exit, such as replanning, or request the same or new task.
                 pass
@@ -229,6 +283,14 @@ def allocate_orchestrator_consumer(agent_name, task, distribution_list, timeout)
     # End the dialogue for this process and return.
     socontra.close_dialogue(agent_name, order_message)
         
+def reject_offer_in_background(agent_name, offer):
+    # Reject the offer in a thread. Will return the thread.
+    reject_thread = threading.Thread(target=socontra.reject_offer, kwargs={'agent_name': agent_name, 'message_responding_to': offer, 
+                                                                           'message': 'I have cheaper options, thanks anyway'})
+    reject_thread.start()
+    return reject_thread
+
+
 def evaluate_offer_cost(offer):
     # Function should evaluate the cost of the offer so that the agent can compare and select the best offer.
     # The cost in this example is an int in offer.message.
@@ -1,11 +1,12 @@
 # Socontra template for the 'transact' protocol, suitable for automated agent-to-agent commercial transactions.
 # Protocol for the consumer of services.
 
+import threading
 import time
 
-from bisect import insort
-
 from socontra.socontra import Socontra, Message, Protocol
+from socontra import proposal_ranking, response_tracker, latency_stats, supplier_scorecard
+import config
 
 # Create a Socontra Client for the agent.
 protocol = Protocol()
@@ -16,6 +17,12 @@ def route(*args):
         return f
     return inner_decorator
 
+# Invite offers cut off by the hedge window, by (agent_name, message_id of the invite offer), with the proposal invited.
+# Another offer was selected, so offers received for these invites are rejected (see hedged_invite_offer).
+global hedged_out_invites
+hedged_out_invites = {}
+hedged_out_invites_lock = threading.Lock()
+
 
 # ----- SOCONTRA PROTOCOL: 'transact' - allocation of a task to agents  -------------------------------------
 
@@ -31,6 +38,10 @@ def receive_proposal(agent_name: str, received_message: Message, message_respond
     # Protocol validation. Messages are only valid if the previous message in the dialogue (message_responding_to) was 'new_task_request'.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['new_task_request']):
         return
+
+    # Record the supplier's response time (for adaptive protocol timeouts) and performance (supplier scorecard).
+    response_time = latency_stats.get_latency_stats(agent_name).observe(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message, response_time)
     
     print(f'\nProposal to fulfill the task was submitted by  {received_message.sender_name}. The proposal is {received_message.proposal}\n')
 
@@ -49,10 +60,16 @@ def reject_task_consumer(agent_name: str, received_message: Message, message_res
     # Protocol validation. Messages are only valid if the previous message in the dialogue (message_responding_to) was 'new_task_request'.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['new_task_request']):
         return
+
+    # Record the supplier's response time (for adaptive protocol timeouts) and performance (supplier scorecard).
+    response_time = latency_stats.get_latency_stats(agent_name).observe(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message, response_time)
     
     print('\nSupplier rejected to submit an offer to fulfill task ', received_message.task, '. The supplier is ', received_message.sender_name, '. The reason/message is ', received_message.message, '\n')
 
-    # In our example, we just ignore reject_task messages. We do not return this message to the orchestrator (unnecessary).
+    # Return the message to the consumer orchestrator, so that it can count the responses and stop waiting for proposals
+    # once every supplier has responded.
+    socontra.agent_return(agent_name, reject_task_consumer, received_message=received_message)
 
 
 @route('offer', 'service', 'transact', 'consumer')  
@@ -70,15 +87,24 @@ def receive_offer(agent_name: str, received_message: Message, message_responding
     # Protocol validation.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['invite_offer']):
         return
+
+    # Record the supplier's response time (for adaptive protocol timeouts) and performance (supplier scorecard).
+    response_time = latency_stats.get_latency_stats(agent_name).observe(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message, response_time)
         
     print('\nOffer to fulfill the task was submitted by  ', received_message.sender_name, '. The offer is ', received_message.offer, 
           ' A response is required by', socontra.get_deadline(received_message.offer_timeout), '\n')
 
+    if hedged_out_invite(agent_name, message_responding_to):
+        # Offer for an invite offer cut off by the hedge window, and another offer was selected (see hedged_invite_offer).
+        socontra.reject_offer(agent_name, message_responding_to=received_message)
+        return
+
     # In this example, we return the response to the main consumer orchestrator to manage,
     # because if the offer is not accepted by the consumer, via either socontra.reject_offer(), socontra.task_withdrawn()
     # or NoComms, or the supplier sends a socontra.revoke_offer(), then the consumer agent needs to go back to 
     # the 'proposal' stage to select another proposal option ('invite_offer') to achieve the task.
-    socontra.agent_return(agent_name, receive_offer, received_message=received_message)
+    socontra.agent_return(agent_name, receive_offer, received_message=received_message, message_responding_to=message_responding_to)
     
 
 @route('reject_invite_offer', 'service', 'transact', 'consumer') 
@@ -92,11 +118,19 @@ def reject_invite_offer_consumer(agent_name: str, received_message: Message, mes
     # Protocol validation.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['invite_offer']):
         return
+
+    # Record the supplier's response time (for adaptive protocol timeouts) and performance (supplier scorecard).
+    response_time = latency_stats.get_latency_stats(agent_name).observe(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message, response_time)
     
     print('\nInvite offer for a proposal was rejected by  ', received_message.sender_name, '. The proposal was ', received_message.proposal, '\n')
 
+    if hedged_out_invite(agent_name, message_responding_to):
+        # Response to an invite offer cut off by the hedge window (see hedged_invite_offer). Nothing more to do.
+        return
+
     # Return the value so that the main consumer orchestrator can respond appropriately (select an alternative proposal).
-    socontra.agent_return(agent_name, reject_invite_offer_consumer, received_message=received_message)
+    socontra.agent_return(agent_name, reject_invite_offer_consumer, received_message=received_message, message_responding_to=message_responding_to)
 
 
 @route('payment_confirmed', 'service', 'transact', 'consumer')  
@@ -111,6 +145,10 @@ def payment_confirmed_consumer(agent_name: str, received_message: Message, messa
     # Protocol validation.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['accept_offer']):
         return
+
+    # Record the supplier's response time (for adaptive protocol timeouts) and performance (supplier scorecard).
+    response_time = latency_stats.get_latency_stats(agent_name).observe(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message, response_time)
     
     # To support protocol control/logic, we can 'close messages' which are no longer valid as we progress through the protocol.
     # We can also socontra.close_agents() if we want to stop a dialogue with a specific agent.
@@ -136,6 +174,10 @@ def payment_error_consumer(agent_name: str, received_message: Message, message_r
     # Protocol validation.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['accept_offer']):
         return
+
+    # Record the supplier's response time (for adaptive protocol timeouts) and performance (supplier scorecard).
+    response_time = latency_stats.get_latency_stats(agent_name).observe(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message, response_time)
     
     print('\nPayment for order unsuccessful from ', received_message.sender_name, ' because of ', received_message.message,'. Purchase order failed, which was ', 
           received_message.offer, ' requires a resolution response by ', socontra.get_deadline(received_message.proposal_timeout), '\n')
@@ -190,6 +232,10 @@ def cancel_order_consumer(agent_name: str, received_message: Message, message_re
     # Protocol validation.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['accept_offer', 'request_message']):
         return
+
+    # Record the supplier's performance (supplier scorecard).
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).save()
     
     print('\nOrder was canceled by the supplier ', received_message.sender_name, ' which was ', received_message.order, '. The reason is ', received_message.message, '\n')
 
@@ -208,6 +254,10 @@ def order_complete_consumer(agent_name: str, received_message: Message, message_
     # Protocol validation.
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['accept_offer', 'request_message']):
         return
+
+    # Record the supplier's performance (supplier scorecard).
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).save()
     
     # To support protocol control/logic, we can 'close messages' which are no longer valid as we progress through the protocol.
     # We can also socontra.close_agents() if we want to stop a dialogue with a specific agent.
@@ -230,6 +280,10 @@ def order_failed_consumer(agent_name: str, received_message: Message, message_re
     # Protocol validation
     if not socontra.protocol_validation(agent_name, received_message, message_responding_to, valid_message_types=['accept_offer', 'request_message']):
         return
+
+    # Record the supplier's performance (supplier scorecard).
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_message(received_message)
+    supplier_scorecard.get_supplier_scorecard(agent_name).save()
     
     print('\nOrder could not be fulfilled by the supplier ', received_message.sender_name, ' which was ', received_message.order, '. The reason is ', received_message.message, '\n')
 
@@ -239,18 +293,39 @@ def order_failed_consumer(agent_name: str, received_message: Message, message_re
 
 # CONSUMER ORCHESTRATOR FOR TRANSACT PROTOCOL
 
-def transact_orchestrator_consumer(agent_name, task, distribution_list, proposal_timeout, invite_offer_timeout):
+def transact_orchestrator_consumer(agent_name, task, distribution_list, proposal_timeout, invite_offer_timeout, 
+                                   top_k=None, target_cost=None, target_count=None, hedge_k=None, hedge_window=2):
     # Example orchestrator for the transact protocol.
     # Consumer endpoints contain socontra.agent_return() to return messages back to this orchestrator to manage.
+    # Optional early stop policy for the search and evaluation stage (see socontra/proposal_ranking.py):
+    #   top_k - only keep the top_k best proposals.
+    #   target_cost - stop waiting for proposals once target_count proposals (default top_k, or 1) have a cost at or below target_cost.
+    # The consumer also stops waiting once every agent that received the request has responded (see socontra/response_tracker.py).
+    # Optional hedged commitment for the selection and commitment stage:
+    #   hedge_k - send invite offers to the top hedge_k proposals at once, select the best offer received within hedge_window
+    #             seconds of the first offer, and reject the other offers.
 
     # Send the task announcement using the 'transact' protocol.
+    request_send_time = time.time()
     network_response = socontra.new_request(agent_name, distribution_list=distribution_list, task=task, proposal_timeout=proposal_timeout, protocol='transact')
 
     ## SEARCH AND EVALUATION STAGE. 
-    ordered_list_of_proposals = search_and_evaluation(agent_name, proposal_timeout)
+    ranked_proposals = proposal_ranking.ProposalRanking(top_k=top_k, target_cost=target_cost, target_count=target_count)
+    responses = response_tracker.create_response_tracker(network_response, distribution_list)
+
+    # Mark the time the request was sent, to record the response times of suppliers (for adaptive protocol timeouts).
+    agent_latency_stats = latency_stats.get_latency_stats(agent_name)
+    agent_latency_stats.mark_sent(responses.dialogue_id, 'new_request', distribution_list=distribution_list, send_time=request_send_time)
+
+    ranked_proposals = search_and_evaluation(agent_name, proposal_timeout, ranked_proposals, responses)
 
     ## SELECTION AND COMMITMENT STAGE - CREATE AN ORDER.
-    order_confirmed = selection_and_commitment(agent_name, ordered_list_of_proposals, invite_offer_timeout, network_response.message)
+    order_confirmed = selection_and_commitment(agent_name, ranked_proposals, invite_offer_timeout, network_response.message, hedge_k, hedge_window)
+
+    # Store the supplier response times and scorecards.
+    agent_latency_stats.forget_dialogue(responses.dialogue_id)
+    agent_latency_stats.save()
+    supplier_scorecard.get_supplier_scorecard(agent_name).save()
 
     ## ORDER MONITORING/TRACKING AND DELIVERY STAGE.
     if order_confirmed:
@@ -261,62 +336,61 @@ def transact_orchestrator_consumer(agent_name, task, distribution_list, proposal
         return False
 
 
-def search_and_evaluation(agent_name, proposal_timeout):
+def search_and_evaluation(agent_name, proposal_timeout, ranked_proposals, responses):
     ## SEARCH AND EVALUATION STAGE.
 
-    # Wait for proposals, and evaluate each one. Store proposals in an ordered list ordered by cost/quality.
+    # Wait for proposals, and evaluate each one. Store proposals in ranked_proposals, ordered by cost/quality.
     start_time = time.time()
-    ordered_list_of_proposals = []
-    counter = 1
 
-    while True:
+    while not ranked_proposals.should_stop() and not responses.all_responded():
         current_time = time.time()
         time_to_wait_for_proposals = max(proposal_timeout - (current_time - start_time), 0.0)
 
-        # Wait for offers to be received.
-        proposal_returned = socontra.expect(agent_name, receive_proposal, timeout=time_to_wait_for_proposals)
+        # Wait for proposals (or reject task messages) to be received.
+        message_type, response_returned = socontra.expect_multiple(agent_name, [receive_proposal, reject_task_consumer], timeout=time_to_wait_for_proposals)
 
-        if proposal_returned == None:
-            # No more offers, and timeout expired.
+        if message_type == None:
+            # No more proposals, and timeout expired. Record the suppliers that did not respond (for adaptive protocol timeouts).
+            latency_stats.get_latency_stats(agent_name).record_no_response(responses.dialogue_id, 'new_request', *responses.non_responders())
             break
-        else:
-            # Get the offer (message) component of the agent_return dict.
-            proposal = proposal_returned['received_message']
 
-        counter +=1
+        # Count the response. Ignore responses to a previous request (a different dialogue), and reject task messages.
+        if not responses.record(response_returned['received_message']) or message_type == 'reject_task_consumer':
+            continue
+
+        # Get the proposal (message) component of the agent_return dict.
+        proposal = response_returned['received_message']
+
+        # Skip proposals from chronically slow suppliers (see config.py), to avoid wasted invite offer rounds.
+        if config.skip_slow_suppliers and supplier_scorecard.get_supplier_scorecard(agent_name).should_skip(proposal.sender_name):
+            continue
 
         proposal_cost = evaluate_proposal_cost(proposal)
 
-        # Add the proposal to the ordered list of proposals as a tuple (proposal_cost, proposal).
-        # The lowest cost (best) proposal will be placed at the head of the list.
-        insort(ordered_list_of_proposals, (proposal_cost, counter, proposal))
+        # Add the proposal to the ranked proposals with its cost. The lowest cost (best) proposal will be popped first.
+        ranked_proposals.add(proposal_cost, proposal)
 
-    return ordered_list_of_proposals
+    return ranked_proposals
 
 
-def selection_and_commitment(agent_name, ordered_list_of_proposals, invite_offer_timeout, original_request_message):
+def selection_and_commitment(agent_name, ranked_proposals, invite_offer_timeout, original_request_message, hedge_k=None, hedge_window=2):
     ## SELECTION AND COMMITMENT STAGE - CREATE AN ORDER.
 
     order_confirmed = False
 
-    # Now that we have an ordered list of proposals, lets select the top one, and if that fails, the next best one, and so on.
-    while ordered_list_of_proposals:
-        
-        # Best proposal is at the head of the ordered list. 
-        best_proposal = ordered_list_of_proposals.pop(0)[2]
-
-        # Send an invite offer (aka 'add item to cart') message to allow the supplier to send a formal binding offer for the proposal.
-        socontra.invite_offer(agent_name, message_responding_to=best_proposal, invite_offer_timeout=invite_offer_timeout)
+    # Now that we have ranked proposals, lets select the top one, and if that fails, the next best one, and so on.
+    # With hedging (hedge_k), invite offers from the top hedge_k proposals at once and select the best offer received.
+    while ranked_proposals:
 
-        # Wait for the response from the supplier.
-        message_type, invite_offer_response = socontra.expect_multiple(agent_name, [receive_offer, reject_invite_offer_consumer], timeout=invite_offer_timeout)
+        if hedge_k:
+            offer = hedged_invite_offer(agent_name, ranked_proposals, invite_offer_timeout, hedge_k, hedge_window)
+        else:
+            offer = single_invite_offer(agent_name, ranked_proposals, invite_offer_timeout)
 
-        # If the supplier does not respond or rejects the invite offer, then try the next proposal.
-        if message_type == None or message_type == 'reject_invite_offer_consumer':
+        # If no supplier responded or all rejected the invite offer, then try the next proposal(s).
+        if offer is None:
             continue
 
-        offer = invite_offer_response['received_message']
-
         # If payment is required, get payment details and human_authorization if required.
         if offer.payment_required:
             
@@ -343,6 +417,8 @@ def selection_and_commitment(agent_name, ordered_list_of_proposals, invite_offer
             socontra.expect(agent_name, revoke_offer_consumer, timeout=0) is None:
 
             # Accept the offer.
+            latency_stats.get_latency_stats(agent_name).mark_sent(offer.dialogue_id, 'accept_offer', offer.sender_name)
+            supplier_scorecard.get_supplier_scorecard(agent_name).record_event(offer.sender_name, 'accept_offer')
             socontra.accept_offer(agent_name, message_responding_to=offer, payment=payment, human_authorization=human_authorization)
 
             # Wait for payment confirmation if payment required.
@@ -371,6 +447,191 @@ def selection_and_commitment(agent_name, ordered_list_of_proposals, invite_offer
 
     return True
 
+
+def hedged_invite_offer(agent_name, ranked_proposals, invite_offer_timeout, hedge_k, hedge_window):
+    # Hedged commitment. Send an invite offer to the top hedge_k proposals at once, and wait for their offers.
+    # Once the first offer is received, wait at most hedge_window seconds for the other offers (and never longer than
+    # invite_offer_timeout), then select the offer from the best (lowest cost) proposal and reject the other offers.
+    # Will return the selected offer, or None if no offers were received.
+
+    # Invite offers from the top proposals. Suppliers are identified by the agent that sent the proposal.
+    # Other proposals from a supplier that is already invited are put back in the ranking for a later round.
+    invited_proposals = {}
+    other_proposals_from_invited = []
+    while ranked_proposals and len(invited_proposals) < hedge_k:
+        proposal_tuple = ranked_proposals.pop_best()
+        if proposal_tuple[2].sender_name in invited_proposals:
+            other_proposals_from_invited.append(proposal_tuple)
+        else:
+            invited_proposals[proposal_tuple[2].sender_name] = proposal_tuple
+    for proposal_tuple in other_proposals_from_invited:
+        ranked_proposals.push_back(proposal_tuple)
+
+    # Send the invite offers in parallel, so that hedge_k slow requests to the Socontra Network do not add up.
+    # The message_id of each supplier's invite offer is kept, so that responses are matched to this invite offer rather
+    # than to an earlier invite offer to the same supplier in the dialogue.
+    invite_message_ids = {}
+    def send_invite_offer(proposal_tuple):
+        network_response = socontra.invite_offer(agent_name, proposal_tuple[2], message=create_invite_offer_message(agent_name, proposal_tuple),
+                                                 invite_offer_timeout=invite_offer_timeout)
+        invite_message_ids[proposal_tuple[2].sender_name] = network_response.message.message_id if network_response.message else None
+
+    invite_threads = []
+    for proposal_tuple in invited_proposals.values():
+        latency_stats.get_latency_stats(agent_name).mark_sent(proposal_tuple[2].dialogue_id, 'invite_offer', proposal_tuple[2].sender_name)
+        supplier_scorecard.get_supplier_scorecard(agent_name).record_event(proposal_tuple[2].sender_name, 'invite_offer')
+        invite_thread = threading.Thread(target=send_invite_offer, args=(proposal_tuple,))
+        invite_thread.start()
+        invite_threads.append(invite_thread)
+    for invite_thread in invite_threads:
+        invite_thread.join()
+
+    # Wait for the responses from the suppliers.
+    invite_deadline = time.time() + invite_offer_timeout
+    deadline = invite_deadline
+    responded = set()
+    offers_received = []
+    while len(responded) < len(invited_proposals):
+        time_to_wait = deadline - time.time()
+        if time_to_wait <= 0:
+            break
+
+        message_type, invite_offer_response = socontra.expect_multiple(agent_name, [receive_offer, reject_invite_offer_consumer], timeout=time_to_wait)
+        if message_type == None:
+            break
+
+        response_message = invite_offer_response['received_message']
+        if response_message.sender_name not in invited_proposals or response_message.sender_name in responded or \
+            not responds_to_invite(invite_offer_response, invite_message_ids.get(response_message.sender_name)):
+            # Late response to an invite offer from a previous hedge. That proposal was not selected, so reject the offer.
+            if message_type == 'receive_offer':
+                socontra.reject_offer(agent_name, message_responding_to=response_message)
+            continue
+
+        responded.add(response_message.sender_name)
+        if message_type == 'receive_offer':
+            proposal_tuple = invited_proposals[response_message.sender_name]
+            offers_received.append((proposal_tuple[0], proposal_tuple[1], response_message))
+            if len(offers_received) == 1:
+                # First offer received. Only wait a short time for offers from better proposals.
+                deadline = min(deadline, time.time() + hedge_window)
+
+    not_responded = [invited_proposals[supplier_name][2] for supplier_name in invited_proposals if supplier_name not in responded]
+    if not offers_received:
+        # Waited the full invite offer timeout. Record suppliers that did not respond in time.
+        for proposal in not_responded:
+            supplier_scorecard.get_supplier_scorecard(agent_name).record_event(proposal.sender_name, 'invite_offer_no_response')
+            latency_stats.get_latency_stats(agent_name).record_no_response(proposal.dialogue_id, 'invite_offer', [proposal.sender_name])
+        return None
+
+    # Suppliers cut off by the hedge window can still respond until the invite offer timeout. Their offers are rejected
+    # by receive_offer, and they are only recorded as not responding once the invite offer timeout has passed.
+    late_offers = hedge_out_invites(agent_name, not_responded, invite_message_ids, invite_deadline)
+
+    # Select the offer from the best proposal, and reject the rest (and any offers already received from suppliers cut off
+    # by the hedge window). Reject the offers at the same time, so that the reject_offer messages are sent to the Socontra
+    # Network in one batch (see socontra/control_coalescer.py).
+    offers_received.sort(key=lambda offer_tuple: (offer_tuple[0], offer_tuple[1]))
+    other_offers = [other_offer for _, _, other_offer in offers_received[1:]] + late_offers
+    reject_threads = [threading.Thread(target=socontra.reject_offer, args=(agent_name, other_offer)) for other_offer in other_offers]
+    for reject_thread in reject_threads:
+        reject_thread.start()
+    for reject_thread in reject_threads:
+        reject_thread.join()
+    
+    return offers_received[0][2]
+
+
+def hedge_out_invites(agent_name, proposals, invite_message_ids, invite_deadline):
+    # Called when an offer is selected before every invited supplier (proposals) has responded. Responses to these invite
+    # offers (invite_message_ids by supplier) received until invite_deadline are handled by the endpoints (hedged_out_invite),
+    # and suppliers that have still not responded by then are recorded as not responding. Will return the offers already
+    # received (and not yet handled) from these suppliers, or from earlier rounds, which need to be rejected.
+    hedged_out_keys = []
+    with hedged_out_invites_lock:
+        for proposal in proposals:
+            if invite_message_ids.get(proposal.sender_name) is not None:
+                hedged_out_keys.append((agent_name, invite_message_ids[proposal.sender_name]))
+                hedged_out_invites[hedged_out_keys[-1]] = proposal
+
+    # Responses received before the invites were recorded above are still waiting to be handled by this orchestrator.
+    late_offers = []
+    for endpoint in [receive_offer, reject_invite_offer_consumer]:
+        response_returned = socontra.expect(agent_name, endpoint, timeout=0)
+        while response_returned != None:
+            hedged_out_invite(agent_name, response_returned.get('message_responding_to'))
+            if endpoint == receive_offer:
+                late_offers.append(response_returned['received_message'])
+            response_returned = socontra.expect(agent_name, endpoint, timeout=0)
+
+    if hedged_out_keys:
+        no_response_timer = threading.Timer(max(invite_deadline - time.time(), 0.0), record_hedged_out_no_response, args=(hedged_out_keys,))
+        no_response_timer.daemon = True
+        no_response_timer.start()
+    return late_offers
+
+
+def hedged_out_invite(agent_name, message_responding_to):
+    # Will return True if message_responding_to (of a received message) is an invite offer cut off by the hedge window (and
+    # forgets the invite).
+    if message_responding_to is None or message_responding_to.message_id is None:
+        return False
+    with hedged_out_invites_lock:
+        return hedged_out_invites.pop((agent_name, message_responding_to.message_id), None) is not None
+
+
+def responds_to_invite(response_returned, invite_message_id):
+    # True if the response returned by an endpoint is a response to the invite offer with invite_message_id (or if either
+    # message_id is not known).
+    message_responding_to = response_returned.get('message_responding_to')
+    if invite_message_id is None or message_responding_to is None or message_responding_to.message_id is None:
+        return True
+    return message_responding_to.message_id == invite_message_id
+
+
+def record_hedged_out_no_response(hedged_out_keys):
+    # The invite offer timeout has passed. Record suppliers cut off by the hedge window that never responded.
+    for agent_name, invite_message_id in hedged_out_keys:
+        with hedged_out_invites_lock:
+            proposal = hedged_out_invites.pop((agent_name, invite_message_id), None)
+        if proposal is not None:
+            supplier_scorecard.get_supplier_scorecard(agent_name).record_event(proposal.sender_name, 'invite_offer_no_response')
+            latency_stats.get_latency_stats(agent_name).record_no_response(proposal.dialogue_id, 'invite_offer', [proposal.sender_name])
+
+
+def single_invite_offer(agent_name, ranked_proposals, invite_offer_timeout):
+    # Send an invite offer to the best proposal, and wait for the offer. Will return the offer, or None if the supplier
+    # does not respond or rejects the invite offer.
+
+    # Best proposal is popped from the ranked proposals as a tuple (proposal_cost, counter, proposal, ...). 
+    best_proposal_tuple = ranked_proposals.pop_best()
+    best_proposal = best_proposal_tuple[2]
+
+    # Send an invite offer (aka 'add item to cart') message to allow the supplier to send a formal binding offer for the proposal.
+    latency_stats.get_latency_stats(agent_name).mark_sent(best_proposal.dialogue_id, 'invite_offer', best_proposal.sender_name)
+    supplier_scorecard.get_supplier_scorecard(agent_name).record_event(best_proposal.sender_name, 'invite_offer')
+    socontra.invite_offer(agent_name, message=create_invite_offer_message(agent_name, best_proposal_tuple), 
+                          message_responding_to=best_proposal, invite_offer_timeout=invite_offer_timeout)
+
+    # Wait for the response from the supplier.
+    message_type, invite_offer_response = socontra.expect_multiple(agent_name, [receive_offer, reject_invite_offer_consumer], timeout=invite_offer_timeout)
+
+    # If the supplier does not respond or rejects the invite offer, then try the next proposal.
+    if message_type == None:
+        supplier_scorecard.get_supplier_scorecard(agent_name).record_event(best_proposal.sender_name, 'invite_offer_no_response')
+        latency_stats.get_latency_stats(agent_name).record_no_response(best_proposal.dialogue_id, 'invite_offer', [best_proposal.sender_name])
+        return None
+    elif message_type == 'reject_invite_offer_consumer':
+        return None
+
+    return invite_offer_response['received_message']
+
+
+def create_invite_offer_message(agent_name, proposal_tuple):
+    # Message to send with the invite offer for the proposal. proposal_tuple is (proposal_cost, counter, proposal).
+    # No message is required in this example.
+    return None
+
 def execution_monitoring_and_delivery(agent_name):
     ## ORDER MONITORING/TRACKING AND DELIVERY STAGE.
 
@@ -397,6 +658,8 @@ def execution_monitoring_and_delivery(agent_name):
             if order_delivered_successfully(order_message):
                 # Sign-off on the order completion.
                 socontra.order_confirm_success(agent_name, message='Thank you, much appreciated.', message_responding_to=order_message)
+                supplier_scorecard.get_supplier_scorecard(agent_name).record_event(order_message.sender_name, 'confirm_success')
+                supplier_scorecard.get_supplier_scorecard(agent_name).save()
 
                 # Perform any finalization or wrap up tasks and successfully exit.
                 return successful_exit(agent_name, order_message)
@@ -404,6 +667,8 @@ def execution_monitoring_and_delivery(agent_name):
             else:
                 # Let the supplier agent know that the order not completed/delivered successfully as promised.
                 socontra.order_confirm_fail(agent_name, message='You multiplied the numbers rather than added them.', message_responding_to=order_message)
+                supplier_scorecard.get_supplier_scorecard(agent_name).record_event(order_message.sender_name, 'confirm_fail')
+                supplier_scorecard.get_supplier_scorecard(agent_name).save()
                 return unsuccessful_exit(agent_name, order_message)
         
         # Ignore other messages for this task.
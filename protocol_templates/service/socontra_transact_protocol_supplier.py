@@ -91,20 +91,23 @@ def receive_invite_offer(agent_name: str, received_message: Message, message_res
 
     if offer:
         # Submit the offer to the consumer. Assume payment and human authorization for the purchase is required.
-        socontra.submit_offer(agent_name, offer=offer, message_responding_to=received_message, 
-                              offer_timeout=timeout, payment_required = True, human_authorization_required = True)
+        # The offer is sent by the agent's outbound queue so that this endpoint returns without waiting for the Socontra Network.
+        socontra.send_async(agent_name, 'submit_offer', offer=offer, message_responding_to=received_message, 
+                            offer_timeout=timeout, payment_required = True, human_authorization_required = True)
 
         # If the situation changes, can revoke the offer ('remove item from cart) with the below commands.
-        # Note need to pass in the response message returned from the Socontra Network from command socontra.submit_offer().
+        # Note need to pass in the response message returned from the Socontra Network from command socontra.submit_offer()
+        # (future.result().message for the future returned by socontra.send_async()).
         # socontra.revoke_offer(agent_name, offer=offer, message_responding_to=received_message)
         # remove_item_from_cart(received_message.offer)
     else:
         # Offer is no longer available.
         # Out of courtesy, can reject the invite offer so that the consumer does not have to wait for expiry to select another proposal.
-        socontra.reject_invite_offer(agent_name, message_responding_to=received_message)
+        # Sends for the same dialogue are sent in order, so the dialogue is closed after the invite offer is rejected.
+        socontra.send_async(agent_name, 'reject_invite_offer', message_responding_to=received_message)
         
         # End dialogue.
-        socontra.close_dialogue(agent_name, received_message)
+        socontra.send_async(agent_name, 'close_dialogue', received_message)
 
 
 @route('accept_offer', 'service', 'transact', 'supplier')  
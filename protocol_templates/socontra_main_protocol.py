@@ -167,6 +167,13 @@ def general_errors(agent_name: str, error_message: str, message_sent: Message):
     # Will receive errors for bad messages sent for this protocol.
     print('A general error occured by a received message, from  agent ', message_sent.sender_name, ' error is ', error_message, ' relating to message ', message_sent.contents)
 
+# Messages received after their deadline (proposal_timeout, invite_offer_timeout, offer_timeout) has passed are not routed to 
+# their protocol endpoint, as the sender has stopped waiting for the response. They are funneled to this endpoint instead.
+@route('expired_message') 
+# -> response: N/A
+def expired_message(agent_name: str, message: Message):    
+    print(f'{agent_name} received {message.message_type} message from {message.sender_name} after its deadline. Message was not processed.')
+
 
 
 def get_human_user_payment_data(agent_name):
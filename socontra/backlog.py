@@ -0,0 +1,160 @@
+# Backlog catch-up for agents that connect with clear_backlog=False. Without it, the Socontra Network replays every message
+# received while the agent was offline as separate events on the message stream, and each is routed like live traffic -
+# including requests whose deadline has passed and offers for dialogues that were closed while the agent was offline.
+# With config.backlog_catch_up, before the agent connects to its message stream:
+#   1. The backlog is fetched in pages of config.backlog_page_size from the Socontra Network's backlog endpoint. Each page
+#      is decoded in one go by the JSON codec (socontra/codec.py). Each request has the cursor of the previous page, so
+#      the Socontra Network can drop the messages that have been fetched.
+#   2. Messages already received are dropped (socontra/message_dedupe.py), and recorded, so that copies replayed on the
+#      stream are dropped too.
+#   3. Messages superseded by a later message in the backlog are dropped, e.g. a new_task_request or invite_offer when
+#      the task was withdrawn, or an offer that was revoked (see superseded_message_types).
+#   4. Messages whose deadline has passed are routed to the expired_message endpoint only (socontra/deadline.py).
+#   5. The remaining messages are routed to their endpoints by a pool of config.backlog_dispatch_workers threads.
+#      Messages for the same dialogue are routed one at a time, in the order they were received.
+# The agent then connects to its message stream for live messages. If the Socontra Network does not have the backlog
+# endpoint (404 or 405), the backlog is replayed on the message stream as before (still deduplicated, and with expired
+# messages dropped).
+
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from socontra.comms import send_auth_message, agent_db
+from socontra.message_dedupe import is_duplicate_message
+from socontra.deadline import message_expired
+import config
+
+
+backlog_path = '/agent_message/backlog/'
+
+# Message types that supersede earlier messages in the same dialogue from the same sender, and the message types they supersede.
+superseded_message_types = {
+    'task_withdrawn': {'new_task_request', 'invite_offer', 'request_message'},
+    'revoke_offer': {'offer'},
+}
+
+# Socontra Networks (url:port) that do not have the backlog endpoint.
+backlog_endpoint_unsupported = set()
+
+# Backlog catch-up metrics for each agent (most recent catch-up).
+global catch_up_stats
+catch_up_stats = {}
+catch_up_stats_lock = threading.Lock()
+
+
+def fetch_backlog(agent_name: str):
+    # Will return (list of message envelopes in the backlog, True if the whole backlog was fetched), or None if the Socontra
+    # Network does not have the backlog endpoint. An envelope is the same as an event on the message stream:
+    # {'message': protocol message, 'message_category': ..., 'message_type_override': ...}.
+    network = agent_db(agent_name).socontra_network_urlport
+    if network in backlog_endpoint_unsupported:
+        return None
+
+    envelopes = []
+    cursor = None
+    while True:
+        response = send_auth_message(agent_name, {'agent_name': agent_name, 'page_size': config.backlog_page_size, 'after': cursor},
+                                     backlog_path, 'GET')
+        if response.status_code in [404, 405] and cursor is None:
+            backlog_endpoint_unsupported.add(network)
+            return None
+        if not response.success or type(response.http_response) != dict:
+            # Messages not fetched stay in the backlog, and are replayed on the message stream.
+            print(f'Could not fetch the backlog for agent {agent_name}. The rest of the backlog will be received on the message stream. Response: {response.contents}')
+            return envelopes, False
+
+        page = response.http_response.get('messages') or []
+        envelopes.extend(page)
+        cursor = response.http_response.get('next')
+        if cursor is None or not page:
+            return envelopes, True
+
+
+def collapse_backlog(agent_name: str, envelopes: list, stats: dict):
+    # Will return (envelopes to route, expired envelopes), in the order they were received. Duplicate and superseded
+    # messages are dropped. Counts are added to stats.
+    remaining = []
+    for envelope in envelopes:
+        if is_duplicate_message(agent_name, envelope['message']):
+            stats['duplicates'] += 1
+        else:
+            remaining.append(envelope)
+
+    # Find superseded messages, from the most recent message back.
+    superseded = set()
+    not_superseded = []
+    for envelope in reversed(remaining):
+        message = envelope['message']
+        message_type = envelope.get('message_type_override') or message.get('message_type')
+        key = (message.get('dialogue_id'), message.get('sender_name'))
+        if (key, message_type) in superseded:
+            stats['superseded'] += 1
+            continue
+        for superseded_type in superseded_message_types.get(message_type, ()):
+            superseded.add((key, superseded_type))
+        not_superseded.append(envelope)
+    not_superseded.reverse()
+
+    to_route, expired = [], []
+    for envelope in not_superseded:
+        if message_expired(agent_name, envelope['message'], envelope.get('message_type_override')):
+            expired.append(envelope)
+        else:
+            to_route.append(envelope)
+    stats['expired'] += len(expired)
+    return to_route, expired
+
+
+def dispatch_backlog(agent_name: str, envelopes: list, socontra_object):
+    # Route the backlog messages to their endpoints in a thread pool, one dialogue per task so that each dialogue's messages
+    # are routed in order. Will return straight away.
+    dialogues = {}
+    for envelope in envelopes:
+        dialogues.setdefault(envelope['message'].get('dialogue_id'), []).append(envelope)
+
+    def route_dialogue(dialogue_envelopes):
+        for envelope in dialogue_envelopes:
+            try:
+                socontra_object.route_message(agent_name, envelope['message'], envelope.get('message_category'), envelope.get('message_type_override'))
+            except Exception as error:
+                print(f'Error routing backlog message for agent {agent_name}: {error}')
+
+    executor = ThreadPoolExecutor(max_workers=config.backlog_dispatch_workers, thread_name_prefix=f'socontra_backlog_{agent_name}')
+    for dialogue_envelopes in dialogues.values():
+        executor.submit(route_dialogue, dialogue_envelopes)
+    executor.shutdown(wait=False)
+
+
+def catch_up_backlog(agent_name: str, socontra_object):
+    # Fetch, filter and route the agent's backlog (see above). Will return True if the backlog was fetched from the backlog
+    # endpoint, or False if it will be replayed on the message stream.
+    if not config.backlog_catch_up:
+        return False
+    time_start = time.monotonic()
+    backlog = fetch_backlog(agent_name)
+    if backlog is None:
+        return False
+
+    envelopes, complete = backlog
+    stats = {'messages': len(envelopes), 'duplicates': 0, 'superseded': 0, 'expired': 0, 'routed': 0, 'complete': complete}
+    to_route, expired = collapse_backlog(agent_name, envelopes, stats)
+    stats['routed'] = len(to_route)
+
+    for envelope in expired:
+        socontra_object.route_expired_message(agent_name, envelope['message'], envelope.get('message_type_override'))
+    dispatch_backlog(agent_name, to_route, socontra_object)
+
+    stats['seconds'] = time.monotonic() - time_start
+    with catch_up_stats_lock:
+        catch_up_stats[agent_name] = stats
+    print(f"Agent {agent_name} caught up with {stats['messages']} backlog messages in {stats['seconds']:.2f}s: {stats['routed']} routed, "
+          f"{stats['superseded']} superseded, {stats['expired']} expired, {stats['duplicates']} duplicates.")
+    return True
+
+
+def catch_up_metrics():
+    # Will return the metrics of the most recent backlog catch-up for each agent.
+    with catch_up_stats_lock:
+        return {agent_name: dict(stats) for agent_name, stats in catch_up_stats.items()}
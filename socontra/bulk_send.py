@@ -0,0 +1,72 @@
+# Bulk sending of protocol messages. Orchestrators that message many agents individually (e.g. new_message to 200
+# agents) would otherwise make one blocking HTTP request after the other. Instead, prepared messages are sent
+# concurrently over the pooled connections of the Socontra Client (socontra/comms.py), with at most
+# config.bulk_send_max_concurrency requests in flight, or in one request to the Socontra Network's batch endpoint when
+# the network supports it.
+# Messages are prepared by the Socontra object (see Socontra.send_many() and Socontra.send_batch()) as tuples of
+# (json_message, path, api_crud_type) - the same arguments as send_auth_message().
+
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from socontra.comms import send_auth_message, send_auth_message_batch, batch_endpoint_supported
+from socontra.deadline import wrap_with_current_deadline
+import config
+
+
+batch_message_path = '/agent_message/batch_message/'
+
+
+# Thread pool used to send messages for all agents in this process. Created the first time it is needed.
+global bulk_send_executor
+bulk_send_executor = None
+bulk_send_executor_lock = threading.Lock()
+
+
+def get_bulk_send_executor():
+    global bulk_send_executor
+    with bulk_send_executor_lock:
+        if bulk_send_executor is None:
+            bulk_send_executor = ThreadPoolExecutor(max_workers=config.bulk_send_max_concurrency, thread_name_prefix='socontra_bulk_send')
+        return bulk_send_executor
+
+
+def send_many_prepared(agent_name: str, prepared_messages: list):
+    # Send the prepared messages concurrently as single requests. Will return a list of futures, one per message in order,
+    # each with the MessageHTTPResponse for the message as its result.
+    executor = get_bulk_send_executor()
+    send = wrap_with_current_deadline(send_auth_message)
+    return [executor.submit(send, agent_name, json_message, path, api_crud_type)
+            for json_message, path, api_crud_type in prepared_messages]
+
+
+def send_batch_prepared(agent_name: str, prepared_messages: list, max_batch: int = None):
+    # Send the prepared messages in requests to the batch endpoint of the Socontra Network, with at most max_batch
+    # (default config.bulk_send_max_batch) messages per request. If the Socontra Network does not have the batch endpoint
+    # (404 or 405), the messages are sent as concurrent single requests instead. Messages in a batch that failed are not
+    # resent. Will return a list of MessageHTTPResponse, one per message in order.
+    max_batch = max_batch if max_batch else config.bulk_send_max_batch
+    responses = [None] * len(prepared_messages)
+    batch_futures = []
+    single_futures = []
+
+    for start in range(0, len(prepared_messages), max_batch):
+        batch = prepared_messages[start:start + max_batch]
+        if len(batch) > 1 and batch_endpoint_supported(agent_name, batch_message_path):
+            batch_futures.append((start, batch, get_bulk_send_executor().submit(wrap_with_current_deadline(send_auth_message_batch), agent_name, batch, batch_message_path)))
+        else:
+            single_futures += list(zip(range(start, start + len(batch)), send_many_prepared(agent_name, batch)))
+
+    for start, batch, future in batch_futures:
+        batch_responses = future.result()
+        if batch_responses is None:
+            # Batch endpoint not supported. Send the messages as single requests.
+            single_futures += list(zip(range(start, start + len(batch)), send_many_prepared(agent_name, batch)))
+        else:
+            responses[start:start + len(batch)] = batch_responses
+
+    for index, future in single_futures:
+        responses[index] = future.result()
+
+    return responses
@@ -0,0 +1,138 @@
+# Circuit breakers for the Socontra Network API. When the Socontra Network is failing (5xx responses, timeouts or
+# connection errors), agents that keep sending requests make it worse, and their threads pile up waiting for responses.
+# Each group of API paths (auth, connections, groups, message) has its own circuit breaker:
+#   - closed:    requests are sent as normal. After config.circuit_breaker_failure_threshold failures in a row, the breaker opens.
+#   - open:      requests fail straight away without being sent (fast local failure, status code 503), or are handled by
+#                the group's degrade hooks (e.g. queued to the durable outbox). After config.circuit_breaker_recovery_time
+#                seconds the breaker becomes half open.
+#   - half_open: up to config.circuit_breaker_half_open_probes requests are sent to probe the Socontra Network. If a probe
+#                succeeds the breaker closes (and the group's recovery hooks are called), otherwise it opens again.
+
+import threading
+import time
+
+import config
+
+
+# API path groups, by path prefix.
+path_group_prefixes = {
+    '/agent_auth/': 'auth',
+    '/agent_admin/': 'auth',
+    '/agent_connections/': 'connections',
+    '/agent_groups/': 'groups',
+    '/agent_message/': 'message',
+}
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = None, recovery_time: float = None, half_open_probes: int = None):
+        self.name = name
+        self.failure_threshold = failure_threshold if failure_threshold else config.circuit_breaker_failure_threshold
+        self.recovery_time = recovery_time if recovery_time is not None else config.circuit_breaker_recovery_time
+        self.half_open_probes = half_open_probes if half_open_probes else config.circuit_breaker_half_open_probes
+
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_time = None
+        self.probes_in_flight = 0
+        self.lock = threading.Lock()
+
+        # Functions called with (agent_name, json_message, path, api_crud_type, idempotency_key) when a request is refused
+        # because the breaker is open. A hook can return a response to use instead of the fast local failure.
+        self.degrade_hooks = []
+        # Functions called with no arguments (in a new thread) when the breaker closes after being open.
+        self.recovery_hooks = []
+
+        self.stats = {'requests_refused': 0, 'times_opened': 0}
+
+    def allow_request(self):
+        # True if a request can be sent to the Socontra Network.
+        with self.lock:
+            if self.state == 'open':
+                if time.time() - self.opened_time < self.recovery_time:
+                    self.stats['requests_refused'] += 1
+                    return False
+                self.state = 'half_open'
+                self.probes_in_flight = 0
+
+            if self.state == 'half_open':
+                if self.probes_in_flight >= self.half_open_probes:
+                    self.stats['requests_refused'] += 1
+                    return False
+                self.probes_in_flight += 1
+
+            return True
+
+    def record_success(self):
+        with self.lock:
+            recovered = self.state != 'closed'
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self.probes_in_flight = 0
+        if recovered:
+            for hook in self.recovery_hooks:
+                threading.Thread(target=hook, daemon=True).start()
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.consecutive_failures >= self.failure_threshold):
+                self.state = 'open'
+                self.opened_time = time.time()
+                self.stats['times_opened'] += 1
+
+    def record_cancelled(self):
+        # Record a request that ended without an outcome (e.g. cancelled because its deadline expired), so it counts as
+        # neither a success nor a failure. Releases its probe slot if the breaker is half open.
+        with self.lock:
+            if self.state == 'half_open' and self.probes_in_flight > 0:
+                self.probes_in_flight -= 1
+
+    def record_response(self, status_code):
+        # Record the outcome of a request from its status code (None if the Socontra Network could not be reached).
+        # A 429 is neither a success nor a failure - it throttles one agent, and the breaker is shared by every agent in
+        # the process, so one agent that sends too fast must not cut the others off from the Socontra Network.
+        if status_code == 429:
+            self.record_cancelled()
+        elif status_code is None or status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def degrade(self, agent_name, json_message, path, api_crud_type, idempotency_key):
+        # Will return the first response from the degrade hooks, or None if there are no hooks or none handle the request.
+        for hook in self.degrade_hooks:
+            response = hook(agent_name, json_message, path, api_crud_type, idempotency_key)
+            if response is not None:
+                return response
+        return None
+
+
+# Circuit breakers for each path group.
+global circuit_breakers
+circuit_breakers = {}
+circuit_breakers_lock = threading.Lock()
+
+
+def path_group(path: str):
+    # Will return the API path group for path.
+    return next((group for prefix, group in path_group_prefixes.items() if path.startswith(prefix)), 'other')
+
+
+def get_circuit_breaker(group: str):
+    # Will return the circuit breaker for the path group (e.g. 'message'), creating it the first time.
+    global circuit_breakers
+    with circuit_breakers_lock:
+        if group not in circuit_breakers:
+            circuit_breakers[group] = CircuitBreaker(group)
+        return circuit_breakers[group]
+
+
+def add_degrade_hook(group: str, hook):
+    # Add a function to handle requests to the path group while its circuit breaker is open. See CircuitBreaker.degrade_hooks.
+    get_circuit_breaker(group).degrade_hooks.append(hook)
+
+
+def add_recovery_hook(group: str, hook):
+    # Add a function to call when the path group's circuit breaker closes again. See CircuitBreaker.recovery_hooks.
+    get_circuit_breaker(group).recovery_hooks.append(hook)
@@ -0,0 +1,130 @@
+# JSON codec used by the Socontra Client to encode messages sent to the Socontra Network and decode the responses and the
+# messages received on the agent's message stream. Proposals with many products make these payloads large, so a fast JSON
+# library is used if installed:
+#   'orjson'  - orjson package.
+#   'msgspec' - msgspec package. The message stream envelope is decoded with a typed decoder (MessageEnvelope).
+#   'json'    - Python standard library (always available).
+# config.json_codec selects the codec. 'auto' uses the fastest installed codec (orjson, then msgspec, then json).
+# Messages are encoded to bytes once, and sent as the request body, rather than letting requests encode them.
+
+import json
+
+import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class StdlibJSONCodec:
+    name = 'json'
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+    def decode(self, data):
+        return json.loads(data)
+
+    def decode_envelope(self, data):
+        # Decode an event from the agent's message stream. Will return (protocol message, message category, message type override).
+        envelope = self.decode(data)
+        return envelope['message'], envelope['message_category'], envelope['message_type_override']
+
+
+class OrjsonCodec(StdlibJSONCodec):
+    name = 'orjson'
+
+    def encode(self, obj):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            # Types that orjson can't encode (e.g. integers larger than 64 bits) - use the standard library.
+            return super().encode(obj)
+
+    def decode(self, data):
+        return orjson.loads(data)
+
+
+if msgspec is not None:
+    class MessageEnvelope(msgspec.Struct):
+        # Event on the agent's message stream, as sent by the Socontra Network.
+        message: dict
+        message_category: str | None = None
+        message_type_override: str | None = None
+
+
+class MsgspecCodec(StdlibJSONCodec):
+    name = 'msgspec'
+
+    def __init__(self):
+        self.encoder = msgspec.json.Encoder()
+        self.decoder = msgspec.json.Decoder()
+        self.envelope_decoder = msgspec.json.Decoder(MessageEnvelope)
+
+    def encode(self, obj):
+        try:
+            return self.encoder.encode(obj)
+        except (TypeError, msgspec.EncodeError):
+            return super().encode(obj)
+
+    def decode(self, data):
+        try:
+            return self.decoder.decode(data)
+        except msgspec.DecodeError as error:
+            raise ValueError(str(error))
+
+    def decode_envelope(self, data):
+        try:
+            envelope = self.envelope_decoder.decode(data)
+        except msgspec.DecodeError as error:
+            raise ValueError(str(error))
+        return envelope.message, envelope.message_category, envelope.message_type_override
+
+
+def available_codecs():
+    # Will return the codecs that can be used, fastest first.
+    codecs = {}
+    if orjson is not None:
+        codecs['orjson'] = OrjsonCodec
+    if msgspec is not None:
+        codecs['msgspec'] = MsgspecCodec
+    codecs['json'] = StdlibJSONCodec
+    return codecs
+
+
+def create_codec(name: str = 'auto'):
+    # Will return the codec called name, or the fastest installed codec if name is 'auto'.
+    codecs = available_codecs()
+    if name == 'auto':
+        return next(iter(codecs.values()))()
+    if name not in codecs:
+        raise ValueError(f'JSON codec {name} is not installed or not known. Available codecs: {list(codecs)}')
+    return codecs[name]()
+
+
+# Codec used by the Socontra Client.
+codec = create_codec(config.json_codec)
+
+
+def set_codec(name: str):
+    # Change the codec used by the Socontra Client.
+    global codec
+    codec = create_codec(name)
+
+
+def encode(obj):
+    return codec.encode(obj)
+
+
+def decode(data):
+    return codec.decode(data)
+
+
+def decode_envelope(data):
+    return codec.decode_envelope(data)
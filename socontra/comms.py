@@ -3,10 +3,23 @@
 
 import threading
 import json
+import random
 import requests
+import sys
 import time
+import uuid
 
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError, ReadTimeoutError
 from socontra.agent_database import AgentDatabase
+from socontra.circuit_breaker import get_circuit_breaker, path_group
+from socontra.rate_limiter import get_rate_limiter
+from socontra.deadline import DeadlineExpired, deadline_expired, request_timeout, time_remaining, message_expired
+from socontra.sse import SSEReader
+from socontra.codec import encode, decode, decode_envelope
+from socontra.compression import compress_request_body, request_encoding_rejected, record_accept_encoding, stream_accept_encoding
+from socontra.message_cache import remember_message
+from socontra.message_dedupe import is_duplicate_message
 from sseclient import SSEClient
 import config 
 
@@ -15,35 +28,74 @@ global socontra_interface_object_ref, agent_db_object_ref
 socontra_interface_object_ref = {}
 agent_db_object_ref = {}
 
+# HTTP session shared by all agents in this process, so that requests to the Socontra Network reuse pooled connections
+# rather than opening a new connection for every message.
+http_session = requests.Session()
+http_session.mount('http://', HTTPAdapter(pool_connections=config.http_pool_connections, pool_maxsize=config.http_pool_maxsize))
+http_session.mount('https://', HTTPAdapter(pool_connections=config.http_pool_connections, pool_maxsize=config.http_pool_maxsize))
+
+# Batch endpoints that the Socontra Network does not support: (Socontra Network url, batch path).
+batch_endpoints_unsupported = set()
+
+# Number of requests retried after a transient failure, for each path.
+retry_stats = {}
+retry_stats_lock = threading.Lock()
+
 
 # Create a class for message responses for HTTP message requests and agent messages. This way can use response.success rather than
 # reponse['success'], which I think is cleaner and easier to use.
 class MessageHTTPResponse():
+    # __slots__ and a contents dict that is only built when used, as a response is created for every message sent.
+    __slots__ = ('success', 'message', 'http_response', 'status_code', '_contents')
+
     def __init__(self, response):
         self.success = response['success']
         self.message = response['message']
         self.http_response=response['http_response']
         self.status_code = response['status_code']
+        self._contents = None
+
+    @property
+    def contents(self):
+        if self._contents is None:
+            self._contents = {
+                'success': self.success,
+                'message' : self.message,
+                'http_response' : self.http_response,
+                'status_code' : self.status_code
+            }
+        return self._contents
+
+
+# Fields of a Message, in the order of Message.contents. Fields after 'message_id' are only in contents for messages with a
+# task, proposal or offer.
+message_fields = ('sender_name', 'receiver_name', 'distribution_list', 'recipient_type', 'message', 'message_type', 'protocol',
+                  'dialogue_id', 'message_id')
+message_transaction_fields = ('task', 'proposal_timeout', 'proposal', 'invite_offer_timeout', 'offer', 'offer_timeout',
+                              'payment_required', 'human_authorization_required', 'order')
+
+
+def intern_string(value):
+    # Agent names, protocols and message types repeat across many messages. Intern them so that agents that keep many
+    # messages (e.g. queued for processing) keep one copy of each.
+    return sys.intern(value) if type(value) == str else value
 
-        self.contents = {
-            'success': self.success,
-            'message' : self.message,
-            'http_response' : self.http_response,
-            'status_code' : self.status_code
-        }
 
 # Create a class for message to send - make it easier for the developer to access message components.
 class Message():
+    # __slots__ and a contents dict that is only built when used, as a Message is created for every message received.
+    __slots__ = message_fields + message_transaction_fields + ('_contents',)
+
     def __init__(self, sender_name, receiver_name, distribution_list, message, message_type, recipient_type, protocol, dialogue_id, 
                     task = None, proposal = None, offer = None, order = None, proposal_timeout = None, invite_offer_timeout = None, offer_timeout = None,
                     payment_required = False, human_authorization_required = False, message_id = None):
-        self.sender_name = sender_name
-        self.receiver_name = receiver_name
+        self.sender_name = intern_string(sender_name)
+        self.receiver_name = intern_string(receiver_name)
         self.distribution_list = distribution_list
-        self.recipient_type = recipient_type
+        self.recipient_type = intern_string(recipient_type)
         self.message = message
-        self.message_type= message_type
-        self.protocol = protocol
+        self.message_type= intern_string(message_type)
+        self.protocol = intern_string(protocol)
         self.dialogue_id = dialogue_id
         self.message_id = message_id
         self.task = task
@@ -55,37 +107,15 @@ class Message():
         self.payment_required = payment_required
         self.human_authorization_required = human_authorization_required
         self.order = order
+        self._contents = None
 
-        self.contents = {
-            'sender_name': self.sender_name,
-            'receiver_name': self.receiver_name,
-            'distribution_list': self.distribution_list,
-            'recipient_type': self.recipient_type,
-            'message': self.message,
-            'message_type': self.message_type,
-            'protocol': self.protocol,
-            'dialogue_id': self.dialogue_id,
-            'message_id': self.message_id,
-        } if (task is None and proposal is None and offer is None) else {
-            'sender_name': self.sender_name,
-            'receiver_name': self.receiver_name,
-            'distribution_list': self.distribution_list,
-            'recipient_type': self.recipient_type,
-            'message': self.message,
-            'message_type': self.message_type,
-            'protocol': self.protocol,
-            'dialogue_id': self.dialogue_id,
-            'message_id' : self.message_id,
-            'task': self.task,
-            'proposal_timeout': self.proposal_timeout,
-            'proposal': self.proposal,
-            'invite_offer_timeout': self.invite_offer_timeout,
-            'offer': self.offer,
-            'offer_timeout': self.offer_timeout,
-            'payment_required': self.payment_required,
-            'human_authorization_required': self.human_authorization_required,
-            'order': self.order,
-        }
+    @property
+    def contents(self):
+        # Dict of the message, as sent to the Socontra Network (e.g. as message_responding_to).
+        if self._contents is None:
+            fields = message_fields if (self.task is None and self.proposal is None and self.offer is None) else message_fields + message_transaction_fields
+            self._contents = {field: getattr(self, field) for field in fields}
+        return self._contents
 
 
 def prepare_agent_api(agent_name, soc_intfce_object_ref):
@@ -99,19 +129,29 @@ def prepare_agent_api(agent_name, soc_intfce_object_ref):
     agent_db_object_ref[agent_name] = AgentDatabase()
 
 
-def agent_receive_messages(agent_name, clear_backlog, agent_connected):
+def agent_receive_messages(agent_name, clear_backlog, agent_connected, before_reconnect=None):
+    # before_reconnect is called (if given) before the agent reconnects to the stream after it was connected, e.g. to catch
+    # up with the backlog (socontra/backlog.py).
     url = config.socontra_network_url_sse
     print('Starting agent connection to Socontra Network', agent_name)
 
     while True:
         try:
+            if agent_connected.get('agent_connected') and before_reconnect is not None:
+                before_reconnect()
+
             # Get an access token from the Socontra Network.
             access_token = agent_db(agent_name).get_socontra_access_token()
             if not access_token:
                 access_token = get_access_token(agent_name)
 
             if type(access_token) is dict:
-                response = requests.get(url, json={'agent_name': agent_name, 'clear_backlog': clear_backlog}, stream=True, headers=access_token)
+                # Accept a compressed message stream, if the Socontra Network supports it (socontra/compression.py).
+                headers = dict(access_token, **{'Accept-Encoding': stream_accept_encoding()})
+                # Time out a hung connect, or (if config.sse_read_timeout is set) a stream that has been silent for that long
+                # (e.g. a dead connection), so the agent reconnects below rather than waiting forever.
+                response = requests.get(url, json={'agent_name': agent_name, 'clear_backlog': clear_backlog}, stream=True, headers=headers,
+                                        timeout=(config.http_request_timeout[0], config.sse_read_timeout))
             else:
                 print(f"Could not connect agent {agent_name} to the Socontra Network - could not get access token for agent. Response: {access_token.contents}")
                 return access_token
@@ -120,33 +160,54 @@ def agent_receive_messages(agent_name, clear_backlog, agent_connected):
                 print(f"Could not connect agent {agent_name} to the Socontra Network. Ensure that another instance of the agent is not already running.")
                 return response
 
-            client = SSEClient(response)
+            if config.sse_reader == 'builtin':
+                # Built-in reader (socontra/sse.py) - parses the stream from large chunks and decodes event data from raw bytes.
+                events = SSEReader(response, config.sse_chunk_size).events()
+            else:
+                events = SSEClient(response).events()
 
             agent_connected['agent_connected'] = True
 
-            for event in client.events():
+            for event in events:
                 # print(agent_name, 'received message', event.data)
 
-                message = json.loads(event.data)
-                protocol_message_component = message['message']
+                # Decode the event with the JSON codec (socontra/codec.py) into the protocol message and how to route it.
+                protocol_message_component, message_category, message_type_override = decode_envelope(event.data)
 
                 agent_name = protocol_message_component['receiver_name']
 
-                global socontra_interface_object_ref
+                # Drop messages the agent has already received (e.g. through more than one group, or again after reconnecting).
+                if is_duplicate_message(agent_name, protocol_message_component):
+                    continue
 
-                message_type_override = message['message_type_override']
+                global socontra_interface_object_ref
 
-                message_category = message['message_category']
+                # Messages whose deadline has passed (e.g. requests in the backlog after a reconnect) are not routed to their
+                # endpoint, as no one is waiting for the response. They go to the agent's expired_message endpoint, if it has one.
+                if message_expired(agent_name, protocol_message_component, message_type_override):
+                    socontra_interface_object_ref[agent_name].route_expired_message(agent_name, protocol_message_component, message_type_override)
+                    continue
 
                 expect_multiple_thread = threading.Thread(target=socontra_interface_object_ref[agent_name].route_message, 
                                                         args=(agent_name, protocol_message_component, message_category, message_type_override))
 
                 expect_multiple_thread.start()
-        except:
+        except Exception as error:
+            if stream_read_timeout(error):
+                # The stream was silent for config.sse_read_timeout seconds. Reconnect straight away.
+                continue
             print(f'Trouble connecting agent {agent_name} to the Socontra Network. Will try again soon.')
             time.sleep(5)
 
 
+def stream_read_timeout(error):
+    # True if error is a read timeout on the message stream. The built-in reader reads the stream with urllib3, so its read
+    # timeouts are not wrapped by requests.
+    if isinstance(error, (requests.ReadTimeout, ReadTimeoutError)):
+        return True
+    return isinstance(error, requests.ConnectionError) and bool(error.args) and isinstance(error.args[0], ReadTimeoutError)
+
+
 # Agent registration functions.
 
 def is_agent_already_registered(agent_name, client_security_token):
@@ -279,9 +340,14 @@ def recreate_agent_same_credentials(agent_name, client_security_token, human_pas
 #  ---------------- Send message to the Socontra Network.
 
 
-def send_auth_message(agent_name, json_message, path, api_crud_type):
+def send_auth_message(agent_name, json_message, path, api_crud_type, idempotency_key = None):
     # Send a message to the Socontra Network.
     # We have configured it for http://127.0.0.1:8000.
+    # idempotency_key is sent in the Idempotency-Key header, so that the Socontra Network can recognise a message that is sent
+    # more than once (e.g. retried, or replayed from the durable outbox) and only process it once. If not given, a new key is 
+    # created for each POST, PUT and DELETE message (if config.idempotency_keys is True).
+    # Transient failures (connection errors, timeouts and responses with status codes in config.retry_status_codes) are 
+    # retried with backoff, but only for messages that are safe to send again (see retry_allowed()).
     # First get the agent's URL and port number.
     socontra_network_url = agent_db(agent_name).socontra_network_url
     socontra_network_path = path
@@ -295,8 +361,50 @@ def send_auth_message(agent_name, json_message, path, api_crud_type):
     else:
         access_token = agent_db(agent_name).get_socontra_access_token()
 
+    if idempotency_key is None and config.idempotency_keys and api_crud_type != 'GET':
+        idempotency_key = uuid.uuid4().hex
+
+    if idempotency_key is not None:
+        access_token = dict(access_token or {}, **{'Idempotency-Key': idempotency_key})
+
+    # Wait for the agent's rate limits (token buckets) to allow the request, but not past the deadline of the protocol step
+    # sending the message (see socontra/deadline.py).
+    if config.rate_limiting and get_rate_limiter(agent_name).acquire(path, timeout=time_remaining()) is None:
+        return _deadline_expired_response()
+
+    # If the deadline of the protocol step that is sending the message has passed (see socontra/deadline.py), the message is no
+    # longer useful to the receiver. Cancel it rather than sending it.
+    if deadline_expired():
+        return _deadline_expired_response()
+
+    # If the Socontra Network is failing for this group of paths, fail fast rather than sending the request.
+    circuit_breaker = get_circuit_breaker(path_group(path)) if config.circuit_breakers else None
+    if circuit_breaker is not None and not circuit_breaker.allow_request():
+        return _circuit_open_response(circuit_breaker, agent_name, json_message, path, api_crud_type, idempotency_key)
+
     # Send the auth request.
-    res = _send_auth_request(api_crud_type, socontra_network_url, socontra_network_api_port, socontra_network_path, json_message, access_token)
+    # The outcome is always recorded with the circuit breaker - if the request was cancelled (deadline expired) or failed
+    # with another error, neither success nor failure, so that a half open breaker's probe slot is released.
+    outcome_recorded = False
+    try:
+        res = _send_auth_request_with_retries(api_crud_type, socontra_network_url, socontra_network_api_port, socontra_network_path, json_message, access_token, idempotency_key)
+    except DeadlineExpired:
+        return _deadline_expired_response()
+    except (requests.ConnectionError, requests.Timeout) as error:
+        if deadline_expired():
+            # Timed out because the deadline passed, not because the Socontra Network is failing.
+            return _deadline_expired_response()
+        if circuit_breaker is not None:
+            circuit_breaker.record_response(None)
+            outcome_recorded = True
+        return _connection_error_response(error)
+    else:
+        if circuit_breaker is not None:
+            circuit_breaker.record_response(res.status_code)
+            outcome_recorded = True
+    finally:
+        if circuit_breaker is not None and not outcome_recorded:
+            circuit_breaker.record_cancelled()
     
     # If the response is 401 unauthorized, then we need a new access token.
     # Get the access token and try one more time to see if this resolves the issue.
@@ -307,13 +415,20 @@ def send_auth_message(agent_name, json_message, path, api_crud_type):
 
         # Resend the auth message.
         if type(access_token) is dict:
-            res = _send_auth_request(api_crud_type, socontra_network_url, socontra_network_api_port, socontra_network_path, json_message, access_token)
+            if idempotency_key is not None:
+                access_token = dict(access_token, **{'Idempotency-Key': idempotency_key})
+            try:
+                res = _send_auth_request_with_retries(api_crud_type, socontra_network_url, socontra_network_api_port, socontra_network_path, json_message, access_token, idempotency_key)
+            except DeadlineExpired:
+                return _deadline_expired_response()
+            except (requests.ConnectionError, requests.Timeout) as error:
+                return _connection_error_response(error)
         else:
             # Error getting access token for agent to connect to the Socontra Network.
             return access_token
     
     # If there is an error on the Socontra Network, print a message and return from this function.
-    if res.status_code == 500:
+    if res.status_code >= 500:
         print(f'There was an error on the Socontra Network. Action could not be completed. Response: {res.content}')
         return MessageHTTPResponse({
                 'success': False,
@@ -323,12 +438,16 @@ def send_auth_message(agent_name, json_message, path, api_crud_type):
             })
     
     try:
-        response_dict = json.loads(res.content)
-    except:
-        response_dict = json.loads(res.detail)
+        response_dict = decode(res.content)
+    except ValueError:
+        response_dict = {'detail': res.text}
+    if type(response_dict) != dict:
+        response_dict = {'http_response': response_dict}
     
     if 200 <= res.status_code <= 299:
        success = True
+       # Keep the message sent, so replies to it that reference it can be rebuilt (compact replies only).
+       remember_message(agent_name, response_dict.get('message_sent'))
     else:
        success = False
 
@@ -347,16 +466,202 @@ def send_auth_message(agent_name, json_message, path, api_crud_type):
     return response_to_return
 
 
+def send_auth_message_batch(agent_name, messages, batch_path):
+    # Send several messages to the Socontra Network in one request to the batch endpoint batch_path.
+    # messages is a list of (json_message, path, api_crud_type). The batch is sent as {'messages': [{path, api_crud_type, message}]}
+    # and the Socontra Network responds with {'responses': [{status_code, http_response, message_sent}]}, one per message in order.
+    # Will return a list of MessageHTTPResponse, one per message, or None if the batch endpoint is not supported (404 or 405).
+    # The caller should then send the messages as single requests. If the batch request failed, or the responses can't be
+    # matched to the messages, each message gets a failed response - the batch may have been processed, so resending the
+    # messages could duplicate them.
+    batch_key = (agent_db(agent_name).socontra_network_urlport, batch_path)
+    if batch_key in batch_endpoints_unsupported:
+        return None
+
+    json_message = {'messages': [{'path': path, 'api_crud_type': api_crud_type, 'message': message} for message, path, api_crud_type in messages]}
+    batch_response = send_auth_message(agent_name, json_message, batch_path, 'POST')
+
+    if batch_response.status_code in [404, 405]:
+        # Batch endpoint not supported by the Socontra Network. Send single requests from now on.
+        batch_endpoints_unsupported.add(batch_key)
+        return None
+
+    if not batch_response.success:
+        return [MessageHTTPResponse(batch_response.contents) for _ in messages]
+
+    responses = batch_response.http_response.get('responses') if type(batch_response.http_response) == dict else None
+    if type(responses) != list or len(responses) != len(messages):
+        return [MessageHTTPResponse({
+                    'success': False,
+                    'http_response': batch_response.http_response,
+                    'message': 'The responses from the batch endpoint could not be matched to the messages sent.',
+                    'status_code': batch_response.status_code
+                }) for _ in messages]
+
+    for response in responses:
+        remember_message(agent_name, response.get('message_sent'))
+
+    return [MessageHTTPResponse({
+                'success': 200 <= response.get('status_code', 500) <= 299,
+                'http_response': response.get('http_response'),
+                'message': None if not response.get('message_sent') else return_message_object(response['message_sent']),
+                'status_code': response.get('status_code')
+            }) for response in responses]
+
+
+def batch_endpoint_supported(agent_name, batch_path):
+    # False if the Socontra Network has responded that it does not support the batch endpoint batch_path.
+    return (agent_db(agent_name).socontra_network_urlport, batch_path) not in batch_endpoints_unsupported
+
+
+def _send_auth_request_with_retries(api_crud_type, socontra_network_url, socontra_network_api_port, socontra_network_path, json_message, access_token, idempotency_key):
+    # Send the request, retrying after transient failures up to the retry budget for the path, with jittered exponential backoff.
+    # Only failures that are safe to retry are retried (see retry_allowed()).
+    # Will raise requests.ConnectionError or requests.Timeout if the request still could not be sent, or DeadlineExpired.
+    # Requests are not retried if the deadline of the current context would pass before the retry.
+    retry_budget = retry_budget_for_path(socontra_network_path)
+    attempt = 0
+    while True:
+        try:
+            res = _send_auth_request(api_crud_type, socontra_network_url, socontra_network_api_port, socontra_network_path, json_message, access_token)
+            retry_after = res.headers.get('Retry-After')
+            if res.status_code not in config.retry_status_codes or attempt >= retry_budget or \
+                    not retry_allowed(api_crud_type, idempotency_key, status_code=res.status_code, retry_after=retry_after):
+                return res
+            delay = retry_backoff(attempt, retry_after)
+            if not _time_to_retry(delay):
+                return res
+        except (requests.ConnectionError, requests.Timeout) as error:
+            delay = retry_backoff(attempt)
+            if attempt >= retry_budget or not retry_allowed(api_crud_type, idempotency_key, error=error) or not _time_to_retry(delay):
+                raise
+
+        with retry_stats_lock:
+            retry_stats[socontra_network_path] = retry_stats.get(socontra_network_path, 0) + 1
+        time.sleep(delay)
+        attempt += 1
+
+
+def _time_to_retry(delay):
+    # False if the deadline of the current context would pass before a retry after delay seconds.
+    remaining = time_remaining()
+    return remaining is None or remaining > delay
+
+
+def retry_allowed(api_crud_type, idempotency_key, status_code = None, retry_after = None, error = None):
+    # Will return True if a request can be sent again after it failed with status_code, or with error (connection error or timeout).
+    # Retries must never create a duplicate offer or order, so a request is only sent again if:
+    #   - sending it twice has the same effect as sending it once: GET requests, or requests with an idempotency key if the
+    #     Socontra Network is known to only process each key once (config.idempotency_keys_honoured).
+    #   - or the Socontra Network did not process it: the connection could not be made, the request was throttled (429),
+    #     or the Socontra Network was unavailable and said when to retry (503 with a Retry-After header).
+    # A read timeout or other 5xx response may come after the Socontra Network has processed the request, so those are
+    # only retried for idempotent requests.
+    if api_crud_type == 'GET' or (idempotency_key is not None and config.idempotency_keys_honoured):
+        return True
+    if error is not None:
+        return request_not_sent(error)
+    return status_code == 429 or (status_code == 503 and retry_after is not None)
+
+
+def request_not_sent(error):
+    # True if a requests exception shows that the request never reached the Socontra Network (connect timeout, or the
+    # connection could not be made), rather than failing after it was sent.
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError):
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
+
+
+def retry_budget_for_path(path):
+    # Will return the maximum number of retries for requests to path.
+    return config.retry_budgets.get(path, config.retry_budget_default)
+
+
+def retry_backoff(attempt, retry_after = None):
+    # Will return the time (seconds) to wait before retry number attempt + 1. Exponential backoff with full jitter, so that
+    # agents that failed at the same time do not all retry at the same time. If the Socontra Network sent a Retry-After
+    # header (in seconds), wait at least that long. Never longer than config.retry_backoff_max.
+    delay = random.uniform(0, min(config.retry_backoff_max, config.retry_backoff_base * 2 ** attempt))
+    try:
+        delay = max(delay, float(retry_after)) if retry_after is not None else delay
+    except ValueError:
+        pass
+    return min(delay, config.retry_backoff_max)
+
+
+def _circuit_open_response(circuit_breaker, agent_name, json_message, path, api_crud_type, idempotency_key):
+    # Response for a request that is not sent because the circuit breaker for its path group is open. The breaker's degrade
+    # hooks can handle the request instead (e.g. queue it to the durable outbox).
+    response = circuit_breaker.degrade(agent_name, json_message, path, api_crud_type, idempotency_key)
+    if response is not None:
+        return response
+    return MessageHTTPResponse({
+            'success': False,
+            'http_response': f'Circuit breaker open for Socontra Network {circuit_breaker.name} paths. Request not sent.',
+            'message': 'The Socontra Network is unavailable. Action could not be completed.',
+            'status_code': 503
+        })
+
+
+def _deadline_expired_response():
+    # Response for a message that is not sent because the deadline of the protocol step sending it has passed.
+    return MessageHTTPResponse({
+            'success': False,
+            'http_response': 'Deadline expired. Message not sent.',
+            'message': 'Deadline expired. Action was cancelled.',
+            'status_code': 408
+        })
+
+
+def _connection_error_response(error):
+    # Response when the Socontra Network could not be reached, or did not respond in time, after all retries.
+    print(f'Could not send message to the Socontra Network. Error: {error}')
+    return MessageHTTPResponse({
+            'success': False,
+            'http_response': str(error),
+            'message': 'Could not send message to the Socontra Network. Action could not be completed.',
+            'status_code': None
+        })
+
+
 def _send_auth_request(api_crud_type, socontra_network_url, socontra_network_api_port, socontra_network_path, json_message, access_token):
     
+    # Timeout from the time remaining until the deadline (if any), up to config.http_request_timeout.
+    timeout = request_timeout(config.http_request_timeout)
+
+    # Encode the message once with the JSON codec (socontra/codec.py) and send the bytes as the request body.
+    server = socontra_network_url + ':' + str(socontra_network_api_port)
+    headers = dict(access_token or {}, **{'Content-Type': 'application/json'})
+    body = encode(json_message)
+
+    # Compress large request bodies, if the Socontra Network has said it accepts compressed bodies (socontra/compression.py).
+    # If the Socontra Network does not accept the compressed body after all (415 Unsupported Media Type), send it again uncompressed.
+    compressed_body, content_encoding = compress_request_body(server, body)
+    if content_encoding is None:
+        res = _send_http_request(api_crud_type, server + socontra_network_path, body, headers, timeout)
+    else:
+        res = _send_http_request(api_crud_type, server + socontra_network_path, compressed_body, dict(headers, **{'Content-Encoding': content_encoding}), timeout)
+        if res.status_code == 415:
+            request_encoding_rejected(server, content_encoding, res.headers.get('Accept-Encoding'))
+            res = _send_http_request(api_crud_type, server + socontra_network_path, body, headers, timeout)
+
+    record_accept_encoding(server, res.headers.get('Accept-Encoding'))
+    return res
+
+
+def _send_http_request(api_crud_type, url, body, headers, timeout):
+
     if api_crud_type == 'POST':
-        res = requests.post(socontra_network_url + ':' + str(socontra_network_api_port) + socontra_network_path, json=json_message, headers=access_token)
+        res = http_session.post(url, data=body, headers=headers, timeout=timeout)
     elif api_crud_type == 'GET':
-        res = requests.get(socontra_network_url + ':' + str(socontra_network_api_port) + socontra_network_path, json=json_message, headers=access_token)
+        res = http_session.get(url, data=body, headers=headers, timeout=timeout)
     elif api_crud_type == 'PUT':
-        res = requests.put(socontra_network_url + ':' + str(socontra_network_api_port) + socontra_network_path, json=json_message, headers=access_token)
+        res = http_session.put(url, data=body, headers=headers, timeout=timeout)
     elif api_crud_type == 'DELETE':
-        res = requests.delete(socontra_network_url + ':' + str(socontra_network_api_port) + socontra_network_path, json=json_message, headers=access_token)
+        res = http_session.delete(url, data=body, headers=headers, timeout=timeout)
     else:
         raise ValueError('ERROR - PROVIDE TYPE OF CRUD MESSAGE')
     
@@ -0,0 +1,122 @@
+# Compression of messages sent to and received from the Socontra Network. Proposals from online stores (products with
+# descriptions and variants) and the message_responding_to echoed in responses can be tens of kilobytes per message.
+#   - Request bodies are only compressed once the Socontra Network has said which encodings it accepts, with an
+#     Accept-Encoding header on a response (RFC 7694). Servers and proxies that don't support compressed request bodies
+#     often fail them with a 400 or 422, or can't parse them, so bodies are never compressed on the off chance.
+#   - Once supported, request bodies of at least config.request_compression_min_size bytes are compressed with zstd (if
+#     the zstandard package is installed) or gzip, as accepted by the Socontra Network, and sent with a Content-Encoding
+#     header. If the Socontra Network still responds 415 (Unsupported Media Type), the message is sent again uncompressed,
+#     and the encoding is not used for that Socontra Network again.
+#   - The agent's message stream is requested with an Accept-Encoding header, so a Socontra Network that supports it can
+#     send a compressed stream. Compressed streams are decoded by urllib3 as they are read. Servers that don't support
+#     compression ignore the header and send the stream uncompressed.
+
+import gzip
+import threading
+
+import config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Encodings for request bodies, in order of preference.
+supported_encodings = (['zstd'] if zstandard is not None else []) + ['gzip']
+
+# Encodings that each Socontra Network (url:port) does not accept for request bodies, and the encodings it has said it
+# accepts (from the Accept-Encoding header of its responses). Request bodies sent to a Socontra Network that has not said
+# which encodings it accepts are not compressed.
+global encodings_rejected, encodings_accepted
+encodings_rejected = {}
+encodings_accepted = {}
+compression_lock = threading.Lock()
+
+stats = {'requests_compressed': 0, 'bytes_before': 0, 'bytes_after': 0, 'rejected': 0}
+
+
+def compress(data: bytes, encoding: str):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=config.request_compression_level_zstd).compress(data)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=config.request_compression_level_gzip, mtime=0)
+    raise ValueError('Unknown content encoding: ' + str(encoding))
+
+
+def decompress(data: bytes, encoding: str):
+    if encoding in [None, '', 'identity']:
+        return data
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd content encoding requires the zstandard package.')
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    raise ValueError('Unknown content encoding: ' + str(encoding))
+
+
+def request_encoding(server: str):
+    # Will return the encoding to compress request bodies sent to server (Socontra Network url:port), or None.
+    with compression_lock:
+        rejected = encodings_rejected.get(server, set())
+        accepted = encodings_accepted.get(server)
+    if accepted is None:
+        return None
+    return next((encoding for encoding in supported_encodings if encoding not in rejected and encoding in accepted), None)
+
+
+def parse_accept_encoding(accept_encoding_header: str):
+    # Will return the set of encodings listed in an Accept-Encoding header (ignoring any with q=0).
+    encodings = set()
+    for part in accept_encoding_header.split(','):
+        encoding, _, parameters = part.partition(';')
+        if encoding.strip() and parameters.replace(' ', '').lower() not in ['q=0', 'q=0.0', 'q=0.00', 'q=0.000']:
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def record_accept_encoding(server: str, accept_encoding_header: str):
+    # Record the encodings server says it accepts for request bodies, from the Accept-Encoding header of a response.
+    if accept_encoding_header is None:
+        return
+    encodings = parse_accept_encoding(accept_encoding_header)
+    with compression_lock:
+        encodings_accepted[server] = encodings
+
+
+def compress_request_body(server: str, body: bytes):
+    # Will return (body, content encoding) for a request body sent to server. The body is compressed if compression is
+    # enabled, it is at least config.request_compression_min_size bytes, and the server has not rejected the encoding.
+    # Content encoding is None if the body is not compressed.
+    if not config.request_compression or len(body) < config.request_compression_min_size:
+        return body, None
+    encoding = request_encoding(server)
+    if encoding is None:
+        return body, None
+
+    compressed_body = compress(body, encoding)
+    if len(compressed_body) >= len(body):
+        return body, None
+
+    with compression_lock:
+        stats['requests_compressed'] += 1
+        stats['bytes_before'] += len(body)
+        stats['bytes_after'] += len(compressed_body)
+    return compressed_body, encoding
+
+
+def request_encoding_rejected(server: str, encoding: str, accept_encoding_header: str = None):
+    # Record that server responded 415 to a request body compressed with encoding. accept_encoding_header is the
+    # Accept-Encoding header of the response, if any, listing the encodings the server does accept.
+    with compression_lock:
+        stats['rejected'] += 1
+        encodings_rejected.setdefault(server, set()).add(encoding)
+    record_accept_encoding(server, accept_encoding_header)
+
+
+def stream_accept_encoding():
+    # Will return the Accept-Encoding header for the agent's message stream.
+    if not config.stream_compression:
+        return 'identity'
+    return ', '.join(supported_encodings + ['identity'])
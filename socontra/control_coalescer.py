@@ -0,0 +1,126 @@
+# Coalescer for protocol control messages (close_message, close_dialogue, close_agent and reject_offer).
+# Agents often send several small control messages at once - e.g. rejecting the losing offers of an allocate round, or
+# closing messages and dialogues when a transaction completes. Rather than sending a separate HTTP request for each,
+# control messages from the same agent are buffered for a few milliseconds (config.control_message_flush_delay) and sent
+# to the Socontra Network as one batched request. Each caller still blocks until the response to its own message is ready.
+# If the Socontra Network does not support batched control messages (404 or 405 response), the messages are sent as
+# single requests, and single requests are used for the Socontra Network from then on.
+
+import threading
+import time
+
+from socontra.comms import MessageHTTPResponse, send_auth_message, send_auth_message_batch, batch_endpoint_supported
+import config
+
+
+batch_control_path = '/agent_message/batch_protocol_control/'
+
+
+class PendingControlMessage:
+    # A control message waiting to be sent, and its response once sent.
+    def __init__(self, json_message: dict, path: str, api_crud_type: str):
+        self.json_message = json_message
+        self.path = path
+        self.api_crud_type = api_crud_type
+        self.response = None
+        self.done = threading.Event()
+
+    def set_response(self, response):
+        self.response = response
+        self.done.set()
+
+
+class ControlMessageCoalescer:
+    def __init__(self, flush_delay: float = None, max_batch: int = None):
+        self.flush_delay = flush_delay if flush_delay is not None else config.control_message_flush_delay
+        self.max_batch = max_batch if max_batch else config.control_message_max_batch
+
+        # Control messages waiting to be sent for each agent.
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        self.stats = {'messages': 0, 'batches': 0, 'single_requests': 0}
+
+    def send(self, agent_name: str, json_message: dict, path: str, api_crud_type: str):
+        # Send a control message, batched with other control messages sent by the agent at about the same time.
+        # Will return the response (MessageHTTPResponse) for this message.
+        if not batch_endpoint_supported(agent_name, batch_control_path):
+            return self._send_single(agent_name, PendingControlMessage(json_message, path, api_crud_type))
+
+        pending_message = PendingControlMessage(json_message, path, api_crud_type)
+        with self.lock:
+            self.stats['messages'] += 1
+            if agent_name in self.pending:
+                # Another message is waiting to be sent - this message will be sent with it.
+                self.pending[agent_name].append(pending_message)
+                flush_now = len(self.pending[agent_name]) >= self.max_batch
+                is_leader = False
+            else:
+                # First message. This caller will wait flush_delay for other messages, then send the batch.
+                self.pending[agent_name] = [pending_message]
+                flush_now = False
+                is_leader = True
+
+        if flush_now:
+            self._flush(agent_name)
+        elif is_leader:
+            time.sleep(self.flush_delay)
+            self._flush(agent_name)
+
+        pending_message.done.wait()
+        return pending_message.response
+
+    def _flush(self, agent_name):
+        # Take the messages waiting for the agent and send them.
+        with self.lock:
+            batch = self.pending.pop(agent_name, [])
+        if not batch:
+            return
+
+        try:
+            if len(batch) == 1:
+                self._send_single(agent_name, batch[0])
+            else:
+                self._send_batch(agent_name, batch)
+        except Exception as error:
+            # Do not leave callers waiting forever.
+            for pending_message in batch:
+                if not pending_message.done.is_set():
+                    pending_message.set_response(MessageHTTPResponse({
+                        'success': False,
+                        'http_response': str(error),
+                        'message': 'Control message could not be sent to the Socontra Network.',
+                        'status_code': None
+                    }))
+
+    def _send_single(self, agent_name, pending_message):
+        with self.lock:
+            self.stats['single_requests'] += 1
+        pending_message.set_response(send_auth_message(agent_name, pending_message.json_message, pending_message.path, pending_message.api_crud_type))
+        return pending_message.response
+
+    def _send_batch(self, agent_name, batch):
+        responses = send_auth_message_batch(agent_name, [(pending_message.json_message, pending_message.path, pending_message.api_crud_type)
+                                                         for pending_message in batch], batch_control_path)
+        if responses is None:
+            # Batch not supported (404 or 405). Send each message as a single request. If the batch failed, each message has
+            # a failed response, and is not resent.
+            for pending_message in batch:
+                self._send_single(agent_name, pending_message)
+            return
+
+        with self.lock:
+            self.stats['batches'] += 1
+        for pending_message, response in zip(batch, responses):
+            pending_message.set_response(response)
+
+
+# Coalescer used by the Socontra Client for all agents in this process.
+control_coalescer = ControlMessageCoalescer()
+
+
+def send_control_message(agent_name: str, json_message: dict, path: str, api_crud_type: str):
+    # Send a protocol control message, batched with other control messages if config.control_message_coalescing is True.
+    if config.control_message_coalescing:
+        return control_coalescer.send(agent_name, json_message, path, api_crud_type)
+    return send_auth_message(agent_name, json_message, path, api_crud_type)
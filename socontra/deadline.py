@@ -0,0 +1,130 @@
+# Deadline propagation. Protocol messages carry deadlines (proposal_timeout, invite_offer_timeout, offer_timeout) as epoch
+# times, and there is no point finishing work after its deadline - the other agent has stopped waiting for the answer.
+# The deadline is kept in a thread-local deadline context while an endpoint processes a message (set by
+# Socontra.route_message()), or while code runs in a `with deadline(...)` block. Outbound calls made in the context get
+# a timeout from the time remaining until the deadline, never longer than a ceiling (config.http_request_timeout for
+# the Socontra Network), so a hung socket can't block an endpoint thread forever.
+# Once the deadline has passed, work is cancelled:
+#   - messages to the Socontra Network are not sent (send_auth_message() returns a local 408 response).
+#   - other outbound calls (e.g. to Shopify) raise DeadlineExpired, which ends the endpoint (see Socontra.route_message()).
+# Nested contexts can only shorten the deadline.
+# Messages received after their deadline has passed (e.g. from the backlog after a reconnect) are dropped before they are
+# routed to an endpoint (see message_expired()), and counted by agent and message type.
+
+import threading
+import time
+
+import config
+
+
+# Message deadlines by message type: the Message attribute that has the time a response is due.
+message_type_deadline_attribute = {
+    'new_task_request': 'proposal_timeout',
+    'invite_offer': 'invite_offer_timeout',
+    'offer': 'offer_timeout',
+}
+
+
+class DeadlineExpired(Exception):
+    pass
+
+
+_context = threading.local()
+
+
+class deadline:
+    # Context manager that sets the deadline (epoch time) for the code in the block. None keeps the current deadline.
+    def __init__(self, deadline_time: float = None):
+        self.deadline_time = deadline_time
+
+    def __enter__(self):
+        self.previous_deadline = current_deadline()
+        if self.deadline_time is not None and (self.previous_deadline is None or self.deadline_time < self.previous_deadline):
+            _context.deadline = self.deadline_time
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _context.deadline = self.previous_deadline
+        return False
+
+
+def current_deadline():
+    # Will return the deadline (epoch time) of the current context, or None if there is no deadline.
+    return getattr(_context, 'deadline', None)
+
+
+def time_remaining():
+    # Will return the time (seconds) remaining until the deadline of the current context, or None if there is no deadline.
+    deadline_time = current_deadline()
+    return None if deadline_time is None else deadline_time - time.time()
+
+
+def deadline_expired():
+    remaining = time_remaining()
+    return remaining is not None and remaining <= 0
+
+
+def request_timeout(ceiling):
+    # Will return the timeout to use for an outbound call in the current context: the time remaining until the deadline, but
+    # no longer than ceiling (seconds, or a (connect, read) tuple as used by requests). Raises DeadlineExpired if the deadline
+    # has passed.
+    remaining = time_remaining()
+    if remaining is None:
+        return ceiling
+    if remaining <= 0:
+        raise DeadlineExpired('Deadline expired before the call was made.')
+    if type(ceiling) == tuple:
+        return tuple(min(remaining, part) if part is not None else remaining for part in ceiling)
+    return min(remaining, ceiling) if ceiling is not None else remaining
+
+
+def message_deadline(received_message):
+    # Will return the deadline (epoch time) by which a response to received_message is due, or None if it has no deadline.
+    attribute = message_type_deadline_attribute.get(received_message.message_type)
+    deadline_time = getattr(received_message, attribute, None) if attribute is not None else None
+    return deadline_time if type(deadline_time) in [int, float] else None
+
+
+def envelope_deadline(protocol_message: dict, message_type: str = None):
+    # Same as message_deadline(), for a message received from the Socontra Network before it is converted to a Message.
+    attribute = message_type_deadline_attribute.get(message_type if message_type is not None else protocol_message.get('message_type'))
+    deadline_time = protocol_message.get(attribute) if attribute is not None else None
+    return deadline_time if type(deadline_time) in [int, float] else None
+
+
+# Number of expired messages dropped for each agent, by message type.
+global expired_message_stats
+expired_message_stats = {}
+expired_message_stats_lock = threading.Lock()
+
+
+def message_expired(agent_name: str, protocol_message: dict, message_type: str = None):
+    # Will return True if the deadline of a message received by agent_name has passed (or is less than 
+    # config.expired_message_margin seconds away), so it should not be routed to an endpoint. Expired messages are counted.
+    if not config.drop_expired_messages:
+        return False
+    deadline_time = envelope_deadline(protocol_message, message_type)
+    if deadline_time is None or deadline_time - time.time() > config.expired_message_margin:
+        return False
+
+    message_type = message_type if message_type is not None else protocol_message.get('message_type')
+    with expired_message_stats_lock:
+        agent_stats = expired_message_stats.setdefault(agent_name, {})
+        agent_stats[message_type] = agent_stats.get(message_type, 0) + 1
+    return True
+
+
+def expired_message_metrics():
+    # Will return the number of expired messages dropped for each agent, by message type.
+    with expired_message_stats_lock:
+        return {agent_name: dict(agent_stats) for agent_name, agent_stats in expired_message_stats.items()}
+
+
+def wrap_with_current_deadline(function):
+    # Will return a function that runs function in the deadline context of the caller. Used to carry the deadline into
+    # work done by other threads (e.g. the outbound queue).
+    deadline_time = current_deadline()
+    def run_with_deadline(*args, **kwargs):
+        with deadline(deadline_time):
+            return function(*args, **kwargs)
+    return run_with_deadline
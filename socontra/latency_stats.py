@@ -0,0 +1,227 @@
+# Latency statistics for consumer agents. Records how long each supplier agent takes to respond at each stage of a
+# service protocol, so that protocol timeouts (proposal_timeout, invite_offer_timeout, etc) can be set from observed
+# supplier response times rather than fixed guesses.
+# Stages are named after the consumer message that starts them:
+#   'new_request'   - new_request -> proposal (transact) or offer (allocate), or reject_task.
+#   'invite_offer'  - invite_offer -> offer or reject_invite_offer.
+#   'accept_offer'  - accept_offer -> payment_confirmed or payment_error.
+# The consumer marks the time a message is sent (mark_sent), and the response time is observed when a response is received
+# (observe). Suppliers that have not responded when the consumer stops waiting at the timeout are recorded as censored
+# samples at the time waited (record_no_response) - their response time is at least that long. Otherwise only responses
+# faster than the timeout would be recorded, and each suggested timeout would be shorter than the last. Response times are kept for each supplier and stage, and for each distribution list and stage (for requests
+# sent to groups, where suppliers are not known in advance).
+# Statistics are stored in the agent's database folder (socontra/database) so they persist between runs.
+
+import json
+import os
+import threading
+import time
+
+from collections import deque
+
+import config
+from socontra.response_tracker import expected_responders_from_distribution_list
+
+
+# The stage that each response message type completes.
+response_message_type_stage = {
+    'proposal': 'new_request',
+    'offer': 'new_request',
+    'reject_task': 'new_request',
+    'reject_invite_offer': 'invite_offer',
+    'payment_confirmed': 'accept_offer',
+    'payment_error': 'accept_offer',
+}
+
+
+class LatencyStats:
+    def __init__(self, agent_name: str = None, max_samples: int = None):
+        # agent_name: agent that the statistics are for. Used for the file the statistics are stored in. None to not store.
+        # max_samples: number of most recent response times kept for each supplier (or distribution list) and stage.
+        self.agent_name = agent_name
+        self.max_samples = max_samples if max_samples else config.latency_stats_max_samples
+
+        # Send time of messages waiting for responses: (dialogue_id, stage, receiver_name or None) -> (send time, distribution list key).
+        self.sent = {}
+        # Response times in seconds: (supplier agent name or distribution list key, stage) -> deque of response times.
+        self.samples = {}
+        self.lock = threading.Lock()
+        # Only one save at a time, so that concurrent saves (from endpoint threads and the orchestrator) don't interleave.
+        self.save_lock = threading.Lock()
+
+        self.load()
+
+    def mark_sent(self, dialogue_id: str, stage: str, receiver_name: str = None, distribution_list=None, send_time: float = None):
+        # Record the time a message starting stage was sent. receiver_name is the supplier the message was sent to, or None
+        # if the message was sent to a distribution list (e.g. new_request).
+        # If distribution_list is not given, the distribution list of the dialogue's request is used (if marked as sent).
+        # send_time is the time the message was sent (time.time()), if before the dialogue_id was known. Default is now.
+        with self.lock:
+            list_key = distribution_list_key(distribution_list)
+            if list_key is None:
+                list_key = next((list_key for (sent_dialogue_id, _, _), (_, list_key) in self.sent.items() 
+                                 if sent_dialogue_id == dialogue_id and list_key is not None), None)
+            self.sent[(dialogue_id, stage, receiver_name)] = (send_time if send_time is not None else time.time(), list_key)
+
+    def observe(self, received_message, stage: str = None):
+        # Record the response time of a received response message. The stage is found from the message type if not given.
+        # Will return the response time in seconds, or None if the message that started the stage was not marked as sent.
+        if stage is None:
+            stage = 'invite_offer' if received_message.message_type == 'offer' and received_message.protocol == 'transact' \
+                else response_message_type_stage.get(received_message.message_type)
+        if stage is None:
+            return None
+
+        now = time.time()
+        with self.lock:
+            sent = self.sent.get((received_message.dialogue_id, stage, received_message.sender_name))
+            if sent is None:
+                sent = self.sent.get((received_message.dialogue_id, stage, None))
+            if sent is None:
+                return None
+
+            send_time, list_key = sent
+            response_time = now - send_time
+            self._add_sample((received_message.sender_name, stage), response_time)
+            if list_key is not None:
+                self._add_sample((list_key, stage), response_time)
+
+        return response_time
+
+    def record_no_response(self, dialogue_id: str, stage: str, supplier_names: list = (), number_not_named: int = 0):
+        # Record suppliers that did not respond to the message that started stage before it timed out, as samples at the time
+        # waited since the message was sent. number_not_named is the number of other agents that received a request sent to
+        # a distribution list and did not respond (recorded for the distribution list only).
+        now = time.time()
+        with self.lock:
+            for supplier_name in supplier_names:
+                sent = self.sent.pop((dialogue_id, stage, supplier_name), None) or self.sent.get((dialogue_id, stage, None))
+                if sent is None:
+                    continue
+                send_time, list_key = sent
+                self._add_sample((supplier_name, stage), now - send_time)
+                if list_key is not None:
+                    self._add_sample((list_key, stage), now - send_time)
+
+            sent = self.sent.get((dialogue_id, stage, None))
+            if sent is not None and sent[1] is not None:
+                for _ in range(number_not_named):
+                    self._add_sample((sent[1], stage), now - sent[0])
+
+    def forget_dialogue(self, dialogue_id: str):
+        # Remove the send times for a dialogue once no more responses are expected.
+        with self.lock:
+            for key in [key for key in self.sent if key[0] == dialogue_id]:
+                del self.sent[key]
+
+    def percentile(self, name: str, stage: str, percent: float):
+        # Will return the percent percentile of the response times of supplier (or distribution list key) name for stage,
+        # or None if there are no response times.
+        with self.lock:
+            samples = sorted(self.samples.get((name, stage), []))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))]
+
+    def number_samples(self, name: str, stage: str):
+        with self.lock:
+            return len(self.samples.get((name, stage), []))
+
+    def suggest_timeout(self, stage: str, distribution_list=None, suppliers: list = None, default: float = None, percent: float = None,
+                        margin: float = None, minimum: float = None, maximum: float = None):
+        # Will suggest a timeout in seconds for stage, from the percent percentile (default p95) of observed response times
+        # plus a margin, so that most responses from the suppliers are received before the timeout.
+        # For suppliers (or a direct distribution list), the timeout is set by the slowest supplier. For distribution lists
+        # with groups, the response times of previous requests to the same distribution list are used.
+        # Will return default if there are not enough response times to suggest a timeout. The timeout is kept between
+        # minimum and maximum (default is between config.adaptive_timeout_minimum and default).
+        percent = percent if percent is not None else config.adaptive_timeout_percentile
+        margin = margin if margin is not None else config.adaptive_timeout_margin
+        minimum = minimum if minimum is not None else config.adaptive_timeout_minimum
+        maximum = maximum if maximum is not None else default
+
+        if suppliers is None:
+            suppliers = expected_responders_from_distribution_list(distribution_list)
+
+        if suppliers:
+            names = suppliers
+        elif distribution_list is not None:
+            names = [distribution_list_key(distribution_list)]
+        else:
+            return default
+
+        percentiles = []
+        for name in names:
+            if self.number_samples(name, stage) < config.adaptive_timeout_min_samples:
+                # Not enough is known about this supplier. Can't shorten the timeout without risking losing it.
+                return default
+            percentiles.append(self.percentile(name, stage, percent))
+
+        timeout = max(max(percentiles) + margin, minimum)
+        if maximum is not None:
+            timeout = min(timeout, maximum)
+        return timeout
+
+    def save(self):
+        # Store the response times in the agent's database folder.
+        if not self.agent_name:
+            return
+        # Write to a temporary file and replace the stored file, so that a save that fails part way leaves the previous
+        # file intact rather than a file load() can't read. The data is copied under save_lock so that an older copy
+        # can't replace a newer one.
+        temporary_filename = self._filename() + '.tmp'
+        with self.save_lock:
+            with self.lock:
+                data = [[name, stage, list(samples)] for (name, stage), samples in self.samples.items()]
+            try:
+                with open(temporary_filename, 'w') as data_to_store:
+                    data_to_store.write(json.dumps(data))
+                os.replace(temporary_filename, self._filename())
+            except OSError:
+                print('Unable to save latency statistics to file', self._filename())
+
+    def load(self):
+        # Load the response times stored in the agent's database folder.
+        if not self.agent_name or not os.path.isfile(self._filename()):
+            return
+        try:
+            with open(self._filename()) as f:
+                data = json.loads(f.read())
+        except (OSError, ValueError):
+            return
+        with self.lock:
+            for name, stage, samples in data:
+                self.samples[(name, stage)] = deque(samples, maxlen=self.max_samples)
+
+    def _add_sample(self, key, response_time):
+        if key not in self.samples:
+            self.samples[key] = deque(maxlen=self.max_samples)
+        self.samples[key].append(response_time)
+
+    def _filename(self):
+        agent_name_filesafe = "".join(i if i not in "\/:*?<>|" else "_" for i in self.agent_name)
+        return f'socontra/database/{agent_name_filesafe}-latency_stats.txt'
+
+
+def distribution_list_key(distribution_list):
+    # Key to store the response times for a distribution list.
+    if distribution_list is None:
+        return None
+    if type(distribution_list) == str:
+        return distribution_list
+    return json.dumps(distribution_list, sort_keys=True)
+
+
+# Latency statistics for each agent in this process.
+global latency_stats_by_agent_name
+latency_stats_by_agent_name = {}
+latency_stats_lock = threading.Lock()
+
+
+def get_latency_stats(agent_name: str):
+    # Will return the latency statistics for the agent, loading them from the agent's database folder the first time.
+    global latency_stats_by_agent_name
+    with latency_stats_lock:
+        if agent_name not in latency_stats_by_agent_name:
+            latency_stats_by_agent_name[agent_name] = LatencyStats(agent_name)
+        return latency_stats_by_agent_name[agent_name]
@@ -0,0 +1,106 @@
+# Compact replies. Each reply (reply_message, request_message, submit_proposal, submit_offer, change of order status, etc)
+# sends the message it is responding to as message_responding_to, and messages received carry it back again - including
+# the task, proposal, offer and order - so messages grow with each step of the protocol.
+# With config.compact_replies, replies send a reference to the message being responded to instead (message_id,
+# dialogue_id and message_type). Each agent keeps a cache of the messages it has recently sent (message_sent in the Socontra
+# Network response) and received, which is used to rebuild the full message_responding_to before a received message is
+# routed to an endpoint, so endpoints receive the same Message object as before.
+# If a referenced message is not in the cache (e.g. it was evicted, or sent before the agent restarted), the endpoint
+# receives a Message with only the fields in the reference.
+
+import threading
+
+from collections import OrderedDict
+
+import config
+
+
+# Fields sent in a reference to a message.
+reference_fields = ('message_id', 'dialogue_id', 'message_type')
+
+
+class MessageCache:
+    def __init__(self, max_messages: int = None):
+        self.max_messages = max_messages if max_messages is not None else config.message_cache_size
+        # Message contents by message_id, least recently used first.
+        self.messages = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'added': 0, 'hits': 0, 'misses': 0, 'evicted': 0}
+
+    def add(self, contents: dict):
+        # Add a message (dict of the message contents) to the cache. Messages without a message_id can't be referenced.
+        message_id = contents.get('message_id')
+        if message_id is None:
+            return
+        with self.lock:
+            self.messages[message_id] = contents
+            self.messages.move_to_end(message_id)
+            self.stats['added'] += 1
+            while len(self.messages) > self.max_messages:
+                self.messages.popitem(last=False)
+                self.stats['evicted'] += 1
+
+    def get(self, message_id: str):
+        # Will return the contents of the message with message_id, or None if not in the cache.
+        with self.lock:
+            contents = self.messages.get(message_id)
+            if contents is None:
+                self.stats['misses'] += 1
+                return None
+            self.messages.move_to_end(message_id)
+            self.stats['hits'] += 1
+            return contents
+
+
+# Message caches for each agent in this process.
+global message_caches_by_agent_name
+message_caches_by_agent_name = {}
+message_caches_lock = threading.Lock()
+
+
+def get_message_cache(agent_name: str):
+    # Will return the message cache for the agent.
+    global message_caches_by_agent_name
+    with message_caches_lock:
+        if agent_name not in message_caches_by_agent_name:
+            message_caches_by_agent_name[agent_name] = MessageCache()
+        return message_caches_by_agent_name[agent_name]
+
+
+def message_reference(contents: dict):
+    # Will return a reference to the message with contents.
+    reference = {field: contents.get(field) for field in reference_fields}
+    reference['reference'] = True
+    return reference
+
+
+def is_message_reference(message: dict):
+    return type(message) == dict and message.get('reference') is True
+
+
+def remember_message(agent_name: str, contents: dict):
+    # Cache a message sent or received by the agent, so replies that reference it can be rebuilt. Only needed for compact replies.
+    if config.compact_replies and type(contents) == dict:
+        get_message_cache(agent_name).add(contents)
+
+
+def responding_to(agent_name: str, message_responding_to):
+    # Will return message_responding_to (Message) to send in a reply from agent_name - the whole message, or a reference to
+    # the message if compact replies are enabled.
+    contents = message_responding_to.contents
+    if not config.compact_replies or contents.get('message_id') is None:
+        return contents
+    get_message_cache(agent_name).add(contents)
+    return message_reference(contents)
+
+
+def expand_message_reference(agent_name: str, message_responding_to: dict):
+    # Will return the full message for message_responding_to in a message received by agent_name, if it is a reference.
+    # If the referenced message is not in the cache, will return a message with only the fields in the reference.
+    if not is_message_reference(message_responding_to):
+        return message_responding_to
+    contents = get_message_cache(agent_name).get(message_responding_to['message_id'])
+    if contents is not None:
+        return contents
+    return {'sender_name': None, 'receiver_name': None, 'distribution_list': None, 'recipient_type': None, 'message': None,
+            'protocol': None, **{field: message_responding_to.get(field) for field in reference_fields}}
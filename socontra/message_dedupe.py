@@ -0,0 +1,139 @@
+# Deduplication of messages received from the Socontra Network. An agent can receive the same message more than once,
+# e.g. a consumer that is a member of several groups or regions a request was sent to, or an agent that reconnects with
+# clear_backlog=False and is sent messages it had already received. Routing a message twice runs the endpoint twice
+# (e.g. two product searches, or two carts created for the same order).
+# Each agent has a dedupe filter keyed by dialogue_id and message_id. Messages seen within config.message_dedupe_window
+# seconds are dropped before they are routed to an endpoint.
+#   - An LRU of the most recent config.message_dedupe_max_entries messages, with the time each was first seen.
+#   - An optional Bloom filter (config.message_dedupe_bloom_bits > 0), which remembers messages that have been evicted from
+#     the LRU, using a few bits per message. It has two generations that are rotated every window, so messages are
+#     remembered for between one and two windows. A Bloom filter can have false positives, so with it a small
+#     fraction of new messages (about config.message_dedupe_bloom_false_positive_rate) would be dropped - only enable it
+#     if the LRU can't be made large enough.
+# Messages without a message_id are not deduplicated.
+
+import hashlib
+import math
+import threading
+import time
+
+from collections import OrderedDict
+
+import config
+
+
+class BloomFilter:
+    def __init__(self, number_bits: int, number_hashes: int):
+        self.number_bits = number_bits
+        self.number_hashes = number_hashes
+        self.bits = bytearray((number_bits + 7) // 8)
+
+    def bit_positions(self, key: str):
+        # Double hashing (Kirsch-Mitzenmacher) from one 128 bit digest.
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        hash_1 = int.from_bytes(digest[:8], 'little')
+        hash_2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(hash_1 + index * hash_2) % self.number_bits for index in range(self.number_hashes)]
+
+    def add(self, key: str):
+        for position in self.bit_positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.bit_positions(key))
+
+
+def bloom_number_hashes(number_bits: int, false_positive_rate: float):
+    # Number of hash functions for a Bloom filter of number_bits with the target false positive rate.
+    return max(1, round(-math.log2(false_positive_rate))) if number_bits else 0
+
+
+class MessageDedupeFilter:
+    def __init__(self, max_entries: int = None, window: float = None, bloom_bits: int = None):
+        self.max_entries = max_entries if max_entries is not None else config.message_dedupe_max_entries
+        self.window = window if window is not None else config.message_dedupe_window
+        bloom_bits = bloom_bits if bloom_bits is not None else config.message_dedupe_bloom_bits
+        self.bloom_hashes = bloom_number_hashes(bloom_bits, config.message_dedupe_bloom_false_positive_rate)
+        self.bloom_bits = bloom_bits
+
+        # Time each message was first seen by key, oldest first.
+        self.recent = OrderedDict()
+        # Bloom filters for messages evicted from the LRU - current and previous generation.
+        self.bloom_current = BloomFilter(bloom_bits, self.bloom_hashes) if bloom_bits else None
+        self.bloom_previous = None
+        self.bloom_rotated_time = time.monotonic()
+
+        self.lock = threading.Lock()
+        self.stats = {'messages': 0, 'duplicates': 0, 'bloom_duplicates': 0, 'no_message_id': 0, 'evicted': 0}
+
+    def is_duplicate(self, dialogue_id: str, message_id: str):
+        # Will return True if the message has been seen within the window. Otherwise records the message and returns False.
+        if message_id is None:
+            with self.lock:
+                self.stats['messages'] += 1
+                self.stats['no_message_id'] += 1
+            return False
+
+        key = f'{dialogue_id}:{message_id}'
+        now = time.monotonic()
+        with self.lock:
+            self.stats['messages'] += 1
+            self._expire(now)
+
+            if key in self.recent:
+                self.stats['duplicates'] += 1
+                return True
+            if self.bloom_current is not None and (key in self.bloom_current or (self.bloom_previous is not None and key in self.bloom_previous)):
+                self.stats['duplicates'] += 1
+                self.stats['bloom_duplicates'] += 1
+                return True
+
+            self.recent[key] = now
+            while len(self.recent) > self.max_entries:
+                evicted_key, _ = self.recent.popitem(last=False)
+                self.stats['evicted'] += 1
+                if self.bloom_current is not None:
+                    self.bloom_current.add(evicted_key)
+            return False
+
+    def _expire(self, now):
+        # Forget messages seen more than window seconds ago, and rotate the Bloom filters every window.
+        while self.recent:
+            key, seen_time = next(iter(self.recent.items()))
+            if now - seen_time <= self.window:
+                break
+            del self.recent[key]
+
+        if self.bloom_current is not None and now - self.bloom_rotated_time > self.window:
+            self.bloom_previous = self.bloom_current
+            self.bloom_current = BloomFilter(self.bloom_bits, self.bloom_hashes)
+            self.bloom_rotated_time = now
+
+
+# Dedupe filters for each agent in this process.
+global dedupe_filters_by_agent_name
+dedupe_filters_by_agent_name = {}
+dedupe_filters_lock = threading.Lock()
+
+
+def get_dedupe_filter(agent_name: str):
+    # Will return the dedupe filter for the agent.
+    global dedupe_filters_by_agent_name
+    with dedupe_filters_lock:
+        if agent_name not in dedupe_filters_by_agent_name:
+            dedupe_filters_by_agent_name[agent_name] = MessageDedupeFilter()
+        return dedupe_filters_by_agent_name[agent_name]
+
+
+def is_duplicate_message(agent_name: str, protocol_message: dict):
+    # Will return True if agent_name has already received protocol_message (within the dedupe window).
+    if not config.message_dedupe:
+        return False
+    return get_dedupe_filter(agent_name).is_duplicate(protocol_message.get('dialogue_id'), protocol_message.get('message_id'))
+
+
+def dedupe_metrics():
+    # Will return the dedupe metrics for each agent, including the number of messages held in the LRU.
+    with dedupe_filters_lock:
+        dedupe_filters = dict(dedupe_filters_by_agent_name)
+    return {agent_name: dict(dedupe_filter.stats, recent=len(dedupe_filter.recent)) for agent_name, dedupe_filter in dedupe_filters.items()}
@@ -0,0 +1,72 @@
+# Asynchronous outbound send queue. Socontra send functions (submit_offer, reject_invite_offer, close_dialogue, etc) block
+# the calling thread until the Socontra Network responds. With the outbound queue, an endpoint can hand off the send
+# and return straight away (see Socontra.send_async()), freeing the thread that processes received messages sooner.
+# Each agent has its own outbound queue, split into shards with one background worker each. Sends with an ordering key
+# (the dialogue_id by default) always go to the same shard, so they are sent in the order they were queued - e.g.
+# reject_invite_offer is sent before close_dialogue for the same dialogue. Sends without a key are spread across shards.
+# Each send returns a future (concurrent.futures.Future) with the MessageHTTPResponse of the send as its result.
+
+import itertools
+import queue
+import threading
+import zlib
+
+from concurrent.futures import Future
+
+from socontra.deadline import wrap_with_current_deadline
+import config
+
+
+class OutboundQueue:
+    def __init__(self, agent_name: str, number_shards: int = None):
+        self.agent_name = agent_name
+        self.number_shards = number_shards if number_shards else config.outbound_queue_shards
+        self.shards = [queue.Queue() for _ in range(self.number_shards)]
+        self.round_robin = itertools.count()
+
+        for shard_number, shard in enumerate(self.shards):
+            threading.Thread(target=self._worker, args=(shard,), daemon=True,
+                             name=f'socontra_outbound_{agent_name}_{shard_number}').start()
+
+    def submit(self, send_function, *args, ordering_key: str = None, **kwargs):
+        # Queue send_function(*args, **kwargs) to be sent by a background worker. Will return a future with the result of
+        # send_function. Sends with the same ordering_key are sent one at a time in the order they were queued.
+        future = Future()
+        if ordering_key is not None:
+            shard = self.shards[zlib.crc32(str(ordering_key).encode()) % self.number_shards]
+        else:
+            shard = self.shards[next(self.round_robin) % self.number_shards]
+        # The send is made in the deadline context of the caller (see socontra/deadline.py), so it is cancelled if the
+        # deadline passes while it is waiting in the queue.
+        shard.put((future, wrap_with_current_deadline(send_function), args, kwargs))
+        return future
+
+    def pending(self):
+        # Number of sends waiting to be sent.
+        return sum(shard.qsize() for shard in self.shards)
+
+    def _worker(self, shard):
+        while True:
+            future, send_function, args, kwargs = shard.get()
+            if not future.set_running_or_notify_cancel():
+                # The future was cancelled before it was sent.
+                continue
+            try:
+                future.set_result(send_function(*args, **kwargs))
+            except Exception as error:
+                future.set_exception(error)
+
+
+# Outbound queues for each agent in this process.
+global outbound_queues_by_agent_name
+outbound_queues_by_agent_name = {}
+outbound_queues_lock = threading.Lock()
+
+
+def get_outbound_queue(agent_name: str):
+    # Will return the outbound queue for the agent, starting its workers the first time.
+    global outbound_queues_by_agent_name
+    with outbound_queues_lock:
+        if agent_name not in outbound_queues_by_agent_name:
+            outbound_queues_by_agent_name[agent_name] = OutboundQueue(agent_name)
+        return outbound_queues_by_agent_name[agent_name]
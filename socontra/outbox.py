@@ -0,0 +1,217 @@
+# Durable outbox for protocol messages. If the agent's process stops between deciding to send a message and the Socontra
+# Network receiving it (e.g. during accept_offer or payment_confirmed), the message is lost and the dialogue stalls until
+# it times out. With the durable outbox (config.durable_outbox = True), protocol messages sent to the paths in
+# config.durable_outbox_paths are first recorded in a SQLite database (WAL mode) in the agent's database folder, and only
+# removed once the Socontra Network has responded. When the agent connects again, messages that were recorded but not
+# acknowledged are sent again (replayed).
+# Each message is sent with an idempotency key (Idempotency-Key header), which is the same when the message is replayed,
+# so that the Socontra Network can recognise and ignore a message it has already processed.
+# Records are written to disk by a single writer thread. Messages recorded at about the same time are written in one
+# transaction (group commit), so that many agents and endpoints sending at once share the cost of each disk flush.
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from socontra.comms import MessageHTTPResponse, send_auth_message
+from socontra.circuit_breaker import add_degrade_hook, add_recovery_hook
+import config
+
+
+class DurableOutbox:
+    def __init__(self, agent_name: str, filename: str = None):
+        self.agent_name = agent_name
+        self.filename = filename if filename else outbox_filename(agent_name)
+
+        self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=FULL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS outbox (idempotency_key TEXT PRIMARY KEY, path TEXT, api_crud_type TEXT, '
+                                'json_message TEXT, created_time REAL)')
+        self.connection.commit()
+        self.lock = threading.Lock()
+        # Idempotency keys of messages being sent by send(), which replay() must not send again. Only one replay at a time.
+        self.in_flight = set()
+        self.replay_lock = threading.Lock()
+
+        # Writes waiting for the writer thread: ('record', row, event) or ('acknowledge', idempotency_key, None).
+        self.writes = queue.Queue()
+        self.stats = {'recorded': 0, 'acknowledged': 0, 'commits': 0, 'replayed': 0}
+        threading.Thread(target=self._writer, daemon=True, name=f'socontra_outbox_{agent_name}').start()
+
+    def record(self, json_message: dict, path: str, api_crud_type: str, idempotency_key: str = None):
+        # Record a message to send. Will return once the message is written to disk, with the message's idempotency key.
+        idempotency_key = idempotency_key if idempotency_key else uuid.uuid4().hex
+        written = threading.Event()
+        self.writes.put(('record', (idempotency_key, path, api_crud_type, json.dumps(json_message), time.time()), written))
+        written.wait()
+        return idempotency_key
+
+    def acknowledge(self, idempotency_key: str):
+        # Remove a message once the Socontra Network has responded to it. Does not wait for the disk write - if it is lost,
+        # the message is replayed and the Socontra Network will ignore it by its idempotency key.
+        self.writes.put(('acknowledge', idempotency_key, None))
+
+    def send(self, json_message: dict, path: str, api_crud_type: str):
+        # Record the message, send it to the Socontra Network and remove it once the Socontra Network has responded.
+        # If sending fails (e.g. the Socontra Network can't be reached), the message stays in the outbox to be replayed.
+        idempotency_key = uuid.uuid4().hex
+        with self.lock:
+            self.in_flight.add(idempotency_key)
+        try:
+            self.record(json_message, path, api_crud_type, idempotency_key)
+            response = send_auth_message(self.agent_name, json_message, path, api_crud_type, idempotency_key=idempotency_key)
+        finally:
+            with self.lock:
+                self.in_flight.discard(idempotency_key)
+        if network_responded(response):
+            self.acknowledge(idempotency_key)
+        return response
+
+    def unacknowledged(self):
+        # Will return the messages not yet acknowledged as a list of (idempotency_key, json_message, path, api_crud_type), oldest first.
+        # Messages that send() is still sending are not included.
+        with self.lock:
+            rows = self.connection.execute('SELECT idempotency_key, json_message, path, api_crud_type FROM outbox ORDER BY created_time').fetchall()
+            in_flight = set(self.in_flight)
+        return [(idempotency_key, json.loads(json_message), path, api_crud_type) for idempotency_key, json_message, path, api_crud_type in rows
+                if idempotency_key not in in_flight]
+
+    def replay(self):
+        # Send the messages that were recorded but not acknowledged, e.g. because the agent's process stopped before the
+        # Socontra Network responded. Messages older than config.durable_outbox_max_age seconds are dropped, as their
+        # dialogues will have timed out. Will return the number of messages replayed.
+        # If a replay is already running (e.g. on connection and from the circuit breaker recovery hook), will return 0
+        # straight away, so that messages are not sent twice.
+        if not self.replay_lock.acquire(blocking=False):
+            return 0
+        try:
+            return self._replay()
+        finally:
+            self.replay_lock.release()
+
+    def _replay(self):
+        oldest_time = time.time() - config.durable_outbox_max_age
+        with self.lock:
+            expired = self.connection.execute('SELECT idempotency_key FROM outbox WHERE created_time < ?', (oldest_time,)).fetchall()
+        for (idempotency_key,) in expired:
+            self.acknowledge(idempotency_key)
+
+        expired_keys = {idempotency_key for (idempotency_key,) in expired}
+        number_replayed = 0
+        for idempotency_key, json_message, path, api_crud_type in self.unacknowledged():
+            if idempotency_key in expired_keys:
+                continue
+            try:
+                response = send_auth_message(self.agent_name, json_message, path, api_crud_type, idempotency_key=idempotency_key)
+            except Exception as error:
+                print(f'Could not replay outbox message for agent {self.agent_name} to {path}. Will try again on next connection. Error: {error}')
+                continue
+            if network_responded(response):
+                self.acknowledge(idempotency_key)
+            number_replayed += 1
+
+        self.stats['replayed'] += number_replayed
+        return number_replayed
+
+    def _writer(self):
+        while True:
+            # Take all writes that are waiting and commit them in one transaction (group commit).
+            writes = [self.writes.get()]
+            while len(writes) < config.durable_outbox_max_group_commit:
+                try:
+                    writes.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [row for write_type, row, _ in writes if write_type == 'record']
+            acknowledgements = [(idempotency_key,) for write_type, idempotency_key, _ in writes if write_type == 'acknowledge']
+            try:
+                with self.lock:
+                    self.connection.executemany('INSERT OR REPLACE INTO outbox VALUES (?, ?, ?, ?, ?)', records)
+                    self.connection.executemany('DELETE FROM outbox WHERE idempotency_key = ?', acknowledgements)
+                    self.connection.commit()
+                self.stats['recorded'] += len(records)
+                self.stats['acknowledged'] += len(acknowledgements)
+                self.stats['commits'] += 1
+            except sqlite3.Error as error:
+                print(f'Unable to write to outbox for agent {self.agent_name}. Error: {error}')
+
+            # Release the senders waiting for their messages to be recorded.
+            for _, _, written in writes:
+                if written is not None:
+                    written.set()
+
+
+def network_responded(response):
+    # True if the Socontra Network responded to the message, so it can be removed from the outbox. Not for messages that
+    # failed on the Socontra Network (5xx), could not be sent, or were queued in the outbox while the circuit breaker is open.
+    return response.success is not None and response.status_code is not None and response.status_code < 500
+
+
+def outbox_filename(agent_name: str):
+    agent_name_filesafe = "".join(i if i not in "\/:*?<>|" else "_" for i in agent_name)
+    return f'socontra/database/{agent_name_filesafe}-outbox.db'
+
+
+# Durable outboxes for each agent in this process.
+global outboxes_by_agent_name
+outboxes_by_agent_name = {}
+outboxes_lock = threading.Lock()
+
+
+def get_outbox(agent_name: str):
+    # Will return the durable outbox for the agent, opening its database the first time.
+    global outboxes_by_agent_name
+    with outboxes_lock:
+        if agent_name not in outboxes_by_agent_name:
+            outboxes_by_agent_name[agent_name] = DurableOutbox(agent_name)
+        return outboxes_by_agent_name[agent_name]
+
+
+def send_protocol_message(agent_name: str, json_message: dict, path: str, api_crud_type: str):
+    # Send a protocol message to the Socontra Network, through the agent's durable outbox if config.durable_outbox is True
+    # and path is one of config.durable_outbox_paths.
+    if config.durable_outbox and path in config.durable_outbox_paths:
+        return get_outbox(agent_name).send(json_message, path, api_crud_type)
+    return send_auth_message(agent_name, json_message, path, api_crud_type)
+
+
+def replay_outbox(agent_name: str):
+    # Replay the agent's unacknowledged outbox messages, if the durable outbox is enabled or the agent has an outbox
+    # database from a previous run. Will return the number of messages replayed.
+    if not config.durable_outbox and not os.path.isfile(outbox_filename(agent_name)):
+        return 0
+    return get_outbox(agent_name).replay()
+
+
+def queue_to_outbox_when_circuit_open(agent_name, json_message, path, api_crud_type, idempotency_key):
+    # Circuit breaker degrade hook. While the Socontra Network is failing, protocol messages to config.durable_outbox_paths
+    # are recorded in the agent's durable outbox (if enabled), to be sent when the Socontra Network recovers. Messages already
+    # recorded by DurableOutbox.send() have the same idempotency key, so they are not recorded twice. Other messages fail as usual.
+    # The response has status code 202 and success None - the message is queued, neither sent nor failed.
+    if not config.durable_outbox or not config.outbox_when_circuit_open or path not in config.durable_outbox_paths:
+        return None
+    get_outbox(agent_name).record(json_message, path, api_crud_type, idempotency_key)
+    return MessageHTTPResponse({
+            'success': None,
+            'http_response': 'The Socontra Network is unavailable. Message recorded in the outbox and will be sent when the Socontra Network recovers.',
+            'message': 'Message queued in the outbox.',
+            'status_code': 202
+        })
+
+
+def replay_all_outboxes():
+    # Circuit breaker recovery hook. Replay the outbox of each agent in this process.
+    with outboxes_lock:
+        outboxes = list(outboxes_by_agent_name.values())
+    for outbox in outboxes:
+        outbox.replay()
+
+
+add_degrade_hook('message', queue_to_outbox_when_circuit_open)
+add_recovery_hook('message', replay_all_outboxes)
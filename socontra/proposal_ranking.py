@@ -0,0 +1,75 @@
+# Ranking of proposals received by consumer agents during the search and evaluation stage of the 'transact' protocol.
+# Proposals are kept in a heap ordered by cost (lowest cost is best), bounded to the top_k best proposals so that
+# evaluating many proposals stays cheap. The best proposal is popped from the heap in O(log k).
+# The ranking also decides when the consumer can stop waiting for proposals before the proposal_timeout expires
+# (early stop policy): stop when target_count proposals have a cost at or below target_cost.
+# Stopping when every agent has responded is handled by socontra/response_tracker.py.
+
+import heapq
+import itertools
+
+
+class ProposalRanking:
+    def __init__(self, top_k: int = None, target_cost: float = None, target_count: int = None):
+        # top_k: number of best proposals to keep. None keeps all proposals.
+        # target_cost: cost at or below which a proposal is 'good enough' for the early stop policy. None to disable.
+        # target_count: number of good enough proposals required to stop early. Default is top_k, or 1 if top_k is None.
+        self.top_k = top_k
+        self.target_cost = target_cost
+        self.target_count = target_count if target_count else (top_k if top_k else 1)
+        self.number_below_target = 0
+        self.number_proposals = 0
+
+        # While collecting proposals, the heap has the worst proposal at the top so it can be dropped when there are more
+        # than top_k proposals. When proposals are popped, the heap is converted so that the best proposal is at the top.
+        self.heap = []
+        self.popping = False
+        self.counter = itertools.count()
+
+    def add(self, cost: float, proposal, *proposal_data):
+        # Add a proposal and its cost. proposal_data is any other data to return with the proposal when popped.
+        # The counter breaks ties between proposals with the same cost - the proposal received first is preferred.
+        count = next(self.counter)
+        self.number_proposals += 1
+
+        if self.target_cost is not None and cost <= self.target_cost:
+            self.number_below_target += 1
+
+        if self.popping:
+            heapq.heappush(self.heap, (cost, count, (cost, count, proposal) + proposal_data))
+        elif self.top_k is not None and len(self.heap) >= self.top_k:
+            # Replace the worst proposal if this proposal is better.
+            worst_cost, worst_count = -self.heap[0][0], -self.heap[0][1]
+            if (cost, count) < (worst_cost, worst_count):
+                heapq.heapreplace(self.heap, (-cost, -count, (cost, count, proposal) + proposal_data))
+        else:
+            heapq.heappush(self.heap, (-cost, -count, (cost, count, proposal) + proposal_data))
+
+    def should_stop(self):
+        # Early stop policy. True if the consumer can stop waiting for proposals.
+        return self.target_cost is not None and self.number_below_target >= self.target_count
+
+    def pop_best(self):
+        # Will remove and return the best proposal as a tuple (cost, counter, proposal, *proposal_data), or None if empty.
+        if not self.popping:
+            self.heap = [(-negative_cost, -negative_count, entry) for negative_cost, negative_count, entry in self.heap]
+            heapq.heapify(self.heap)
+            self.popping = True
+        if not self.heap:
+            return None
+        return heapq.heappop(self.heap)[2]
+
+    def push_back(self, proposal_tuple):
+        # Return a proposal popped by pop_best() to the ranking, in its original place (same cost and counter).
+        cost, count = proposal_tuple[0], proposal_tuple[1]
+        if self.popping:
+            heapq.heappush(self.heap, (cost, count, proposal_tuple))
+        else:
+            heapq.heappush(self.heap, (-cost, -count, proposal_tuple))
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __bool__(self):
+        return len(self.heap) > 0
+
@@ -0,0 +1,174 @@
+# Client-side rate limiting of requests to the Socontra Network. Without it, an agent can send as fast as its threads allow,
+# and an agent flooding the Socontra Network gets throttled (HTTP 429) with every other agent in the client.
+# Each agent has a token bucket for all its requests (config.rate_limit_agent), and a token bucket for each API path with
+# its own limit (config.rate_limit_paths). A request takes a token from both buckets before it is sent, waiting for the
+# buckets to refill if needed - so bursts are smoothed out to the configured rate.
+# Requests waiting for tokens are served in order of priority class, then in the order they arrived, so that protocol
+# control messages (close_dialogue, accept_offer, payment_confirmed, etc) are not held up behind bulk broadcasts.
+# Only requests whose path bucket has a token are in the queue for the agent's bucket - a request waiting for its own path
+# bucket (e.g. a broadcast waiting for the broadcast limit) does not hold up requests to other paths.
+# Priority classes (lower is served first) are set for each path by config.rate_limit_priority_paths.
+
+import bisect
+import itertools
+import threading
+import time
+
+import config
+
+
+priority_classes = {'control': 0, 'protocol': 1, 'bulk': 2}
+
+
+class TokenBucket:
+    # Token bucket. Also used as the rate limit budget for a shop's Shopify API calls
+    # (protocol_templates/online_stores/shopify_shops.py).
+    def __init__(self, rate: float, burst: float):
+        # rate: tokens added per second. burst: maximum number of tokens (requests that can be sent at once).
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_time) * self.rate)
+        self.updated_time = now
+
+    def time_until_token(self):
+        # Time (seconds) until the bucket has a token. Bucket must be refilled first.
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        # Wait until a token is available, then take it. Thread safe, for buckets used on their own (not by AgentRateLimiter,
+        # which uses its buckets under its own lock).
+        while True:
+            with self.lock:
+                self.refill(time.monotonic())
+                time_to_wait = self.time_until_token()
+                if time_to_wait == 0:
+                    self.tokens -= 1
+                    return
+            time.sleep(time_to_wait)
+
+
+class AgentRateLimiter:
+    # Token buckets and the queue of requests waiting for tokens for one agent.
+    def __init__(self, agent_name: str):
+        self.agent_name = agent_name
+        rate, burst = config.rate_limit_agent
+        self.agent_bucket = TokenBucket(rate, burst)
+        self.path_buckets = {}
+
+        self.waiting = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+
+        self.stats = {'requests': 0, 'requests_delayed': 0, 'requests_timed_out': 0, 'total_wait_time': 0.0, 'max_wait_time': 0.0,
+                      'requests_by_priority': {priority_class: 0 for priority_class in priority_classes}}
+
+    def acquire(self, path: str, priority_class: str = None, timeout: float = None):
+        # Wait until a request to path can be sent, and take its tokens. Will return the time waited (seconds), or None
+        # (without taking any tokens) if the request could not be sent within timeout seconds (None to wait as long as needed).
+        priority_class = priority_class if priority_class else priority_class_for_path(path)
+        path_bucket = self._get_path_bucket(path)
+        start_time = time.monotonic()
+        end_time = start_time + timeout if timeout is not None else None
+
+        with self.condition:
+            # Requests waiting for tokens, in the order they are served: (priority, counter, path bucket).
+            waiter = (priority_classes[priority_class], next(self.counter), path_bucket)
+            bisect.insort(self.waiting, waiter, key=lambda waiting: waiting[:2])
+            while True:
+                now = time.monotonic()
+                self.agent_bucket.refill(now)
+                next_waiter = self._next_waiter(now)
+
+                if next_waiter is waiter:
+                    wait_time = self.agent_bucket.time_until_token()
+                    if wait_time == 0:
+                        self.agent_bucket.tokens -= 1
+                        if path_bucket is not None:
+                            path_bucket.tokens -= 1
+                        self.waiting.remove(waiter)
+                        # Let the next request in the queue check the buckets.
+                        self.condition.notify_all()
+                        break
+                elif path_bucket is not None and path_bucket.tokens < 1:
+                    # Waiting for a token in this request's path bucket.
+                    wait_time = path_bucket.time_until_token()
+                else:
+                    # Another request is ahead in the queue for the agent's bucket.
+                    wait_time = None
+
+                if end_time is not None:
+                    if now >= end_time:
+                        self.waiting.remove(waiter)
+                        self.condition.notify_all()
+                        self.stats['requests_timed_out'] += 1
+                        return None
+                    wait_time = min(wait_time, end_time - now) if wait_time is not None else end_time - now
+                self.condition.wait(wait_time)
+
+            waited = time.monotonic() - start_time
+            self.stats['requests'] += 1
+            self.stats['requests_by_priority'][priority_class] += 1
+            if waited > 0.001:
+                self.stats['requests_delayed'] += 1
+            self.stats['total_wait_time'] += waited
+            self.stats['max_wait_time'] = max(self.stats['max_wait_time'], waited)
+
+        return waited
+
+    def _next_waiter(self, now):
+        # Will return the first request in the queue whose path bucket has a token (the next request to take a token from
+        # the agent's bucket), or None.
+        for waiter in self.waiting:
+            path_bucket = waiter[2]
+            if path_bucket is None:
+                return waiter
+            path_bucket.refill(now)
+            if path_bucket.tokens >= 1:
+                return waiter
+        return None
+
+    def queue_length(self):
+        # Number of requests waiting for tokens.
+        with self.condition:
+            return len(self.waiting)
+
+    def _get_path_bucket(self, path):
+        if path not in config.rate_limit_paths:
+            return None
+        with self.condition:
+            if path not in self.path_buckets:
+                rate, burst = config.rate_limit_paths[path]
+                self.path_buckets[path] = TokenBucket(rate, burst)
+            return self.path_buckets[path]
+
+
+def priority_class_for_path(path: str):
+    # Will return the priority class of requests to path: 'control', 'protocol' or 'bulk'.
+    return config.rate_limit_priority_paths.get(path, 'protocol')
+
+
+# Rate limiters for each agent in this process.
+global rate_limiters_by_agent_name
+rate_limiters_by_agent_name = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(agent_name: str):
+    # Will return the rate limiter for the agent, creating it the first time.
+    global rate_limiters_by_agent_name
+    with rate_limiters_lock:
+        if agent_name not in rate_limiters_by_agent_name:
+            rate_limiters_by_agent_name[agent_name] = AgentRateLimiter(agent_name)
+        return rate_limiters_by_agent_name[agent_name]
+
+
+def rate_limit_metrics():
+    # Will return the rate limiting metrics for each agent, including the number of requests waiting for tokens.
+    with rate_limiters_lock:
+        rate_limiters = dict(rate_limiters_by_agent_name)
+    return {agent_name: dict(rate_limiter.stats, queue_length=rate_limiter.queue_length()) for agent_name, rate_limiter in rate_limiters.items()}
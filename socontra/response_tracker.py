@@ -0,0 +1,108 @@
+# Tracks the responses received by a consumer agent to a new_request, so that the consumer orchestrator can stop waiting
+# for responses as soon as every agent that received the request has responded, rather than waiting for the whole timeout.
+# The number of agents expected to respond is taken from the Socontra Network response to the new_request (if the network
+# reports the number of agents the request was delivered to), or from the distribution list if the request was only sent
+# directly to agents.
+# Responses (proposals, offers, reject_task) are counted per dialogue, so that late responses to an earlier request are
+# not counted towards the current request.
+
+import threading
+
+
+class ResponseTracker:
+    def __init__(self, dialogue_id: str = None, expected_responders: list = None, expected_count: int = None):
+        # dialogue_id: dialogue of the request. Responses for other dialogues are not counted towards this request.
+        #              If None, all responses are counted.
+        # expected_responders: list of agent names that received the request, if known.
+        # expected_count: number of agents that received the request, if known.
+        self.dialogue_id = dialogue_id
+        self.expected_responders = set(expected_responders) if expected_responders is not None else None
+        if expected_count is None and self.expected_responders is not None:
+            expected_count = len(self.expected_responders)
+        self.expected_count = expected_count
+
+        # For each dialogue, the agents that have responded and the number of responses of each message type.
+        self.dialogues = {}
+        self.lock = threading.Lock()
+
+    def record(self, received_message):
+        # Record a response (Message) from a supplier. Will return True if the response is for this request's dialogue.
+        with self.lock:
+            dialogue = self.dialogues.setdefault(received_message.dialogue_id, {'responders': set(), 'message_types': {}})
+            dialogue['responders'].add(received_message.sender_name)
+            dialogue['message_types'][received_message.message_type] = dialogue['message_types'].get(received_message.message_type, 0) + 1
+
+        return self.dialogue_id is None or received_message.dialogue_id == self.dialogue_id
+
+    def count(self, message_type: str = None, dialogue_id: str = None):
+        # Will return the number of responses for the dialogue (default is the request's dialogue) of message_type,
+        # e.g. 'proposal', 'offer' or 'reject_task'. If message_type is None, the number of all responses.
+        dialogue = self._get_dialogue(dialogue_id)
+        if dialogue is None:
+            return 0
+        if message_type is None:
+            return sum(dialogue['message_types'].values())
+        return dialogue['message_types'].get(message_type, 0)
+
+    def responders(self, dialogue_id: str = None):
+        # Will return the set of agents that have responded in the dialogue (default is the request's dialogue).
+        dialogue = self._get_dialogue(dialogue_id)
+        return set(dialogue['responders']) if dialogue is not None else set()
+
+    def all_responded(self):
+        # True if every agent that received the request has responded. False if the number of agents is not known.
+        responders = self.responders()
+        if self.expected_responders is not None:
+            return self.expected_responders <= responders
+        if self.expected_count is not None:
+            return len(responders) >= self.expected_count
+        return False
+
+    def non_responders(self):
+        # Will return (agents that received the request and have not responded, number of other agents that received the
+        # request and have not responded). The agents are only known if the request was sent directly to agents.
+        responders = self.responders()
+        if self.expected_responders is not None:
+            return list(self.expected_responders - responders), 0
+        if self.expected_count is not None:
+            return [], max(self.expected_count - len(responders), 0)
+        return [], 0
+
+    def _get_dialogue(self, dialogue_id):
+        with self.lock:
+            if dialogue_id is None and self.dialogue_id is None:
+                # Not tracking a specific dialogue. Combine all dialogues.
+                combined = {'responders': set(), 'message_types': {}}
+                for dialogue in self.dialogues.values():
+                    combined['responders'] |= dialogue['responders']
+                    for message_type, number in dialogue['message_types'].items():
+                        combined['message_types'][message_type] = combined['message_types'].get(message_type, 0) + number
+                return combined
+            return self.dialogues.get(dialogue_id if dialogue_id is not None else self.dialogue_id)
+
+
+def expected_responders_from_distribution_list(distribution_list):
+    # Will return the list of agents expected to respond to a request sent to distribution_list, or None if not known
+    # (the request was sent to groups or regions, so the number of recipients is only known by the Socontra Network).
+    if type(distribution_list) == str:
+        return [distribution_list]
+    if type(distribution_list) == dict and 'direct' in distribution_list and 'groups' not in distribution_list:
+        return list(distribution_list['direct'])
+    return None
+
+
+def expected_count_from_network_response(network_response):
+    # Will return the number of agents the request was delivered to, if reported by the Socontra Network in the response to
+    # the new_request (http_response 'number_recipients'). Otherwise None.
+    if network_response is None or not network_response.success or type(network_response.http_response) != dict:
+        return None
+    number_recipients = network_response.http_response.get('number_recipients')
+    return number_recipients if type(number_recipients) == int else None
+
+
+def create_response_tracker(network_response, distribution_list):
+    # Create a response tracker for a new_request sent to distribution_list, with network_response the response from
+    # the Socontra Network (socontra.new_request()).
+    dialogue_id = network_response.message.dialogue_id if network_response is not None and network_response.message is not None else None
+    return ResponseTracker(dialogue_id=dialogue_id, expected_responders=expected_responders_from_distribution_list(distribution_list),
+                           expected_count=expected_count_from_network_response(network_response))
@@ -3,6 +3,13 @@
 
 from socontra.comms import MessageHTTPResponse, Message, send_auth_message, return_message_object, prepare_agent_api, agent_already_registered, \
                             register_new_agent, recreate_agent_same_credentials, agent_receive_messages, is_agent_already_registered
+from socontra.control_coalescer import send_control_message
+from socontra.bulk_send import send_many_prepared, send_batch_prepared
+from socontra.outbound_queue import get_outbound_queue
+from socontra.outbox import send_protocol_message, replay_outbox
+from socontra.deadline import deadline, message_deadline, DeadlineExpired
+from socontra.message_cache import responding_to, remember_message, expand_message_reference
+from socontra.backlog import catch_up_backlog
 
 import queue
 import time
@@ -112,6 +119,10 @@ class Socontra:
         # Connect the agent to the Socontra Network to receive messages via Server-Sent Events (SSE).
         self.connect_agent_to_socontra_network(agent_data['agent_name'], clear_backlog)
 
+        # Send any protocol messages that were recorded in the agent's durable outbox but not received by the Socontra Network,
+        # e.g. because the agent's process stopped while sending them.
+        replay_outbox(agent_data['agent_name'])
+
         return response
 
 
@@ -360,6 +371,15 @@ class Socontra:
         # Will send a new message (new dialogue) to one or more agents. This is a general purpose communication/messaging service for agents
         # to communicate what ever they want for their specific use case. The contents of the message is a string or dict/json. 
 
+        # Send the message to the Socontra Network to process.
+        http_response = send_auth_message(agent_name, *self._prepare_new_message(agent_name, distribution_list, message, message_type, recipient_type, protocol))
+
+        return http_response
+
+
+    def _prepare_new_message(self, agent_name, distribution_list, message, message_type='new_message', recipient_type='recipient', protocol='socontra'):
+        # Will return the new_message to send to the Socontra Network as (json_message, path, api_crud_type).
+
         if not self.validate_distribution_list(distribution_list):
             raise ValueError('distribution_list error.')
         
@@ -367,10 +387,7 @@ class Socontra:
         json_message = self.create_json_dict(agent_name=agent_name, distribution_list=distribution_list, message=message, 
                                              message_type=message_type, recipient_type=recipient_type, protocol=protocol)
 
-        # Send the message to the Socontra Network to process.
-        http_response = send_auth_message(agent_name, json_message, '/agent_message/message/', 'POST')
-
-        return http_response
+        return json_message, '/agent_message/message/', 'POST'
 
 
     def reply_message(self, agent_name: str, message_reply: str | dict, message_responding_to: Message, message_type: str='message_response', recipient_type: str='recipient'):
@@ -393,7 +410,7 @@ class Socontra:
     
         # Create a json message with the message variables to send to the Socontra Network.
         json_message = self.create_json_dict(agent_name=agent_name, receiver_name=receiver_name, message_reply=message_reply, 
-                                             message_responding_to=message_responding_to.contents, message_type=message_type, 
+                                             message_responding_to=responding_to(agent_name, message_responding_to), message_type=message_type, 
                                              recipient_type=recipient_type)
 
         http_response = send_auth_message(agent_name, json_message, '/agent_message/reply_message/', 'POST')
@@ -406,6 +423,14 @@ class Socontra:
         # to communicate what even they want for their specific use case. The contents of the message can be anything the agents wants. 
         # Socontra just facilitates the communications between agents..
 
+        http_response = send_auth_message(agent_name, *self._prepare_broadcast(agent_name, distribution_list, message, message_type, recipient_type, protocol))
+
+        return http_response
+
+
+    def _prepare_broadcast(self, agent_name, distribution_list, message, message_type='broadcast', recipient_type='recipient', protocol='socontra'):
+        # Will return the broadcast message to send to the Socontra Network as (json_message, path, api_crud_type).
+
         if not self.validate_distribution_list(distribution_list):
             raise ValueError('distribution_list error.')
 
@@ -413,9 +438,7 @@ class Socontra:
         json_message = self.create_json_dict(agent_name=agent_name, distribution_list=distribution_list, message=message, 
                                              message_type=message_type, recipient_type=recipient_type, protocol=protocol)
 
-        http_response = send_auth_message(agent_name, json_message, '/agent_message/broadcast/', 'POST')
-
-        return http_response
+        return json_message, '/agent_message/broadcast/', 'POST'
 
 
     def new_request(self, agent_name: str, distribution_list: str | dict, protocol: str, task: str | dict = None, 
@@ -440,7 +463,7 @@ class Socontra:
                                              task=task, proposal_timeout=proposal_timeout, proposal=proposal, 
                                              invite_offer_timeout=invite_offer_timeout, offer=offer, offer_timeout=offer_timeout)
 
-        http_response =  send_auth_message(agent_name, json_message, '/agent_message/new_request/', 'POST')
+        http_response =  send_protocol_message(agent_name, json_message, '/agent_message/new_request/', 'POST')
 
         return http_response
 
@@ -450,14 +473,82 @@ class Socontra:
         # This is a general purpose message for service/request dialogues/transaction. Can be used to extend or create new service protocols
         # by using the message_type to create new protocol endpoints.
         # Agent agent_name will respond to a service/request message received message_responding_to with a message 'message'.
+
+        http_response =  send_protocol_message(agent_name, *self._prepare_request_message(agent_name, message, message_responding_to, recipient_type, message_type))
+
+        return http_response
+
+
+    def _prepare_request_message(self, agent_name, message, message_responding_to, recipient_type, message_type='request_message'):
+        # Will return the request message to send to the Socontra Network as (json_message, path, api_crud_type).
         
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              message_type=message_type, recipient_type=recipient_type)
 
-        http_response =  send_auth_message(agent_name, json_message, '/agent_message/reply_request/', 'POST')
+        return json_message, '/agent_message/reply_request/', 'POST'
 
-        return http_response
+
+    def send_many(self, agent_name: str, message_specs: list[dict]):
+        # Will send many messages at once, e.g. a new_message to each of 200 agents, rather than one blocking request after the other.
+        # Each message spec is a dict with 'send_type' ('new_message', 'broadcast' or 'request_message') and the arguments of that
+        # function (except agent_name), e.g. {'send_type': 'new_message', 'distribution_list': 'agent_1', 'message': 'Hello'}.
+        # Messages are sent concurrently over pooled connections, with at most config.bulk_send_max_concurrency at a time.
+        # Will return a list of futures, one per message spec in order. future.result() is the response (MessageHTTPResponse)
+        # for the message, as would be returned by the send_type function.
+        # All messages are validated before any are sent - a ValueError is raised if any message spec is not valid.
+
+        return send_many_prepared(agent_name, self._prepare_message_specs(agent_name, message_specs))
+
+
+    def send_batch(self, agent_name: str, message_specs: list[dict]):
+        # As for send_many(), but messages are sent to the Socontra Network's batch endpoint, in requests of at most
+        # config.bulk_send_max_batch messages, if the Socontra Network supports it. Otherwise they are sent as in send_many().
+        # Will wait until all messages are sent and return a list of responses (MessageHTTPResponse), one per message spec in order.
+
+        return send_batch_prepared(agent_name, self._prepare_message_specs(agent_name, message_specs))
+
+
+    def send_async(self, agent_name: str, send_function_name: str, *args, ordered: bool = True, ordering_key: str = None, **kwargs):
+        # Non-blocking send. Will queue the Socontra send function send_function_name (e.g. 'submit_offer', 'reject_invite_offer', 
+        # 'close_dialogue') with its arguments (except agent_name) in the agent's outbound queue, and return straight away.
+        # The message is sent by a background worker. Will return a future - future.result() is the response (MessageHTTPResponse)
+        # as would be returned by the send function.
+        # If ordered is True, sends for the same dialogue (the dialogue_id of the Message argument, or ordering_key if given) 
+        # are sent in the order they were queued. E.g.:
+        #   socontra.send_async(agent_name, 'reject_invite_offer', message_responding_to=received_message)
+        #   socontra.send_async(agent_name, 'close_dialogue', received_message)
+
+        send_function = getattr(self, send_function_name, None)
+        if send_function_name.startswith('_') or not callable(send_function):
+            raise ValueError('send_function_name is not a Socontra send function: ' + str(send_function_name))
+
+        if not ordered:
+            ordering_key = None
+        elif ordering_key is None:
+            message_argument = next((argument for argument in list(args) + list(kwargs.values()) if isinstance(argument, Message)), None)
+            ordering_key = message_argument.dialogue_id if message_argument is not None else None
+
+        return get_outbound_queue(agent_name).submit(send_function, agent_name, *args, ordering_key=ordering_key, **kwargs)
+
+
+    def _prepare_message_specs(self, agent_name, message_specs):
+        # Will return the messages to send to the Socontra Network for send_many() and send_batch().
+        prepare_functions = {
+            'new_message': self._prepare_new_message,
+            'broadcast': self._prepare_broadcast,
+            'request_message': self._prepare_request_message,
+        }
+
+        prepared_messages = []
+        for message_spec in message_specs:
+            message_arguments = dict(message_spec)
+            send_type = message_arguments.pop('send_type', None)
+            if send_type not in prepare_functions:
+                raise ValueError(f"Message spec send_type must be one of {list(prepare_functions)}. Got: {send_type}")
+            prepared_messages.append(prepare_functions[send_type](agent_name, **message_arguments))
+
+        return prepared_messages
 
 
     def submit_proposal(self, agent_name: str, proposal: str | dict, message_responding_to: Message, message: str | dict = None, 
@@ -468,10 +559,10 @@ class Socontra:
         # Endpoint message_type = 'proposal'
         
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              recipient_type=recipient_type, proposal=proposal)
 
-        http_response =  send_auth_message(agent_name, json_message, '/agent_message/submit_proposal/', 'POST')
+        http_response =  send_protocol_message(agent_name, json_message, '/agent_message/submit_proposal/', 'POST')
 
         return http_response
 
@@ -484,10 +575,10 @@ class Socontra:
         # Endpoint messate_type = 'invite_offer'
     
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              recipient_type=recipient_type, invite_offer_timeout=invite_offer_timeout)
 
-        http_response =  send_auth_message(agent_name, json_message, '/agent_message/invite_offer/', 'POST')
+        http_response =  send_protocol_message(agent_name, json_message, '/agent_message/invite_offer/', 'POST')
 
         return http_response
 
@@ -499,12 +590,12 @@ class Socontra:
         # and delivered by the supplier (agent).
     
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              recipient_type=recipient_type,
                                              offer=offer, offer_timeout=offer_timeout, payment_required=payment_required,
                                              human_authorization_required=human_authorization_required)
 
-        http_response = send_auth_message(agent_name, json_message, '/agent_message/submit_offer/', 'POST')
+        http_response = send_protocol_message(agent_name, json_message, '/agent_message/submit_offer/', 'POST')
 
         return http_response
 
@@ -515,10 +606,10 @@ class Socontra:
         # The invite offer will subsequently be removed from the Socontra Network database.
 
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              recipient_type=recipient_type)
 
-        http_response = send_auth_message(agent_name, json_message, '/agent_message/reject_invite_offer/', 'PUT')
+        http_response = send_protocol_message(agent_name, json_message, '/agent_message/reject_invite_offer/', 'PUT')
 
         return http_response
 
@@ -551,10 +642,10 @@ class Socontra:
         # ADDITIONALLY - the offer will not become an order until the payment is confirmed by the supplier with payment_confirmed message.
 
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              recipient_type=recipient_type, payment=payment, human_authorization=human_authorization)
         
-        http_response = send_auth_message(agent_name, json_message, '/agent_message/accept_offer/', 'POST')
+        http_response = send_protocol_message(agent_name, json_message, '/agent_message/accept_offer/', 'POST')
 
         return http_response
 
@@ -564,10 +655,10 @@ class Socontra:
         # consumer (buyer) and supplier (seller) of services (or products).
 
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              recipient_type=recipient_type)
         
-        http_response = send_auth_message(agent_name, json_message, '/agent_message/payment_confirmed/', 'PUT')
+        http_response = send_protocol_message(agent_name, json_message, '/agent_message/payment_confirmed/', 'PUT')
 
         return http_response
 
@@ -580,10 +671,10 @@ class Socontra:
         # Otherwise, will default to the current offer_timeout.
 
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              message_type='payment_error', recipient_type=recipient_type, offer_timeout=offer_timeout)
 
-        http_response =  send_auth_message(agent_name, json_message, '/agent_message/reply_request/', 'POST')
+        http_response =  send_protocol_message(agent_name, json_message, '/agent_message/reply_request/', 'POST')
 
         return http_response
 
@@ -592,10 +683,10 @@ class Socontra:
         # This function will 'formally' reject an offer. The offer will subsequently be removed from the Socontra Network database.
 
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              offer=None, message_type='reject_offer', recipient_type=recipient_type)
 
-        http_response = send_auth_message(agent_name, json_message, '/agent_message/reject_offer/', 'PUT')
+        http_response = send_control_message(agent_name, json_message, '/agent_message/reject_offer/', 'PUT')
 
         return http_response
     
@@ -604,10 +695,10 @@ class Socontra:
         # This function will 'formally' revoke an offer. The offer will subsequently be removed from the Socontra Network database.
 
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              offer=offer, message_type='revoke_offer', recipient_type=recipient_type)
 
-        http_response = send_auth_message(agent_name, json_message, '/agent_message/reject_offer/', 'PUT')
+        http_response = send_protocol_message(agent_name, json_message, '/agent_message/reject_offer/', 'PUT')
 
         return http_response
        
@@ -688,10 +779,10 @@ class Socontra:
         # however you will have to manage the logic at the agent client end.
 
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message=message, message_responding_to=responding_to(agent_name, message_responding_to),
                                              message_type=message_type, recipient_type=recipient_type)
         
-        http_response = send_auth_message(agent_name, json_message, '/agent_message/order_complete_or_cancel_status/', 'PUT')
+        http_response = send_protocol_message(agent_name, json_message, '/agent_message/order_complete_or_cancel_status/', 'PUT')
 
         return http_response
 
@@ -721,10 +812,10 @@ class Socontra:
         # If closed by other agents in the dialogue, no more messages can be received by this agent after the dialogue has been closed.
 
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message_responding_to=responding_to(agent_name, message_responding_to),
                                              close_dialogue_id=True)
 
-        return send_auth_message(agent_name, json_message, '/agent_message/close_protocol_control/', 'POST')
+        return send_control_message(agent_name, json_message, '/agent_message/close_protocol_control/', 'POST')
     
 
     def close_agent(self, agent_name: str, message_responding_to: Message):
@@ -732,10 +823,10 @@ class Socontra:
         # this agent after this agent has been closed.
 
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message_responding_to=responding_to(agent_name, message_responding_to),
                                              close_agent_name=message_responding_to.sender_name)
 
-        return send_auth_message(agent_name, json_message, '/agent_message/close_protocol_control/', 'POST')
+        return send_control_message(agent_name, json_message, '/agent_message/close_protocol_control/', 'POST')
 
 
     def close_message(self, agent_name: str, close_message_type: str | list[str], message_responding_to: Message):
@@ -747,10 +838,10 @@ class Socontra:
             close_message_type = [close_message_type]
 
         # Create a json message with the message variables to send to the Socontra Network.
-        json_message = self.create_json_dict(agent_name=agent_name, message_responding_to=message_responding_to.contents,
+        json_message = self.create_json_dict(agent_name=agent_name, message_responding_to=responding_to(agent_name, message_responding_to),
                                              close_message_type=close_message_type)
 
-        return send_auth_message(agent_name, json_message, '/agent_message/close_protocol_control/', 'POST')
+        return send_control_message(agent_name, json_message, '/agent_message/close_protocol_control/', 'POST')
 
 
     def close_all_dialogues(self, agent_name):
@@ -800,6 +891,9 @@ class Socontra:
         if 'message_responding_to' in message or 'message_sent' in message:
             message_responding_to = self.get_message_responding_to(message)
             self.delete_message_responding_to(message)
+            # With compact replies, message_responding_to may be a reference to a message this agent sent or received
+            # (socontra/message_cache.py). Rebuild the full message.
+            message_responding_to = expand_message_reference(agent_name, message_responding_to)
         else:
             message_responding_to = None
 
@@ -812,6 +906,9 @@ class Socontra:
         else:
             payment, human_authorization = None, None
         
+        # Keep the message, so replies to it that reference it can be rebuilt (compact replies only).
+        remember_message(agent_name, message)
+
         # Convert message and message_responding_to to objects to make it nicer for the developer to access the data.
         message_obj = return_message_object(message, message_type)
 
@@ -850,20 +947,42 @@ class Socontra:
             return
 
         try:
-            if not message_responding_to:
-                self.route_map[endpoint_tuple](agent_name, message_obj)
-            elif not payment:
-                message_responding_to_obj = return_message_object(message_responding_to)
-                self.route_map[endpoint_tuple](agent_name, message_obj, message_responding_to_obj)
-            else:
-                # Must be payment info for a supplier. Pass the variables.
-                message_responding_to_obj = return_message_object(message_responding_to)
-                self.route_map[endpoint_tuple](agent_name, message_obj, message_responding_to_obj, payment, human_authorization)
+            # The endpoint runs in the deadline context of the message (e.g. received_message.proposal_timeout for a new task
+            # request), so that outbound calls made by the endpoint time out, or are cancelled, when the deadline passes.
+            with deadline(message_deadline(message_obj)):
+                if not message_responding_to:
+                    self.route_map[endpoint_tuple](agent_name, message_obj)
+                elif not payment:
+                    message_responding_to_obj = return_message_object(message_responding_to)
+                    self.route_map[endpoint_tuple](agent_name, message_obj, message_responding_to_obj)
+                else:
+                    # Must be payment info for a supplier. Pass the variables.
+                    message_responding_to_obj = return_message_object(message_responding_to)
+                    self.route_map[endpoint_tuple](agent_name, message_obj, message_responding_to_obj, payment, human_authorization)
+        except DeadlineExpired:
+            print(f'Deadline expired for message {message_type} received by {agent_name} from {message_obj.sender_name}. Work was cancelled.')
         except:
             print('Message to be routed that caused the error:', agent_name, message_type, message_category, protocol, recipient_type)
             raise ValueError('Message endpoint could not be found.')
 
 
+    def route_expired_message(self, agent_name, message, message_type = None):
+        # Will route a message whose deadline passed before it was received to the agent's expired_message endpoint, if it
+        # has one, e.g. to log it or tell the sender. Otherwise the message is dropped. The endpoint is run in its own thread
+        # so it doesn't hold up the messages received after it.
+        if (agent_name, 'expired_message') in self.route_map:
+            endpoint_tuple = (agent_name, 'expired_message')
+        elif ('expired_message',) in self.route_map:
+            endpoint_tuple = ('expired_message',)
+        else:
+            return
+
+        for key in ['message_responding_to', 'message_sent', 'payment', 'human_authorization']:
+            message.pop(key, None)
+        message_obj = return_message_object(message, message_type)
+        threading.Thread(target=self.route_map[endpoint_tuple], args=(agent_name, message_obj)).start()
+
+
     def agent_return(self, agent_name, function_at_endpoint, **kwargs):
         # Will add the variables *kwargs to a dict and place it on a queue, for the agent to  retract it later.
         
@@ -944,9 +1063,18 @@ class Socontra:
 
     def connect_agent_to_socontra_network(self, agent_name, clear_backlog):
         # Start the API (Sever Sent Events) API to receive messages from the Socontra Network.
+
+        # If keeping the backlog, catch up with it in bulk first (socontra/backlog.py, if config.backlog_catch_up), rather 
+        # than having it replayed message by message on the stream.
+        if not clear_backlog:
+            catch_up_backlog(agent_name, self)
+
+        # Reconnections to the stream (e.g. after a dropped connection) catch up with the backlog in the same way.
+        before_reconnect = None if clear_backlog else (lambda: catch_up_backlog(agent_name, self))
+
         agent_connected = {}
         agent_connected['agent_connected'] = False
-        agent_api_service = threading.Thread(target=agent_receive_messages, args=(agent_name, clear_backlog, agent_connected))
+        agent_api_service = threading.Thread(target=agent_receive_messages, args=(agent_name, clear_backlog, agent_connected, before_reconnect))
         agent_api_service.start()
 
         # Wait until it has authenticated and connected to the network before continuing, so the main code does not start 
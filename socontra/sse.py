@@ -0,0 +1,105 @@
+# Server-Sent Events (SSE) reader for the stream of messages from the Socontra Network to an agent.
+# The reader thread for an agent's stream caps how fast a busy agent can receive messages. Rather than processing the
+# stream line by line (as sseclient does), this reader reads large chunks of the stream into a reusable buffer, finds
+# the end of each event (blank line) with bytes.find, and hands the event data as raw bytes to the JSON decoder (socontra/codec.py),
+# without decoding it to a string first.
+# Events are parsed as per the SSE specification: 'data:', 'event:', 'id:' and 'retry:' fields, comment lines starting
+# with ':', and lines ending with '\n', '\r\n' or '\r'.
+
+from socontra import codec
+
+
+class SSEEvent:
+    def __init__(self, data: bytes, event: str = 'message', id: str = None, retry: int = None):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+
+    def json(self):
+        # Will return the event data decoded from JSON.
+        return codec.decode(self.data)
+
+
+class SSEReader:
+    def __init__(self, response, chunk_size: int = 65536):
+        # response: streaming requests response (requests.get(..., stream=True)) for the event stream.
+        self.response = response
+        self.chunk_size = chunk_size
+        self.last_event_id = None
+
+    def chunks(self):
+        # Will yield chunks of the stream as they arrive, up to chunk_size bytes each.
+        raw = self.response.raw
+        if hasattr(raw, 'read1') and not raw.chunked:
+            # Read whatever has arrived rather than waiting for chunk_size bytes. decode_content so that a compressed stream 
+            # (Content-Encoding, see socontra/compression.py) is decompressed, as iter_content does.
+            while True:
+                chunk = raw.read1(self.chunk_size, decode_content=True)
+                if not chunk:
+                    return
+                yield chunk
+        else:
+            yield from self.response.iter_content(chunk_size=None)
+
+    def normalized_chunks(self):
+        # Will yield the chunks of the stream with '\r\n' and '\r' line endings replaced by '\n'. A '\r' at the end of a chunk is
+        # held back in case the matching '\n' is at the start of the next chunk.
+        held_back = b''
+        for chunk in self.chunks():
+            if held_back:
+                chunk = held_back + chunk
+                held_back = b''
+            if b'\r' in chunk:
+                if chunk.endswith(b'\r'):
+                    chunk, held_back = chunk[:-1], b'\r'
+                chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+            yield chunk
+        if held_back:
+            yield b'\n'
+
+    def events(self):
+        # Will yield each event (SSEEvent) in the stream.
+        buffer = bytearray()
+        for chunk in self.normalized_chunks():
+            buffer += chunk
+            start = 0
+            while True:
+                end = buffer.find(b'\n\n', start)
+                if end == -1:
+                    break
+                event = self.parse_event(bytes(memoryview(buffer)[start:end]))
+                start = end + 2
+                if event is not None:
+                    yield event
+            if start:
+                del buffer[:start]
+
+    def parse_event(self, block: bytes):
+        # Parse one event (lines between blank lines). Will return the event, or None if the block has no data.
+        if block.startswith(b'data:') and b'\n' not in block:
+            # Most events are a single data line.
+            data = block[6:] if block[5:6] == b' ' else block[5:]
+            return SSEEvent(data, id=self.last_event_id)
+
+        data_lines = []
+        event_type = 'message'
+        retry = None
+        for line in block.split(b'\n'):
+            if not line or line.startswith(b':'):
+                continue
+            field, _, value = line.partition(b':')
+            if value.startswith(b' '):
+                value = value[1:]
+            if field == b'data':
+                data_lines.append(value)
+            elif field == b'event':
+                event_type = value.decode()
+            elif field == b'id':
+                self.last_event_id = value.decode()
+            elif field == b'retry' and value.isdigit():
+                retry = int(value)
+
+        if not data_lines:
+            return None
+        return SSEEvent(b'\n'.join(data_lines), event_type, self.last_event_id, retry)
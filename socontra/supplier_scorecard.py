@@ -0,0 +1,220 @@
+# Supplier performance scorecard for consumer agents. Keeps a local record of how each supplier agent has performed in
+# previous transactions, so that consumers can rank proposals on more than price and skip chronically slow suppliers.
+# For each supplier, the scorecard tracks:
+#   - response latency (exponentially weighted moving average of response times, from socontra/latency_stats.py).
+#   - invite_offer acceptance: invite offers sent, and offers, reject_invite_offer and no response received.
+#   - payment_error rate: accept_offer sent, and payment_confirmed and payment_error received.
+#   - order_complete vs order_failed (and cancel_order) received.
+#   - confirm_success and confirm_fail feedback sent by the consumer.
+# The scorecard is updated incrementally by the consumer template endpoints and orchestrators, and is stored in the
+# agent's database folder (socontra/database) so it persists between runs. Event counts (and the number of response times)
+# decay with a half life of config.supplier_scorecard_half_life, so that a supplier is judged on its recent transactions.
+# With config.skip_slow_suppliers, proposals from chronically slow suppliers are skipped, except once every
+# config.supplier_probation_interval (probation), so that a supplier that has recovered can be selected again.
+# Scorecard features (lower is better, like proposal costs) can be used as feature columns by the proposal scorer
+# (see proposal_feature_extractors()).
+
+import json
+import os
+import threading
+import time
+
+import config
+
+
+# Events recorded for each supplier.
+scorecard_events = ['proposal', 'reject_task', 'invite_offer', 'offer', 'reject_invite_offer', 'invite_offer_no_response',
+                    'accept_offer', 'payment_confirmed', 'payment_error', 'order_complete', 'order_failed', 'cancel_order',
+                    'confirm_success', 'confirm_fail']
+
+# Scorecard features available to the proposal scorer.
+feature_names = ['supplier_latency', 'supplier_invite_offer_failure_rate', 'supplier_payment_error_rate',
+                 'supplier_order_failure_rate', 'supplier_confirm_fail_rate']
+
+# Events for messages received from suppliers, by message type.
+received_message_type_event = {
+    'proposal': 'proposal',
+    'reject_task': 'reject_task',
+    'offer': 'offer',
+    'reject_invite_offer': 'reject_invite_offer',
+    'payment_confirmed': 'payment_confirmed',
+    'payment_error': 'payment_error',
+    'order_complete': 'order_complete',
+    'order_failed': 'order_failed',
+    'cancel_order': 'cancel_order',
+}
+
+
+class SupplierScorecard:
+    def __init__(self, agent_name: str = None):
+        # agent_name: consumer agent that the scorecard is for. Used for the file the scorecard is stored in. None to not store.
+        self.agent_name = agent_name
+        # Supplier agent name -> {'events': {event: count}, 'latency': moving average response time, 'latency_samples': count,
+        #                         'updated_time': time counts were last decayed, 'probation_time': time of last probation}
+        self.suppliers = {}
+        self.lock = threading.Lock()
+        # Only one save at a time, so that concurrent saves (from endpoint threads and the orchestrator) don't interleave.
+        self.save_lock = threading.Lock()
+
+        self.load()
+
+    def record_event(self, supplier_name: str, event: str):
+        # Record an event for the supplier (one of scorecard_events).
+        with self.lock:
+            supplier = self._get_supplier(supplier_name)
+            self._decay(supplier)
+            supplier['events'][event] = supplier['events'].get(event, 0) + 1
+
+    def record_response_time(self, supplier_name: str, response_time: float):
+        # Update the supplier's moving average response time.
+        with self.lock:
+            supplier = self._get_supplier(supplier_name)
+            self._decay(supplier)
+            if supplier['latency_samples'] == 0:
+                supplier['latency'] = response_time
+            else:
+                supplier['latency'] += config.supplier_scorecard_latency_weight * (response_time - supplier['latency'])
+            supplier['latency_samples'] += 1
+
+    def record_message(self, received_message, response_time: float = None):
+        # Record a message received from a supplier, and its response time (if known).
+        event = received_message_type_event.get(received_message.message_type)
+        if event == 'offer' and received_message.protocol != 'transact':
+            # Offers in the 'allocate' protocol are responses to the request, like proposals, not to an invite offer.
+            event = 'proposal'
+        if event is not None:
+            self.record_event(received_message.sender_name, event)
+        if response_time is not None:
+            self.record_response_time(received_message.sender_name, response_time)
+
+    def count(self, supplier_name: str, event: str):
+        with self.lock:
+            supplier = self.suppliers.get(supplier_name)
+            if supplier is None:
+                return 0
+            self._decay(supplier)
+            return supplier['events'].get(event, 0)
+
+    def get_features(self, supplier_name: str):
+        # Will return the scorecard features for the supplier. Rates are smoothed so that suppliers with few transactions
+        # are not penalized by a single failure. Unknown suppliers have all features zero.
+        with self.lock:
+            supplier = self.suppliers.get(supplier_name)
+            if supplier is None:
+                return {feature_name: 0.0 for feature_name in feature_names}
+            self._decay(supplier)
+            events = supplier['events']
+            get = lambda event: events.get(event, 0)
+
+            return {
+                'supplier_latency': supplier['latency'],
+                'supplier_invite_offer_failure_rate': (get('reject_invite_offer') + get('invite_offer_no_response')) / (get('invite_offer') + 1),
+                'supplier_payment_error_rate': get('payment_error') / (get('accept_offer') + 1),
+                'supplier_order_failure_rate': (get('order_failed') + get('cancel_order')) / (get('order_complete') + get('order_failed') + get('cancel_order') + 1),
+                'supplier_confirm_fail_rate': get('confirm_fail') / (get('confirm_success') + get('confirm_fail') + 1),
+            }
+
+    def is_chronically_slow(self, supplier_name: str):
+        # True if the supplier usually does not respond to invite offers in time, or its moving average response time is
+        # above config.supplier_skip_latency. Needs config.supplier_scorecard_min_samples recent observations first.
+        with self.lock:
+            supplier = self.suppliers.get(supplier_name)
+            if supplier is None:
+                return False
+            self._decay(supplier)
+            invite_offers = supplier['events'].get('invite_offer', 0)
+            if invite_offers >= config.supplier_scorecard_min_samples and \
+                supplier['events'].get('invite_offer_no_response', 0) / invite_offers >= config.supplier_skip_no_response_rate:
+                return True
+            if config.supplier_skip_latency is not None and supplier['latency_samples'] >= config.supplier_scorecard_min_samples and \
+                supplier['latency'] > config.supplier_skip_latency:
+                return True
+        return False
+
+    def should_skip(self, supplier_name: str):
+        # True if a proposal from the supplier should be skipped because it is chronically slow. A chronically slow supplier
+        # is not skipped once every config.supplier_probation_interval seconds (probation), so that it gets invite offers
+        # and can show that it has recovered.
+        if not self.is_chronically_slow(supplier_name):
+            return False
+        with self.lock:
+            supplier = self._get_supplier(supplier_name)
+            if time.time() - supplier.get('probation_time', 0) >= config.supplier_probation_interval:
+                supplier['probation_time'] = time.time()
+                return False
+        return True
+
+    def save(self):
+        # Store the scorecard in the agent's database folder.
+        if not self.agent_name:
+            return
+        # Write to a temporary file and replace the stored file, so that a save that fails part way leaves the previous
+        # file intact rather than a file load() can't read. The data is copied under save_lock so that an older copy
+        # can't replace a newer one.
+        temporary_filename = self._filename() + '.tmp'
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps(self.suppliers)
+            try:
+                with open(temporary_filename, 'w') as data_to_store:
+                    data_to_store.write(data)
+                os.replace(temporary_filename, self._filename())
+            except OSError:
+                print('Unable to save supplier scorecard to file', self._filename())
+
+    def load(self):
+        # Load the scorecard stored in the agent's database folder.
+        if not self.agent_name or not os.path.isfile(self._filename()):
+            return
+        try:
+            with open(self._filename()) as f:
+                data = json.loads(f.read())
+        except (OSError, ValueError):
+            return
+        with self.lock:
+            self.suppliers = data
+
+    def _get_supplier(self, supplier_name):
+        if supplier_name not in self.suppliers:
+            self.suppliers[supplier_name] = {'events': {}, 'latency': 0.0, 'latency_samples': 0, 'updated_time': time.time()}
+        return self.suppliers[supplier_name]
+
+    def _decay(self, supplier):
+        # Decay the supplier's event counts and number of response times by the time since they were last decayed.
+        now = time.time()
+        elapsed = now - supplier.get('updated_time', now)
+        supplier['updated_time'] = now
+        if not config.supplier_scorecard_half_life or elapsed <= 0:
+            return
+        factor = 0.5 ** (elapsed / config.supplier_scorecard_half_life)
+        supplier['events'] = {event: count * factor for event, count in supplier['events'].items()}
+        supplier['latency_samples'] *= factor
+
+    def _filename(self):
+        agent_name_filesafe = "".join(i if i not in "\/:*?<>|" else "_" for i in self.agent_name)
+        return f'socontra/database/{agent_name_filesafe}-supplier_scorecard.txt'
+
+
+# Scorecards for each consumer agent in this process.
+global scorecards_by_agent_name
+scorecards_by_agent_name = {}
+scorecards_lock = threading.Lock()
+
+
+def get_supplier_scorecard(agent_name: str):
+    # Will return the supplier scorecard for the consumer agent, loading it from the agent's database folder the first time.
+    global scorecards_by_agent_name
+    with scorecards_lock:
+        if agent_name not in scorecards_by_agent_name:
+            scorecards_by_agent_name[agent_name] = SupplierScorecard(agent_name)
+        return scorecards_by_agent_name[agent_name]
+
+
+def proposal_feature_extractors():
+    # Will return the scorecard features as proposal feature extractors for the proposal scorer: feature name -> function
+    # of the proposal message. The consumer is the receiver of the proposal, and the supplier is the sender.
+    def feature_extractor(feature_name):
+        def extract(proposal):
+            return get_supplier_scorecard(proposal.receiver_name).get_features(proposal.sender_name)[feature_name]
+        return extract
+    return {feature_name: feature_extractor(feature_name) for feature_name in feature_names}
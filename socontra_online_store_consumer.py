@@ -10,6 +10,7 @@
 
 
 from socontra.socontra import Socontra
+from socontra import latency_stats
 from protocol_templates import  socontra_main_protocol
 from protocol_templates.online_stores import  socontra_transact_store_protocol_consumer
 import config
@@ -113,6 +114,12 @@ if __name__ == '__main__':
     # Timeout in seconds for receiving binding offers from suppliers. 
     invite_offer_timeout = 20
 
+    # Once suppliers have responded to a few requests, shorten the timeouts to the observed supplier response times 
+    # (95th percentile plus a margin - see config.py), keeping the timeouts above as the maximum. 
+    agent_latency_stats = latency_stats.get_latency_stats(consumer_agent)
+    proposal_timeout = agent_latency_stats.suggest_timeout('new_request', distribution_list, default=proposal_timeout)
+    invite_offer_timeout = agent_latency_stats.suggest_timeout('invite_offer', distribution_list, default=invite_offer_timeout)
+
     # For the Socontra transact protocol, we use a central orchestrator, contained in the protocol template file
     # protocol_templates/online_stores/socontra_transact_store_protocol_consumer.py.
     socontra.transact_orchestrator_consumer(consumer_agent, task, distribution_list, proposal_timeout, invite_offer_timeout)
@@ -0,0 +1,89 @@
+# Socontra Shopify Multi-Store Web Agent Host
+# Hosts many Shopify online stores as Socontra Web Agents in a single process, using a single Socontra Client.
+# One agent is registered and connected for each shop. Messages received by an agent are handled by the Shopify
+# template endpoints using that agent's shop context (store url, API credentials, connection pool and rate limit budget).
+
+# Refer files:
+# - config_shopify.py (shopify_stores - the table of shops)
+# - protocol_templates/online_stores/shopify_shops.py
+# - protocol_templates/online_stores/socontra_transact_shopify_protocol_supplier.py
+# - socontra_shopify_web_agent.py (the single shop Web Agent)
+
+# The table of shops is read from shopify_stores in config_shopify.py, or from a json file with the same format:
+#   python socontra_shopify_multi_store_host.py
+#   python socontra_shopify_multi_store_host.py --shops shops.json
+
+import argparse
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+
+from socontra.socontra import Socontra
+from protocol_templates import  socontra_main_protocol
+from protocol_templates.online_stores import  socontra_transact_shopify_protocol_supplier
+from protocol_templates.online_stores import shopify_shops
+import config, config_shopify
+
+socontra = Socontra()
+socontra.add_protocol(socontra_main_protocol)
+socontra.add_protocol(socontra_transact_shopify_protocol_supplier)
+
+
+def load_shop_table(filename: str = None):
+    # Will return the table of shops from a json file, or from config_shopify.py if no file.
+    if filename:
+        with open(filename) as f:
+            return json.loads(f.read())
+    return config_shopify.shopify_stores
+
+
+def connect_shop_agent(shop_config: dict, client_public_id: str, client_security_token: str, human_password: str):
+    # Create the shop context, register it against the shop's agent, and connect the agent to the Socontra Network.
+    shop = shopify_shops.create_shop(shop_config)
+    shopify_agent = client_public_id + ':' + 'shopify_' + shop.myshop_name
+
+    # Register the shop before connecting, so that messages received as soon as the agent connects use the right shop.
+    shopify_shops.register_shop(shopify_agent, shop)
+
+    socontra.connect_socontra_agent(agent_data={
+            'agent_name': shopify_agent,
+            'client_security_token': client_security_token,
+            'human_password': human_password,
+        }, clear_backlog = True)
+
+    # Join the public groups relating to the shop's business categories, and add the geographical regions that the shop services.
+    for single_business_category_and_regions in shop.business_categories_and_regions:
+        socontra.join_group(shopify_agent, single_business_category_and_regions['group'])
+        socontra.add_region_group(shopify_agent, single_business_category_and_regions['group'], single_business_category_and_regions['regions'])
+
+    return shopify_agent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Host many Shopify shops as Socontra Web Agents in one process.')
+    parser.add_argument('--shops', default=None, help='Json file with the table of shops. Default is shopify_stores in config_shopify.py.')
+    parser.add_argument('--connect-concurrency', type=int, default=8, help='Number of shop agents to connect to the Socontra Network at once.')
+    args = parser.parse_args()
+
+    # Enter your agent credentials in the config.py file.
+    client_public_id = config.client_public_id
+    client_security_token = config.client_security_token
+
+    shop_table = load_shop_table(args.shops)
+    if not shop_table:
+        raise ValueError('No shops to host. Add shops to shopify_stores in config_shopify.py, or provide a json file with --shops.')
+
+    # Connect the shop agents. Connecting an agent waits for the agent to be authenticated and connected, so connect
+    # several agents at once to start up hundreds of shops quickly.
+    with ThreadPoolExecutor(max_workers=args.connect_concurrency) as executor:
+        futures = [executor.submit(connect_shop_agent, shop_config, client_public_id, client_security_token, 'human_password_for_agent_here')
+                   for shop_config in shop_table]
+        for shop_config, future in zip(shop_table, futures):
+            try:
+                print('Shop agent connected:', future.result())
+            except Exception as error:
+                print(f"Could not connect the agent for shop {shop_config['myshop_name']}. Error: {error}")
+
+    # Wait for agent task/product requests to be received - via transaction endpoints in file
+    # protocol_templates/online_stores/socontra_transact_shopify_protocol_supplier.py, which will use the shop context
+    # of the agent that received the request.